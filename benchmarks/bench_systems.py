@@ -0,0 +1,220 @@
+"""システムとスクリーンのスケーリングベンチマーク
+
+main.py の setup_game で構築したワールドに敵とコインを追加し、登録されている
+全システム (と --screens 指定時は全スクリーン) の処理時間をフレームあたり・エンティティあたりで計測する。
+
+Usage (リポジトリのルートから実行):
+    python benchmarks/bench_systems.py
+    python benchmarks/bench_systems.py --counts 1 100 --frames 30 --output bench_results.json
+    python benchmarks/bench_systems.py --activity-radius 256  # プレイヤーから遠い敵をスリープさせて計測
+    python benchmarks/bench_systems.py --baseline benchmarks/baseline.json  # 比較して退行があれば終了コード 1
+    python benchmarks/bench_systems.py --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import functools
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+import pyxel  # noqa: E402
+from main import (  # noqa: E402
+    SCREEN_SIZE,
+    Game,
+    image_filepath,
+    setup_game,
+    tilemap_filepath,
+)
+from spawn import spawn_coin, spawn_enemy  # noqa: E402
+from level import copy_layers_to_tilemaps, load_level  # noqa: E402
+
+DEFAULT_COUNTS = [1, 100, 1000, 10000]
+LEVEL_WIDTH = 8 * 120
+GROUND_Y = 8 * 10
+
+
+def build_world(count: int, vectorized_motion: bool = False, activity_radius: int = None) -> Game:
+    """main.py と同じ構成のワールドに敵とコインを count 体ずつ追加する
+    activity_radius を指定しない場合は敵をスリープさせず、全てのエンティティを毎フレーム処理する
+    """
+    game = Game(headless=True)
+    setup_game(game, vectorized_motion=vectorized_motion, activity_radius=activity_radius)
+    for i in range(count):
+        x = (i * 37) % LEVEL_WIDTH
+        spawn_enemy(game, 0, x, GROUND_Y)
+        spawn_coin(game, (i * 53) % LEVEL_WIDTH, 8 * (2 + (i % 8)))
+    return game
+
+
+@functools.cache
+def get_offscreen() -> pyxel.Image:
+    """描画命令の flush 先にする、画面と同じ大きさのオフスクリーン画像"""
+    return pyxel.Image(*SCREEN_SIZE)
+
+
+def step(game: Game, kind: str):
+    """system では Game.process で1フレーム進め、screen では Game.render でオフスクリーン画像に描画する
+    処理時間は Game のプロファイラが有効な間、システムとスクリーンごとに記録される。
+    """
+    if kind == "system":
+        game.process()
+        return
+    # Game.render はプロファイラのフレームを始めないため、描画だけを繰り返すときはここで区切る
+    if game.profiler is not None:
+        game.profiler.begin_frame(len(game.entities))
+    game.render(get_offscreen())
+
+
+def run_benchmark(
+    counts: list[int],
+    frames: int,
+    warmup: int,
+    screens: bool,
+    vectorized_motion: bool = False,
+    activity_radius: int = None,
+) -> dict:
+    results = []
+    gc_results = []
+    for count in counts:
+        game = build_world(count, vectorized_motion, activity_radius)
+        # 最初のフレームまではスリープ中のエンティティはないため、これがスポーンした全エンティティの数になる
+        entities = len(game.entities)
+        for kind in ("system", "screen"):
+            if kind == "screen" and not screens:
+                continue
+            game.disable_profiler()
+            for _ in range(warmup):
+                step(game, kind)
+            profiler = game.enable_profiler(frames)
+            collections = sum(stat["collections"] for stat in gc.get_stats())
+            for _ in range(frames):
+                step(game, kind)
+            collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+            # スリープ中のエンティティは game.entities から外れるため、計測中のフレームで数えて平均する
+            active_entities = sum(profiler.entity_counts) / frames
+            timings = profiler.average_ms(frames)
+            gc_results.append(
+                {"kind": kind, "count": count, "collections_per_frame": collections / frames}
+            )
+            for name, frame_ms in timings.items():
+                results.append(
+                    {
+                        "kind": kind,
+                        "name": name,
+                        "count": count,
+                        "entities": entities,
+                        "active_entities": active_entities,
+                        "frame_ms": frame_ms,
+                        "entity_us": frame_ms * 1000 / active_entities,
+                    }
+                )
+            total_ms = sum(timings.values())
+            print(
+                f"{kind:6s} count={count:<6d} entities={entities:<6d} "
+                f"active={active_entities:<8.1f} total={total_ms:9.3f} ms/frame"
+            )
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "frames": frames,
+            "warmup": warmup,
+            "vectorized_motion": vectorized_motion,
+            "activity_radius": activity_radius,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "gc": gc_results,
+    }
+
+
+def compare_with_baseline(
+    report: dict, baseline: dict, threshold: float, min_delta_ms: float
+) -> list[str]:
+    """ベースラインより threshold 以上、かつ min_delta_ms 以上遅くなった計測値を返す"""
+    base = {(r["kind"], r["name"], r["count"]): r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        b = base.get((r["kind"], r["name"], r["count"]))
+        if b is None or b["frame_ms"] <= 0:
+            continue
+        ratio = r["frame_ms"] / b["frame_ms"]
+        r["baseline_ratio"] = ratio
+        if ratio > 1 + threshold and r["frame_ms"] - b["frame_ms"] > min_delta_ms:
+            regressions.append(
+                f"{r['kind']} {r['name']} count={r['count']}: "
+                f"{b['frame_ms']:.3f} -> {r['frame_ms']:.3f} ms/frame (x{ratio:.2f})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--counts", type=int, nargs="+", default=DEFAULT_COUNTS)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument(
+        "--screens", action="store_true", help="also time screens (rendered offscreen)"
+    )
+    parser.add_argument(
+        "--vectorized-motion", action="store_true", help="use the numpy motion systems"
+    )
+    parser.add_argument(
+        "--activity-radius",
+        type=int,
+        default=None,
+        help="put enemies farther than this from the player to sleep (default: off)",
+    )
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="baseline json to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown ratio")
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this"
+    )
+    parser.add_argument("--save-baseline", default=None, help="also write the results here")
+    args = parser.parse_args()
+
+    if args.screens:
+        # 描画命令はオフスクリーンの画像に flush するため、ウィンドウは作らない
+        pyxel.images[0] = pyxel.Image.from_image(image_filepath, incl_colors=True)
+        copy_layers_to_tilemaps(load_level(tilemap_filepath), pyxel.tilemaps)
+
+    report = run_benchmark(
+        args.counts,
+        args.frames,
+        args.warmup,
+        args.screens,
+        args.vectorized_motion,
+        args.activity_radius,
+    )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_with_baseline(
+                report, json.load(f), args.threshold, args.min_delta_ms
+            )
+        report["regressions"] = regressions
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for line in regressions:
+        print("REGRESSION", line)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""ステージのリセットを繰り返すソークベンチマーク
+
+main.py の setup_game で構築したワールドで、リスタート (SysRestartStage) と落下による死亡
+(SysPlayerDieFromFall) によるステージのリセットを交互に繰り返し、エンティティ数とメモリ使用量が
+増え続けないことを確認する。増え続けた場合は終了コード 1 で終了する。
+
+Usage (リポジトリのルートから実行):
+    python benchmarks/soak_resets.py
+    python benchmarks/soak_resets.py --resets 5000 --frames-per-reset 10 --output soak_results.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+import pyxel  # noqa: E402
+from component import Player, Position2D  # noqa: E402
+from input import ScriptedInputSource  # noqa: E402
+from main import Game, setup_game  # noqa: E402
+
+
+def run_soak(
+    resets: int,
+    frames_per_reset: int,
+    warmup: int,
+    samples: int,
+    vectorized_motion: bool,
+    activity_radius: int = None,
+) -> dict:
+    # リスタートのキーを押すフレーム (記録がメモリの計測に入らないよう、直近の1つだけを持つ)
+    restart_frame = [-1]
+    input_source = ScriptedInputSource(
+        lambda frame: {pyxel.KEY_RETURN: 1} if frame == restart_frame[0] else {}
+    )
+    game = Game(headless=True, input_source=input_source)
+    setup_game(game, vectorized_motion=vectorized_motion, activity_radius=activity_radius)
+    player_entity, (_, player_position) = game.get_singleton(Player, Position2D)
+
+    def reset(i: int):
+        # リスタートと落下による死亡を交互に起こし、その後 frames_per_reset フレーム進める
+        if i % 2 == 0:
+            restart_frame[0] = game.frame_count
+        else:
+            player_position.y = 8 * 16
+        game.run_headless(frames_per_reset)
+
+    samples_at = {round(resets * (i + 1) / samples) for i in range(samples)}
+    history = []
+    start = time.perf_counter()
+    for i in range(warmup):
+        reset(i)
+    tracemalloc.start()
+    base_memory = tracemalloc.get_traced_memory()[0]
+    for i in range(1, resets + 1):
+        reset(i)
+        if i in samples_at:
+            history.append(
+                {
+                    "reset": i,
+                    "entities": len(game.entities),
+                    "inactive_entities": len(game.inactive_entities),
+                    "memory_kb": (tracemalloc.get_traced_memory()[0] - base_memory) / 1024,
+                }
+            )
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "meta": {
+            "resets": resets,
+            "frames_per_reset": frames_per_reset,
+            "warmup": warmup,
+            "vectorized_motion": vectorized_motion,
+            "activity_radius": activity_radius,
+            "elapsed_s": elapsed,
+        },
+        "history": history,
+    }
+
+
+def check_bounded(report: dict, max_growth_kb: float) -> list[str]:
+    """エンティティ数が増えていないか、メモリが max_growth_kb 以上増えていないかを確認する"""
+    history = report["history"]
+    first, last = history[0], history[-1]
+    failures = []
+    if (
+        last["entities"] + last["inactive_entities"]
+        > first["entities"] + first["inactive_entities"]
+    ):
+        failures.append(
+            f"entities grew: {first['entities']} -> {last['entities']} "
+            f"(inactive {first['inactive_entities']} -> {last['inactive_entities']})"
+        )
+    growth = last["memory_kb"] - first["memory_kb"]
+    if growth > max_growth_kb:
+        failures.append(f"memory grew by {growth:.1f} KB (limit {max_growth_kb:.1f} KB)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--resets", type=int, default=2000)
+    parser.add_argument("--frames-per-reset", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=10, help="memory samples to record")
+    parser.add_argument("--max-growth-kb", type=float, default=64.0)
+    parser.add_argument(
+        "--vectorized-motion", action="store_true", help="use the numpy motion systems"
+    )
+    parser.add_argument(
+        "--activity-radius",
+        type=int,
+        default=None,
+        help="put enemies farther than this from the player to sleep (default: off)",
+    )
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    args = parser.parse_args()
+
+    report = run_soak(
+        args.resets,
+        args.frames_per_reset,
+        args.warmup,
+        args.samples,
+        args.vectorized_motion,
+        args.activity_radius,
+    )
+    for sample in report["history"]:
+        print(
+            f"reset={sample['reset']:<6d} entities={sample['entities']:<4d} "
+            f"inactive={sample['inactive_entities']:<4d} memory={sample['memory_kb']:9.1f} KB"
+        )
+
+    failures = check_bounded(report, args.max_growth_kb)
+    report["failures"] = failures
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for line in failures:
+        print("UNBOUNDED", line)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from dataclasses import dataclass, field
+from array import array
+
+# クリップの最後のフレームの後の扱い
+LOOP = "loop"  # 最初のフレームに戻る
+ONCE = "once"  # 最後のフレームで止まる
+PING_PONG = "ping_pong"  # 逆順に戻ってから繰り返す
+
+
+@dataclass(frozen=True)
+class AnimationClip:
+    """アニメーションのクリップを表すオブジェクト
+    frames: スプライトのタイルセット上の座標 (sprite_x, sprite_y) を再生順に並べたもの
+    frame_duration: 1フレームを表示するステップ数
+    loop: 最後のフレームの後の扱い (LOOP, ONCE, PING_PONG)
+    """
+
+    frames: tuple
+    frame_duration: int = 7
+    loop: str = LOOP
+
+
+# ゲームで使うクリップ
+ANIMATION_CLIPS = {
+    "player_idle": AnimationClip(((0, 8 * 11),)),
+    "player_run": AnimationClip(((0, 8 * 13), (16, 8 * 13))),
+    "player_jump": AnimationClip(((16, 8 * 11),)),
+    "player_crouch": AnimationClip(((48, 8 * 11),)),
+    "enemy_walk": AnimationClip(((32, 8 * 7), (48, 8 * 7), (64, 8 * 7)), loop=PING_PONG),
+}
+
+# プレイヤーの状態 (Animation の属性) -> クリップ. 上にあるものほど優先し、どれでもなければ待機
+PLAYER_STATE_CLIPS = (
+    ("is_crouching", "player_crouch"),
+    ("is_jumping", "player_jump"),
+    ("is_running", "player_run"),
+)
+PLAYER_IDLE_CLIP = "player_idle"
+
+# 敵の種別ID -> 歩いているときのクリップ
+ENEMY_SPECIES_CLIPS = {
+    0: "enemy_walk",
+}
+
+
+@dataclass
+class AnimationTable:
+    """全てのクリップをまとめた参照用の配列と、全エンティティで共有するアニメーションの時計を持つオブジェクト
+    各エンティティは再生中のクリップ名と再生を始めた時計の値だけを持ち、表示するフレームは経過ステップ数から引く。
+    そのためアニメーションを進める処理は時計を1つ進めるだけで、エンティティの数によらない。
+    clips: クリップ名 -> AnimationClip
+    """
+
+    clips: dict = field(default_factory=lambda: dict(ANIMATION_CLIPS))
+    clock: int = 0
+
+    def __post_init__(self):
+        self.compile()
+
+    def compile(self):
+        """クリップを連続した配列に展開する (PING_PONG は折り返しのフレームも並べて LOOP として扱う)"""
+        self.sprite_x = array("H")
+        self.sprite_y = array("H")
+        # クリップ名 -> (配列の先頭, フレーム数, 1フレームのステップ数, ループするか)
+        self.index = {}
+        for name, clip in self.clips.items():
+            frames = list(clip.frames)
+            if clip.loop == PING_PONG:
+                frames += frames[-2:0:-1]
+            self.index[name] = (
+                len(self.sprite_x),
+                len(frames),
+                clip.frame_duration,
+                clip.loop != ONCE,
+            )
+            for sprite_x, sprite_y in frames:
+                self.sprite_x.append(sprite_x)
+                self.sprite_y.append(sprite_y)
+
+    def sample(self, clip: str, elapsed: int) -> tuple[int, int]:
+        """クリップの再生開始から elapsed ステップ後のスプライトの座標を返す"""
+        offset, count, duration, loop = self.index[clip]
+        frame = elapsed // duration
+        frame = frame % count if loop else min(frame, count - 1)
+        return self.sprite_x[offset + frame], self.sprite_y[offset + frame]
+
+
+def play_clip(table: AnimationTable, animation, clip: str):
+    """アニメーションのクリップを切り替える (再生中のクリップと同じなら続きから再生する)
+
+    Args:
+        table (AnimationTable): アニメーションの参照用の配列と時計
+        animation (Animation | EnemyAnimation): アニメーションのコンポーネント
+        clip (str): クリップ名
+    """
+    if animation.clip != clip:
+        animation.clip = clip
+        animation.start = table.clock
+
+
+def sample_animation(world, animation) -> tuple[int, int]:
+    """アニメーションのコンポーネントが現在表示するスプライトの座標を返す
+
+    Args:
+        world (World): ゲームのワールド
+        animation (Animation | EnemyAnimation): アニメーションのコンポーネント
+
+    Returns:
+        tuple[int, int]: タイルセット上の座標 (sprite_x, sprite_y)
+    """
+    table_entity, table = world.get_singleton(AnimationTable)
+    return table.sample(animation.clip, table.clock - animation.start)
+
+
+def get_animation_clock(world) -> int:
+    """アニメーションの時計の現在の値を返す (AnimationTable が無いワールドでは 0)"""
+    tables = world.get_component(AnimationTable)
+    return tables[0][1].clock if tables else 0
@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+
+class StartupReport:
+    """起動時の処理 (モジュールの import やアセットの読み込み) ごとにかかった時間を記録するレポート
+    start: 計測の起点 (time.perf_counter の値). 省略時は作成した時点
+    output: 最初のフレームの開始時にレポートを書き出す先 (None の場合は書き出さない)
+    """
+
+    def __init__(self, start: float = None, output=None) -> None:
+        self.start = time.perf_counter() if start is None else start
+        self.output = output
+        # (種類, 名前, ミリ秒, スレッド名)
+        self.entries = []
+        self.first_frame_ms = None
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, name: str, seconds: float):
+        with self._lock:
+            self.entries.append((kind, name, seconds * 1000, threading.current_thread().name))
+
+    @contextmanager
+    def measure(self, kind: str, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(kind, name, time.perf_counter() - start)
+
+    def mark_first_frame(self):
+        """最初のフレームまでの時間を記録し、output が設定されていればレポートを書き出す"""
+        self.first_frame_ms = (time.perf_counter() - self.start) * 1000
+        if self.output is not None:
+            print(self.format(), file=self.output)
+
+    def format(self) -> str:
+        lines = ["startup report:"]
+        for kind, name, ms, thread in self.entries:
+            lines.append(f"  {kind:6s} {name:24s} {ms:8.2f} ms  [{thread}]")
+        if self.first_frame_ms is not None:
+            lines.append(f"  time to first frame: {self.first_frame_ms:.2f} ms")
+        return "\n".join(lines)
+
+
+class AssetLoader:
+    """アセットを初めて使われたときに読み込むローダー
+    pyxel のオブジェクトは作成したスレッドからしか使えないため、スレッドプールで先読みできるのは
+    threadsafe=True で登録したもの (ファイルの読み込みや解析だけを行うもの) に限る。
+    スレッドを起動できない環境 (Pyodide で動く Web 版など) では先読みをせず、get で使われたときに読み込む。
+    report: 読み込みにかかった時間を記録する StartupReport
+    max_workers: 先読みに使うスレッドの数
+    """
+
+    def __init__(self, report: StartupReport = None, max_workers: int = 2) -> None:
+        self.report = report if report is not None else StartupReport()
+        self.max_workers = max_workers
+        self.executor = None
+        # Pyodide (emscripten) ではスレッドを起動できない
+        self.threads_available = sys.platform != "emscripten"
+        # 名前 -> (読み込む関数, 別スレッドで読み込めるか)
+        self.loaders = {}
+        self.futures = {}
+        self.values = {}
+
+    def register(self, name: str, loader, threadsafe: bool = False):
+        self.loaders[name] = (loader, threadsafe)
+
+    def prefetch(self, *names: str):
+        """threadsafe なアセットの読み込みをスレッドプールで始めておく"""
+        for name in names:
+            loader, threadsafe = self.loaders[name]
+            if not threadsafe or name in self.values or name in self.futures:
+                continue
+            if not self.threads_available:
+                return
+            try:
+                if self.executor is None:
+                    # concurrent.futures は logging なども読み込むため、先読みするときだけ import する
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="asset")
+                self.futures[name] = self.executor.submit(self._load, name)
+            except RuntimeError:
+                # スレッドを起動できない場合は先読みをやめ、get で同期的に読み込む
+                self.threads_available = False
+                self.shutdown()
+                return
+
+    def get(self, name: str):
+        """アセットを返す. まだ読み込まれていなければ、読み込みが終わるまで待つ"""
+        if name in self.values:
+            return self.values[name]
+        future = self.futures.pop(name, None)
+        if future is not None:
+            value = future.result()
+        else:
+            value = self._load(name)
+        self.values[name] = value
+        return value
+
+    def _load(self, name: str):
+        loader, threadsafe = self.loaders[name]
+        with self.report.measure("asset", name):
+            return loader()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -1,5 +1,6 @@
 from pigframe import *
 from dataclasses import dataclass, field
+from array import array
 import math
 
 
@@ -17,6 +18,104 @@ class TileCollidable:
     surface_height: int = None
 
 
+@dataclass
+class SweepHit:
+    """sweep_tile_grid の結果 (毎フレーム作らないよう、グリッドごとに1つを使い回す)
+    t: 移動量に対する、接触するまでに進める割合 (0 から 1. 接触しない場合は 1)
+    normal_x: 接触面の法線のX成分 (-1: 左向き, 1: 右向き. 接触しない場合は 0)
+    normal_y: 接触面の法線のY成分 (-1: 上向き, 1: 下向き. 接触しない場合は 0)
+    x: 接触した時点 (接触しない場合は移動後) の長方形の左端
+    y: 接触した時点 (接触しない場合は移動後) の長方形の上端
+    """
+
+    t: float = 1.0
+    normal_x: int = 0
+    normal_y: int = 0
+    x: float = 0
+    y: float = 0
+
+
+@dataclass
+class TileCollisionGrid:
+    """衝突判定用に全てのタイルレイヤーを統合したグリッド
+    グリッドはステージの読み込み時に作り、衝突可能なレイヤーの構成が変わったときと、
+    タイルの内容が書き換えられたとき (mark_tiles_changed でワールドの tile_revision が増えたとき) に作り直す。
+    cells: タイルごとのビットマスク (ビット h は表面の高さ h の衝突タイルがあることを表す。0 は衝突なし)
+    layers: グリッドの元になった (タイルマップID, 表面の高さ) の組
+    revision: グリッドを作ったときのワールドの tile_revision
+    hit: 最後の sweep_tile_grid の結果
+    """
+
+    width: int = 0
+    height: int = 0
+    cells: array = field(default_factory=lambda: array("H"))
+    layers: tuple = ()
+    revision: int = 0
+    hit: SweepHit = field(default_factory=SweepHit)
+
+
+@dataclass
+class SpatialHashGrid:
+    """エンティティ同士の衝突判定の候補を絞り込むための空間ハッシュ
+    cells: セル座標 (cx, cy) -> セルに重なっているエンティティの集合
+    entity_cells: エンティティ -> 登録済みのセル範囲 (cx1, cy1, cx2, cy2)
+    """
+
+    cell_size: int = 16
+    cells: dict = field(default_factory=dict)
+    entity_cells: dict = field(default_factory=dict)
+
+
+@dataclass
+class CollectibleIndex(SpatialHashGrid):
+    """まだ取得されていない収集アイテムをタイルのセルごとに登録した索引
+    収集アイテムは動かないため、スポーン時に1度だけ登録し、取得されたら取り除く。
+    """
+
+    cell_size: int = 8
+
+
+@dataclass
+class LevelChunks:
+    """レベルを固定幅のチャンクに分割し、プレイヤーの周囲のチャンクの敵とコインだけをワールドに置くための状態
+    chunk_width: チャンクの幅 (ピクセル)
+    radius: プレイヤーのいるチャンクから左右いくつ先のチャンクまでを有効にするか
+    spawns: チャンク番号 -> チャンクに置く (種類, x, y) のリスト
+    active: 有効なチャンク番号 -> そのチャンクにいる敵とコインの [((種類, x, y), エンティティID), ...]
+            (チャンクを切り替えるときに、スポーンした位置ではなく今の位置で振り分け直す)
+    consumed: 倒された敵や取得済みのコインなど、チャンクが再び有効になっても出現させない (種類, x, y)
+    center: 最後に有効なチャンクを更新したときのプレイヤーのチャンク番号
+    """
+
+    chunk_width: int = 8 * 16
+    radius: int = 2
+    spawns: dict = field(default_factory=dict)
+    active: dict = field(default_factory=dict)
+    consumed: set = field(default_factory=set)
+    center: int = None
+
+
+@dataclass
+class ActivityRegion:
+    """プレイヤーの周囲だけをシミュレーションするための範囲
+    radius: プレイヤーからこの距離 (ピクセル. X と Y の大きい方) 以内に入ったエンティティを起こす
+    margin: radius よりこの距離だけ離れたらスリープさせる (境界付近で起床とスリープを繰り返さないため)
+    cell_size: スリープ中のエンティティを X 座標で分類するセルの幅 (ピクセル)
+    wake_frames: イベントで起こしたエンティティを、範囲外でもスリープさせずにおくフレーム数
+    cells: セル番号 -> スリープ中のエンティティの集合
+    entity_cells: スリープ中のエンティティ -> セル番号
+    woken: イベントで起こしたエンティティ -> スリープさせずにおく最後のフレーム
+    """
+
+    radius: int = 8 * 32
+    margin: int = 16
+    cell_size: int = 8 * 16
+    wake_frames: int = 60
+    cells: dict = field(default_factory=dict)
+    entity_cells: dict = field(default_factory=dict)
+    woken: dict = field(default_factory=dict)
+
+
 @dataclass
 class RectRigidBody:
     """長方形で衝突判定を行うオブジェクト"""
@@ -52,9 +151,12 @@ class Movable:
     jump_power: int = 2
 
 
-@dataclass
+@dataclass(slots=True)
 class Base2DPhysicsQuantity:
-    """2次元物理量を持つオブジェクト"""
+    """2次元物理量を持つオブジェクト
+    演算子は結果を同じ型で1回だけ生成する。毎フレームの処理では生成を避けるため、
+    +=, -=, *=, /= や iadd, isub, scale_, normalize_ などの値を書き換えるメソッドを使う。
+    """
 
     x: int
     y: int
@@ -64,103 +166,74 @@ class Base2DPhysicsQuantity:
     prev_y: int = 0
 
     def __add__(self, other):
-        return Base2DPhysicsQuantity(self.x + other.x, self.y + other.y)
+        return type(self)(self.x + other.x, self.y + other.y)
 
     def __sub__(self, other):
-        return Base2DPhysicsQuantity(self.x - other.x, self.y - other.y)
+        return type(self)(self.x - other.x, self.y - other.y)
 
     def __mul__(self, other):
-        return Base2DPhysicsQuantity(self.x * other, self.y * other)
+        return type(self)(self.x * other, self.y * other)
 
     def __truediv__(self, other):
-        return Base2DPhysicsQuantity(self.x / other, self.y / other)
-
-    def size(self):
-        return math.sqrt(self.x**2 + self.y**2)
-
-    def normalize(self):
-        size = self.size()
-        return Base2DPhysicsQuantity(self.x / size, self.y / size)
+        return type(self)(self.x / other, self.y / other)
 
-    def dot(self, other):
-        return self.x * other.x + self.y * other.y
+    def __iadd__(self, other):
+        return self.iadd(other)
 
-    def cross(self, other):
-        return self.x * other.y - self.y * other.x
+    def __isub__(self, other):
+        return self.isub(other)
 
+    def __imul__(self, other):
+        return self.scale_(other)
 
-@dataclass
-class Position2D(Base2DPhysicsQuantity):
-    """2次元座標を持つオブジェクト"""
+    def __itruediv__(self, other):
+        return self.scale_(1 / other)
 
-    def __add__(self, other):
-        result = super().__add__(other)
-        return Position2D(result.x, result.y)
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+        return self
 
-    def __sub__(self, other):
-        result = super().__sub__(other)
-        return Position2D(result.x, result.y)
+    def iadd(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
 
-    def __mul__(self, other):
-        result = super().__mul__(other)
-        return Position2D(result.x, result.y)
+    def isub(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
 
-    def __truediv__(self, other):
-        result = super().__truediv__(other)
-        return Position2D(result.x, result.y)
+    def scale_(self, factor):
+        self.x *= factor
+        self.y *= factor
+        return self
 
     def size(self):
-        result = super().size()
-        return result
+        return math.sqrt(self.x**2 + self.y**2)
 
     def normalize(self):
-        result = super().normalize()
-        return Position2D(result.x, result.y)
+        size = self.size()
+        return type(self)(self.x / size, self.y / size)
+
+    def normalize_(self):
+        return self.scale_(1 / self.size())
 
     def dot(self, other):
-        result = super().dot(other)
-        return result
+        return self.x * other.x + self.y * other.y
 
     def cross(self, other):
-        result = super().cross(other)
-        return result
-
-
-@dataclass
-class Velocity2D(Base2DPhysicsQuantity):
-    """2次元速度を持つオブジェクト"""
-
-    def __add__(self, other):
-        result = super().__add__(other)
-        return Velocity2D(result.x, result.y)
-
-    def __sub__(self, other):
-        result = super().__sub__(other)
-        return Velocity2D(result.x, result.y)
-
-    def __mul__(self, other):
-        result = super().__mul__(other)
-        return Velocity2D(result.x, result.y)
-
-    def __truediv__(self, other):
-        result = super().__truediv__(other)
-        return Velocity2D(result.x, result.y)
+        return self.x * other.y - self.y * other.x
 
-    def size(self):
-        result = super().size()
-        return result
 
-    def normalize(self):
-        result = super().normalize()
-        return Velocity2D(result.x, result.y)
+@dataclass(slots=True)
+class Position2D(Base2DPhysicsQuantity):
+    """2次元座標を持つオブジェクト"""
 
-    def dot(self, other):
-        result = super().dot(other)
-        return result
 
-    def cross(self, other):
-        result = super().cross(other)
-        return result
+@dataclass(slots=True)
+class Velocity2D(Base2DPhysicsQuantity):
+    """2次元速度を持つオブジェクト"""
 
 
 @dataclass
@@ -171,6 +244,15 @@ class TileMap:
     pixel_size: int = 8
 
 
+@dataclass
+class DynamicTileMap:
+    """描画内容が変化するタイルマップを表すオブジェクト (アニメーションするタイルなど)
+    このコンポーネントを持たないタイルマップは変化しないものとして事前に合成して描画する。
+    """
+
+    pass
+
+
 @dataclass
 class Player:
     """プレイヤーを表すオブジェクト"""
@@ -180,16 +262,17 @@ class Player:
 
 @dataclass
 class Animation:
-    """アニメーション情報を持つオブジェクト"""
+    """アニメーション情報を持つオブジェクト
+    clip: 再生中のクリップ名 (animation.ANIMATION_CLIPS のキー)
+    start: クリップの再生を始めたときのアニメーションの時計の値
+    """
 
-    frame: int = 0
-    timer: int = 0
+    clip: str = "player_idle"
+    start: int = 0
     is_running: bool = False
     is_jumping: bool = False
     is_falling: bool = False
     is_crouching: bool = False
-    sprite_x: int = 0
-    sprite_y: int = 8 * 11  # Default idle position
 
 
 @dataclass
@@ -220,6 +303,22 @@ class Enemy:
     species_id: int
 
 
+@dataclass
+class Pooled:
+    """ステージのリセットで再利用するため、倒されても削除せずに無効化するエンティティ"""
+
+    pass
+
+
+@dataclass
+class EntityPool:
+    """ステージのリセットで再利用するエンティティのプール
+    enemies: 敵のエンティティ (StageState.init_enemy_positions と同じ順番)
+    """
+
+    enemies: list[int] = field(default_factory=list)
+
+
 @dataclass
 class EnemyState:
     """敵の状態を表すオブジェクト"""
@@ -229,20 +328,23 @@ class EnemyState:
 
 @dataclass
 class EnemyAnimation:
-    """敵のアニメーション情報を持つオブジェクト"""
+    """敵のアニメーション情報を持つオブジェクト
+    clip: 再生中のクリップ名 (animation.ANIMATION_CLIPS のキー)
+    start: クリップの再生を始めたときのアニメーションの時計の値
+    """
 
-    frame: int = 0
-    timer: int = 0
+    clip: str = "enemy_walk"
+    start: int = 0
     is_running: bool = False
-    sprite_x: int = 0
-    sprite_y: int = 8 * 7
 
 
 @dataclass
 class MoveMethodWalk:
-    """歩く敵を表すオブジェクト"""
+    """歩く敵を表すオブジェクト
+    speed: 歩く速さ (壁に当たるまで同じ速さで歩き、当たったら向きを変える)
+    """
 
-    pass
+    speed: float = 1.0
 
 
 @dataclass
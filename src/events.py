@@ -0,0 +1,95 @@
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class GoalReached:
+    """プレイヤーがゴールに到達したことを表すイベント"""
+
+    pass
+
+
+@dataclass(frozen=True)
+class LifeLost:
+    """プレイヤーがライフを1つ失ったことを表すイベント (落下はライフが残っていなくても発行する)
+    cause: 原因 ("fall": 落下, "enemy": 敵との衝突)
+    """
+
+    cause: str
+
+
+@dataclass(frozen=True)
+class GameOver:
+    """ゲームオーバーになったことを表すイベント
+    cause: 原因 ("lives": ライフがなくなった, "time": 残り時間がなくなった)
+    """
+
+    cause: str
+
+
+@dataclass(frozen=True)
+class StageReset:
+    """ステージの敵とコインを初期状態に戻すイベント
+    restart: True の場合はリスタートとして、残り時間・ライフ・コイン数とプレイヤーの位置も戻す
+    """
+
+    restart: bool = False
+
+
+@dataclass(frozen=True)
+class CoinCollected:
+    """プレイヤーがコインを取得したことを表すイベント
+    entity: 取得したコインのエンティティID
+    """
+
+    entity: int
+
+
+class EventBus:
+    """型付きのイベントを、その型を購読しているハンドラに配信するバス
+    publish したイベントはキューに積んでおき、dispatch でまとめて発行順に配信する。
+    配信中のハンドラが発行したイベントも同じ dispatch の中で配信する。
+    """
+
+    def __init__(self) -> None:
+        # イベントの型 -> ハンドラのリスト
+        self.handlers = {}
+        # 全ての型のイベントを受け取るハンドラのリスト
+        self.global_handlers = []
+        self.queue = deque()
+
+    def subscribe(self, event_type, handler):
+        """event_type のイベントが配信されたときに handler(event) を呼ぶ"""
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def subscribe_all(self, handler):
+        """どの型のイベントが配信されたときも、その型のハンドラより先に handler(event) を呼ぶ"""
+        self.global_handlers.append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        handlers = self.handlers.get(event_type)
+        if handlers and handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, event):
+        self.queue.append(event)
+
+    def dispatch(self) -> int:
+        """キューのイベントを全て配信する
+
+        Returns:
+            int: 配信したイベントの数
+        """
+        count = 0
+        queue = self.queue
+        while queue:
+            event = queue.popleft()
+            for handler in self.global_handlers:
+                handler(event)
+            for handler in self.handlers.get(type(event), ()):
+                handler(event)
+            count += 1
+        return count
+
+    def clear(self):
+        self.queue.clear()
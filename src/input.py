@@ -1,4 +1,5 @@
 from pigframe import ActionMap
+import random
 import pyxel
 
 from dataclasses import dataclass
@@ -61,3 +62,109 @@ class Input(ActionMap):
         pyxel.GAMEPAD3_BUTTON_B,
         pyxel.GAMEPAD4_BUTTON_B,
     )
+
+
+class PyxelInputSource:
+    """pyxel から直接入力を読み取る入力ソース
+    pyxel の1フレームでシミュレーションのステップが0回や複数回になっても押下を1度だけ数えるよう、
+    押された瞬間のキーは poll で記録しておき、ステップが読み終わった end_frame で消す。
+    """
+
+    def __init__(self) -> None:
+        # 押された瞬間を記録し、まだステップで読まれていないキー
+        self.pressed = set()
+
+    def poll(self, keys):
+        """pyxel のフレームごとに1度呼び、keys のうち押された瞬間のキーを記録する"""
+        for key in keys:
+            if pyxel.btnp(key):
+                self.pressed.add(key)
+
+    def update(self):
+        pass
+
+    def btn(self, key: int) -> bool:
+        return pyxel.btn(key)
+
+    def btnp(self, key: int) -> bool:
+        return key in self.pressed
+
+    def btnv(self, key: int) -> int:
+        return pyxel.btnv(key)
+
+    def end_frame(self, world):
+        self.pressed.clear()
+
+
+class ScriptedInputSource:
+    """スクリプトに従って入力を返す入力ソース (ウィンドウなしの実行用)
+    script: フレームごとの {キー: 値} の辞書のリスト、またはフレーム番号を受け取って同じ形式の辞書を返す関数。
+            ボタンは値が 0 以外のときに押されているとみなす。リストの範囲外のフレームは入力なしとして扱う。
+    """
+
+    def __init__(self, script=None) -> None:
+        self.script = script if script is not None else []
+        self.frame = -1
+        self.values = {}
+        self.prev_values = {}
+
+    def poll(self, keys):
+        pass
+
+    def update(self):
+        self.frame += 1
+        self.prev_values = self.values
+        if callable(self.script):
+            self.values = self.script(self.frame) or {}
+        elif self.frame < len(self.script):
+            self.values = self.script[self.frame]
+        else:
+            self.values = {}
+
+    def btn(self, key: int) -> bool:
+        return self.values.get(key, 0) != 0
+
+    def btnp(self, key: int) -> bool:
+        return self.values.get(key, 0) != 0 and self.prev_values.get(key, 0) == 0
+
+    def btnv(self, key: int) -> int:
+        return self.values.get(key, 0)
+
+    def end_frame(self, world):
+        pass
+
+
+class RandomInputSource(ScriptedInputSource):
+    """乱数で入力を作る入力ソース (ウィンドウなしのレベルの検証やファジング用)
+    押すキーの組み合わせを決めたら、ランダムなフレーム数だけ押し続けてから次の組み合わせを選ぶ。
+    seed が同じなら同じ入力の列になる。
+    seed: 乱数のシード
+    keys: 押す候補のキー (省略時は左右移動・ジャンプ・しゃがみ)
+    press_probability: 組み合わせを選ぶときに各キーを押す確率
+    hold_frames: 同じ組み合わせを押し続けるフレーム数の範囲 (最小, 最大)
+    """
+
+    DEFAULT_KEYS = (pyxel.KEY_LEFT, pyxel.KEY_RIGHT, pyxel.KEY_SPACE, pyxel.KEY_DOWN)
+
+    def __init__(
+        self,
+        seed: int = 0,
+        keys: tuple = None,
+        press_probability: float = 0.4,
+        hold_frames: tuple[int, int] = (1, 30),
+    ) -> None:
+        super().__init__(self.next_values)
+        self.random = random.Random(seed)
+        self.keys = keys if keys is not None else self.DEFAULT_KEYS
+        self.press_probability = press_probability
+        self.hold_frames = hold_frames
+        self.held = {}
+        self.hold_until = 0
+
+    def next_values(self, frame: int) -> dict:
+        if frame >= self.hold_until:
+            self.held = {
+                key: 1 for key in self.keys if self.random.random() < self.press_probability
+            }
+            self.hold_until = frame + self.random.randint(*self.hold_frames)
+        return self.held
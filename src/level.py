@@ -0,0 +1,168 @@
+from array import array
+import ctypes
+import hashlib
+import mmap
+import os
+import struct
+import xml.etree.ElementTree as ET
+import pyxel
+
+# 解析済みのレベルを保存するキャッシュファイルの拡張子 (TMXファイルのパスの後ろに付ける)
+LEVEL_CACHE_SUFFIX = ".levelcache"
+
+# キャッシュの先頭: マジック, バージョン, TMXファイルの SHA-1, レイヤー数
+_CACHE_HEADER = struct.Struct("<4sH20sH")
+_CACHE_MAGIC = b"PXLV"
+_CACHE_VERSION = 1
+# レイヤーごと: 幅, 高さ (この後に幅 x 高さ x 2 個の符号なし16ビット整数が続く)
+_CACHE_LAYER = struct.Struct("<II")
+
+
+class TileLayer:
+    """タイルマップの1レイヤーをプレーンなデータとして保持するオブジェクト
+    pyxel.Tilemap と同じ pget(x, y) で (タイルX, タイルY) を返すため、ウィンドウなしでも衝突判定に使える。
+    data: pyxel.Tilemap と同じく (タイルX, タイルY) を交互に並べた符号なし16ビット整数の列
+    """
+
+    def __init__(self, width: int, height: int, data) -> None:
+        self.width = width
+        self.height = height
+        self.data = data
+
+    def pget(self, x: int, y: int) -> tuple[int, int]:
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return (0, 0)
+        i = (y * self.width + x) * 2
+        return (self.data[i], self.data[i + 1])
+
+
+def load_tmx_layers(filepath: str) -> list[TileLayer]:
+    """TMXファイルを1度だけ解析して全レイヤーを読み込む関数
+
+    Args:
+        filepath (str): TMXファイルのパス
+
+    Returns:
+        list[TileLayer]: ファイル内の順番に並んだレイヤーのリスト
+    """
+    root = ET.parse(filepath).getroot()
+    tileset = root.find("tileset")
+    firstgid = int(tileset.get("firstgid"))
+    columns = int(tileset.get("columns"))
+
+    layers = []
+    for layer in root.iter("layer"):
+        width = int(layer.get("width"))
+        height = int(layer.get("height"))
+        data = layer.find("data")
+        if data.get("encoding") != "csv":
+            raise ValueError(f"unsupported tmx layer encoding: {data.get('encoding')}")
+        tiles = array("H")
+        for gid in data.text.replace("\n", "").split(","):
+            if not gid:
+                continue
+            # pyxel.Tilemap.from_tmx と同じく、空タイル (gid 0) は (0, 0) として扱う
+            tile_id = max(int(gid) - firstgid, 0)
+            tiles.append(tile_id % columns)
+            tiles.append(tile_id // columns)
+        layers.append(TileLayer(width, height, tiles))
+    return layers
+
+
+def get_file_digest(filepath: str) -> bytes:
+    with open(filepath, "rb") as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def write_level_cache(cache_path: str, digest: bytes, layers: list[TileLayer]):
+    """レイヤーをキャッシュファイルに書き出す関数 (書き込み途中のファイルが読まれないよう、一時ファイルから置き換える)
+
+    Args:
+        cache_path (str): キャッシュファイルのパス
+        digest (bytes): TMXファイルの SHA-1
+        layers (list[TileLayer]): レイヤーのリスト
+    """
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, _CACHE_VERSION, digest, len(layers)))
+        for layer in layers:
+            f.write(_CACHE_LAYER.pack(layer.width, layer.height))
+            f.write(array("H", layer.data).tobytes())
+    os.replace(tmp_path, cache_path)
+
+
+def read_level_cache(cache_path: str, digest: bytes) -> list[TileLayer] | None:
+    """キャッシュファイルをメモリマップして読み込む関数
+
+    Args:
+        cache_path (str): キャッシュファイルのパス
+        digest (bytes): TMXファイルの SHA-1
+
+    Returns:
+        list[TileLayer] | None: キャッシュが無いか、TMXファイルと一致しない場合は None
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buffer) < _CACHE_HEADER.size:
+        return None
+    magic, version, cached_digest, layer_count = _CACHE_HEADER.unpack_from(buffer)
+    if magic != _CACHE_MAGIC or version != _CACHE_VERSION or cached_digest != digest:
+        return None
+
+    view = memoryview(buffer)
+    offset = _CACHE_HEADER.size
+    layers = []
+    for _ in range(layer_count):
+        width, height = _CACHE_LAYER.unpack_from(buffer, offset)
+        offset += _CACHE_LAYER.size
+        size = width * height * 4
+        if offset + size > len(buffer):
+            return None
+        layers.append(TileLayer(width, height, view[offset : offset + size].cast("H")))
+        offset += size
+    return layers
+
+
+def load_level(filepath: str, cache_path: str = None) -> list[TileLayer]:
+    """レベルを読み込む関数
+    TMXファイルと一致するキャッシュがあれば XML を解析せずにメモリマップで読み込み、
+    無ければ TMXファイルを解析してキャッシュを書き出す。
+
+    Args:
+        filepath (str): TMXファイルのパス
+        cache_path (str, optional): キャッシュファイルのパス. Defaults to filepath + LEVEL_CACHE_SUFFIX.
+
+    Returns:
+        list[TileLayer]: ファイル内の順番に並んだレイヤーのリスト
+    """
+    if cache_path is None:
+        cache_path = filepath + LEVEL_CACHE_SUFFIX
+    digest = get_file_digest(filepath)
+    layers = read_level_cache(cache_path, digest)
+    if layers is not None:
+        return layers
+
+    layers = load_tmx_layers(filepath)
+    try:
+        write_level_cache(cache_path, digest, layers)
+    except OSError:
+        # 読み取り専用の場所 (パッケージ化されたアプリなど) ではキャッシュなしで続ける
+        pass
+    return layers
+
+
+def copy_layers_to_tilemaps(layers: list[TileLayer], tilemaps, imgsrc: int = 0):
+    """レイヤーのデータを pyxel のタイルマップにそのままコピーする関数
+
+    Args:
+        layers (list[TileLayer]): レイヤーのリスト
+        tilemaps: コピー先 (pyxel.tilemaps)
+        imgsrc (int, optional): タイルマップが参照するイメージバンク. Defaults to 0.
+    """
+    for i, layer in enumerate(layers):
+        tilemap = pyxel.Tilemap(layer.width, layer.height, imgsrc)
+        ctypes.memmove(tilemap.data_ptr(), bytes(layer.data), layer.width * layer.height * 4)
+        tilemaps[i] = tilemap
@@ -1,16 +1,46 @@
-from pigframe import World
-from screen import *
-from system import *
-from spawn import *
-from input import Input
+import time
+
+_import_start = time.perf_counter()
+
+from assets import AssetLoader, StartupReport
+
+# 起動時間のレポート用に、モジュールごとの import の時間を記録する
+startup_report = StartupReport(_import_start)
+with startup_report.measure("import", "world (pigframe)"):
+    from world import CachedWorld
+with startup_report.measure("import", "screen (pyxel)"):
+    from screen import *
+with startup_report.measure("import", "system"):
+    from system import *
+with startup_report.measure("import", "spawn"):
+    from spawn import *
+    from stage import subscribe_stage_events, wake_event_target
+with startup_report.measure("import", "input, level, replay"):
+    from events import CoinCollected, EventBus, GameOver, GoalReached, LifeLost, StageReset
+    from input import Input, PyxelInputSource, ScriptedInputSource
+    from level import copy_layers_to_tilemaps, load_level
+    from profiler import FrameProfiler
+    from render import RenderCommandBuffer
+    from telemetry import LEVELS, Telemetry
+    from replay import InputRecorder, ReplayInputSource
+from functools import partial
+import argparse
+import atexit
+import gc
 import json
+import os
+import sys
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCREEN_SIZE = (8 * 34, 8 * 2 * 10)  # (288, 160)
-image_filepath = "assets/2d-platformer.png"
-tilemap_filepath = "assets/map01.tmx"
+image_filepath = os.path.join(BASE_DIR, "assets/2d-platformer.png")
+tilemap_filepath = os.path.join(BASE_DIR, "assets/map01.tmx")
+resource_filepath = os.path.join(BASE_DIR, "assets/my_resource.pyxres")
 title = "2d-platformer"
 FPS = 60
-BGM = "assets/music.json"
+# 処理が遅れたときに1フレームで追いつくために進めるシミュレーションステップの上限
+MAX_CATCH_UP_STEPS = 5
+BGM = os.path.join(BASE_DIR, "assets/music.json")
 
 COINS_POSITIONS = [
     (8 * 1, 8 * 5),
@@ -18,40 +48,245 @@ COINS_POSITIONS = [
 ]
 
 
-class Game(World):
-    def __init__(self):
+def load_music_data():
+    with open(BGM, "r") as f:
+        return json.loads(f.read())
+
+
+class Game(CachedWorld):
+    """ゲーム全体を管理するワールド
+    headless: True の場合はウィンドウを作らず、タイルマップをプレーンなデータとして読み込んで実行する
+    input_source: 入力ソース (省略時はウィンドウありなら pyxel、ヘッドレスなら入力なしのスクリプト)
+    startup_report: アセットの読み込み時間などを記録する StartupReport
+    アセットは self.assets から初めて使われたときに読み込む。
+    シミュレーションは dt 秒の固定の時間刻みで進め (process が1ステップ)、描画とは切り離す。
+    """
+
+    def __init__(self, headless: bool = False, input_source=None, startup_report=None):
         super().__init__()
         self.screen_size = SCREEN_SIZE
         self.fps = FPS
+        self.headless = headless
+        if input_source is None:
+            input_source = ScriptedInputSource() if headless else PyxelInputSource()
+        self.input_source = input_source
+        self.running = True
+        self.frame_count = 0
+        self.profiler = None
+        self.dt = 1 / self.fps
+        self.max_catch_up_steps = MAX_CATCH_UP_STEPS
+        self.accumulator = 0.0
+        self.last_time = None
+        # 描画時の補間係数 (直前のステップの位置から現在の位置までの割合)
+        self.alpha = 1.0
+        self.skip_draw = False
+        # 押された瞬間で判定するアクションのキー (set_user_actions_map で設定する)
+        self.edge_keys = ()
+        # スクリーンは描画命令をこのバッファに積み、draw の最後にまとめて描画する
+        self.render_buffer = RenderCommandBuffer(*self.screen_size)
+        # タイルマップの内容を書き換えるたびに増やす番号 (utils.mark_tiles_changed)
+        self.tile_revision = 0
+        # システムが発行した型付きのイベントを、process_events でハンドラに配信する
+        self.events = EventBus()
+        # ログとフレームごとのメトリクス (start を呼ぶまでは無効で、記録のコストはかからない)
+        self.telemetry = Telemetry()
+        self.startup_report = startup_report if startup_report is not None else StartupReport()
+        self.assets = AssetLoader(self.startup_report)
         self.init()
 
     def init(self):
-        pyxel.init(self.screen_size[0], self.screen_size[1], title=title, fps=self.fps)
-        pyxel.images[0] = pyxel.Image.from_image(image_filepath, incl_colors=True)
-        for i in range(7):
-            pyxel.tilemaps[i] = pyxel.Tilemap.from_tmx(tilemap_filepath, i)
+        # TMXファイルは1度だけ解析し、2回目以降の起動ではキャッシュを読み込む
+        self.assets.register("level", lambda: load_level(tilemap_filepath), threadsafe=True)
+        self.assets.register("music", load_music_data, threadsafe=True)
+        if self.headless:
+            self.tilemaps = self.assets.get("level")
+            return
+
+        # pyxel のオブジェクトはメインスレッドで作る必要があるため、画像とリソースは先読みしない
+        self.assets.register(
+            "image", lambda: pyxel.Image.from_image(image_filepath, incl_colors=True)
+        )
+        self.assets.register(
+            "resource",
+            lambda: pyxel.load(resource_filepath, excl_images=True, excl_tilemaps=True),
+        )
+        # ウィンドウを作っている間にレベルを読み込んでおく
+        self.assets.prefetch("level")
+        with self.startup_report.measure("init", "pyxel.init"):
+            pyxel.init(self.screen_size[0], self.screen_size[1], title=title, fps=self.fps)
+        pyxel.images[0] = self.assets.get("image")
+        copy_layers_to_tilemaps(self.assets.get("level"), pyxel.tilemaps)
+        self.tilemaps = pyxel.tilemaps
+        self.assets.shutdown()
+
+    @property
+    def music_data(self):
+        return self.assets.get("music")
 
-        with open(BGM, "r") as f:
-            self.music_data = json.loads(f.read())
+    def set_user_actions_map(self, action_map):
+        super().set_user_actions_map(action_map)
+        self.edge_keys = tuple(
+            key
+            for value in self.user_input_event_map.values()
+            if callable(value[0]) and value[0].__name__ == "btnp"
+            for key in value[1:]
+        )
 
-        pyxel.load("assets/my_resource.pyxres", excl_images=True, excl_tilemaps=True)
+    def update_user_actions(self):
+        """入力ソースを使ってユーザーの入力を判定する
+        Input に定義された pyxel.btn / pyxel.btnp は入力ソースの同名のメソッドに置き換えて呼び出す。
+        """
+        for key, value in self.user_input_event_map.items():
+            if not callable(value[0]):
+                break
+            poll = getattr(self.input_source, value[0].__name__)
+            setattr(self.actions, key, any(poll(v) for v in value[1:]))
+
+    def enable_profiler(self, capacity: int = 600) -> FrameProfiler:
+        """システムとスクリーンごとの処理時間の記録を開始する
+        無効な間は pigframe の process_systems / process_screens をそのまま使うため、計測のコストはかからない。
+
+        Args:
+            capacity (int, optional): 記録するフレーム数. Defaults to 600.
+
+        Returns:
+            FrameProfiler: 記録先のプロファイラ
+        """
+        self.profiler = FrameProfiler(capacity)
+        self.process_systems = self._process_systems_profiled
+        self.process_screens = self._process_screens_profiled
+        return self.profiler
+
+    def disable_profiler(self):
+        self.profiler = None
+        self.__dict__.pop("process_systems", None)
+        self.__dict__.pop("process_screens", None)
+
+    def _process_systems_profiled(self):
+        profiler = self.profiler
+        profiler.begin_frame(len(self.entities))
+        for system in self.scene_systems.get(self.current_scene) or ():
+            start = time.perf_counter()
+            system.process()
+            profiler.add("system", type(system).__name__, time.perf_counter() - start)
+
+    def _process_screens_profiled(self):
+        profiler = self.profiler
+        for screen in self.scene_screens.get(self.current_scene) or ():
+            start = time.perf_counter()
+            screen.draw()
+            profiler.add("screen", type(screen).__name__, time.perf_counter() - start)
 
     def draw(self):
-        pyxel.cls(0)
+        # 更新が遅れているフレームは描画を省き、前のフレームの画面をそのまま表示する
+        if self.skip_draw:
+            return
+        self.render(pyxel)
+
+    def render(self, target):
+        """スクリーンの描画命令をバッファに積み、描画先にまとめて描画する
+        ヘッドレスでは画面と同じ大きさの pyxel.Image を描画先にすれば、ウィンドウなしで描画結果を確認できる。
+
+        Args:
+            target: 描画先 (pyxel モジュール、または pyxel.Image)
+        """
+        self.render_buffer.cls(0)
         self.process_screens()
+        if self.profiler is None:
+            self.render_buffer.flush(target)
+            return
+        start = time.perf_counter()
+        self.render_buffer.flush(target)
+        self.profiler.add("render", "RenderFlush", time.perf_counter() - start)
+
+    def update(self):
+        """pyxel から毎フレーム呼ばれ、前回からの経過時間の分だけ固定の時間刻みでシミュレーションを進める
+        1フレームで進めるステップ数は max_catch_up_steps までとし、それ以上の遅れは切り捨てる。
+        押された瞬間の入力は入力ソースに記録させ、ステップが0回のフレームでも失わず、複数回のフレームでも1度だけ読む。
+        """
+        self.input_source.poll(self.edge_keys)
+        now = time.perf_counter()
+        elapsed = self.dt if self.last_time is None else now - self.last_time
+        self.last_time = now
+        self.accumulator += elapsed
+        behind = self.accumulator > self.dt * self.max_catch_up_steps
+
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_catch_up_steps and self.running:
+            self.process()
+            self.accumulator -= self.dt
+            steps += 1
+        if behind:
+            self.accumulator = 0.0
+        self.alpha = self.accumulator / self.dt
+        # 追いつけていない間も、描画は1フレームおきには行う
+        self.skip_draw = behind and not self.skip_draw
+
+    def process_events(self):
+        """pigframe のイベントを処理した後、このステップでシステムが発行したイベントをハンドラに配信する"""
+        super().process_events()
+        self.events.dispatch()
 
     def process(self):
+        """シミュレーションを1ステップ (dt 秒) 進める"""
+        if self.frame_count == 0:
+            self.startup_report.mark_first_frame()
+        telemetry = self.telemetry
+        if telemetry.enabled:
+            start = time.perf_counter()
+        self.input_source.update()
         self.scene_manager.process()
         self.process_user_actions()
         self.process_systems()
         self.process_events()
+        self.input_source.end_frame(self)
+        if telemetry.enabled:
+            telemetry.gauge("step_ms", (time.perf_counter() - start) * 1000)
+            telemetry.gauge("entities", len(self.entities))
+            telemetry.gauge("sleeping_entities", len(self.sleeping_entities))
+            telemetry.end_frame(self.frame_count)
+        self.frame_count += 1
 
     def run(self):
-        pyxel.run(self.process, self.draw)
+        # ステージ構築時のオブジェクトを GC の対象から外し、フレーム中の GC の負荷を抑える
+        gc.freeze()
+        if self.headless:
+            self.run_headless()
+            return
+        pyxel.run(self.update, self.draw)
 
+    def run_headless(self, frames: int = None):
+        """ウィンドウなしで、CPU が許す限りの速さで process を繰り返す
 
-if __name__ == "__main__":
-    game = Game()
+        Args:
+            frames (int, optional): 実行するフレーム数. None の場合は quit が呼ばれるまで実行する.
+        """
+        end_frame = None if frames is None else self.frame_count + frames
+        while self.running and (end_frame is None or self.frame_count < end_frame):
+            self.process()
+
+    def quit(self):
+        self.running = False
+        if not self.headless:
+            pyxel.quit()
+
+
+def setup_game(
+    game: Game,
+    vectorized_motion: bool = False,
+    stream_chunks: bool = False,
+    activity_radius: int = None,
+):
+    """プレイ可能なシーン、エンティティ、システム、スクリーンをゲームに登録する関数
+
+    Args:
+        game (Game): ゲームのワールド
+        vectorized_motion (bool, optional): 重力・移動・位置更新を NumPy の配列演算で処理する (numpy が必要).
+            Defaults to False.
+        stream_chunks (bool, optional): 敵とコインをプレイヤーの周囲のチャンクの分だけスポーンする. Defaults to False.
+        activity_radius (int, optional): プレイヤーからこの距離 (ピクセル) より離れた敵をスリープさせる.
+            画面に映る範囲より小さい値は切り上げる. None の場合は全ての敵を毎フレーム処理する. Defaults to None.
+    """
     game.add_scenes(["playable"])
     game.set_user_actions_map(Input())
     game.current_scene = "playable"
@@ -65,22 +300,55 @@ if __name__ == "__main__":
     # spawn_collidable_tilemap(game, 1, 8)
     spawn_goal_marker_tilemap(game, 1)
     spawn_collidable_tilemap(game, 5, 8)
-    spawn_stage(game, 0, 60.0, init_enemy_positions=[(8 * 30, 8 * 10), (8 * 62, 8 * 10)])
+    spawn_tile_collision_grid(game)
+    spawn_spatial_hash_grid(game)
+    spawn_collectible_index(game)
+    spawn_animation_table(game)
+    if activity_radius is not None:
+        spawn_activity_region(game, activity_radius)
+    enemy_positions = [(8 * 30, 8 * 10), (8 * 62, 8 * 10)]
+    spawn_stage(game, 0, 60.0, enemy_positions, spawn_enemies=not stream_chunks)
+    subscribe_stage_events(game)
+    for event_type in (GoalReached, LifeLost, GameOver, StageReset, CoinCollected):
+        game.events.subscribe(event_type, game.telemetry.record_event)
+    if activity_radius is not None:
+        # エンティティを対象にするイベントは、スリープ中のエンティティも起こしてから配信する
+        game.events.subscribe_all(partial(wake_event_target, game))
     # Spawn coins using positions from tilemap
-    coin_positions = get_coin_positions_from_tilemap(6)
-    for pos in coin_positions:
-        spawn_coin(game, pos[0], pos[1])
+    coin_positions = get_coin_positions_from_tilemap(6, game.tilemaps)
+    if stream_chunks:
+        spawn_level_chunks(game, enemy_positions, coin_positions)
+    else:
+        for pos in coin_positions:
+            spawn_coin(game, pos[0], pos[1])
 
     # spawn_floor(game, 0, 8)
     # spawn_background(game, 3)
 
     # Add systems with adjusted parameters
-    game.add_system_to_scenes(SysTilemapCollision, "playable", 1)
-    game.add_system_to_scenes(SysSimulateGravity, "playable", 50, gravity=0.2, max_fall_speed=2.0)
+    if vectorized_motion:
+        # numpy の import は重いため、使うときだけ読み込む
+        from soa import SysSimulateGravityVectorized, SysUpdatePositionVectorized
+
+        spawn_motion_store(game)
+        game.add_system_to_scenes(
+            SysSimulateGravityVectorized, "playable", 50, gravity=0.2, max_fall_speed=2.0
+        )
+        game.add_system_to_scenes(SysUpdatePositionVectorized, "playable", 40)
+    else:
+        game.add_system_to_scenes(
+            SysSimulateGravity, "playable", 50, gravity=0.2, max_fall_speed=2.0
+        )
+        game.add_system_to_scenes(SysUpdatePosition, "playable", 40)
+    # タイルとの衝突は経路上のタイルを順に調べる掃引で判定するため、配列演算の場合も同じシステムを使う
     game.add_system_to_scenes(SysCharacterMovement, "playable", 20)
     game.add_system_to_scenes(SysPlayerControl, "playable", 30, acceleration=0.5, friction=0)
-    game.add_system_to_scenes(SysPlayerAnimation, "playable", 60, animation_speed=6)
-    game.add_system_to_scenes(SysUpdatePosition, "playable", 40)
+    game.add_system_to_scenes(SysPlayerAnimation, "playable", 60)
+    game.add_system_to_scenes(SysUpdateSpatialHash, "playable", 45)
+    if stream_chunks:
+        game.add_system_to_scenes(SysStreamChunks, "playable", 44)
+    if activity_radius is not None:
+        game.add_system_to_scenes(SysUpdateActivityRegion, "playable", 10)
     game.add_system_to_scenes(SysRestartStage, "playable", 100)
     game.add_system_to_scenes(SysPlayerGoal, "playable", 200)
     game.add_system_to_scenes(SysUpdateStageState, "playable", 300)
@@ -91,15 +359,12 @@ if __name__ == "__main__":
 
     ## Enemy
     game.add_system_to_scenes(SysEnemyWalk, "playable", 50)
-    game.add_system_to_scenes(SysEnemyAnimation, "playable", 55)
+    game.add_system_to_scenes(SysAnimate, "playable", 55)
     game.add_system_to_scenes(SysPlayerEnemyCollision, "playable", 56)
 
     ## Coin
     game.add_system_to_scenes(SysCollectCoin, "playable", 400)
 
-    ## Player
-    game.add_system_to_scenes(SysPlayerDieNoHP, "playable", 500)
-
     ## Menu
     game.add_system_to_scenes(SysExitGame, "playable", 5000)
 
@@ -109,7 +374,8 @@ if __name__ == "__main__":
     # Add screens
     game.add_screen_to_scenes(ScTileMaps, "playable", 0)
     game.add_screen_to_scenes(ScPlayer, "playable", 100)
-    game.add_screen_to_scenes(ScStageClock, "playable", 1000)
+    # 残り時間、ライフ、コインの数
+    game.add_screen_to_scenes(ScHud, "playable", 500)
     game.add_screen_to_scenes(ScGameOver, "playable", 2000)
     game.add_screen_to_scenes(ScGoal, "playable", 3000)
 
@@ -122,9 +388,84 @@ if __name__ == "__main__":
 
     ## Coin
     game.add_screen_to_scenes(ScCoin, "playable", 50)
-    game.add_screen_to_scenes(ScCoinCount, "playable", 500)
 
-    ## Lives
-    game.add_screen_to_scenes(ScLives, "playable", 500)
 
-    game.run()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument("--headless", action="store_true", help="run without a window")
+    parser.add_argument("--frames", type=int, default=None, help="frames to run in headless mode")
+    parser.add_argument(
+        "--vectorized-motion", action="store_true", help="use the numpy motion systems"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="record per-system timings and show the overlay"
+    )
+    parser.add_argument(
+        "--profile-output", default=None, help="write the profile to this .csv/.json on exit"
+    )
+    parser.add_argument(
+        "--stream-chunks", action="store_true", help="spawn enemies and coins per level chunk"
+    )
+    parser.add_argument(
+        "--activity-radius",
+        type=int,
+        default=None,
+        help="put enemies farther than this many pixels from the player to sleep (default: off)",
+    )
+    parser.add_argument(
+        "--startup-report", action="store_true", help="print startup timings at the first frame"
+    )
+    parser.add_argument(
+        "--log-level", choices=list(LEVELS), default=None, help="write logs at this level or above"
+    )
+    parser.add_argument(
+        "--log-file", default=None, help="write the logs to this file instead of stderr"
+    )
+    parser.add_argument(
+        "--metrics-output", default=None, help="stream per-frame metrics to this .jsonl file"
+    )
+    parser.add_argument("--record", default=None, help="record the inputs to this file on exit")
+    parser.add_argument("--replay", default=None, help="replay the inputs recorded in this file")
+    parser.add_argument(
+        "--replay-realtime",
+        action="store_true",
+        help="replay at the game's fps instead of at full speed",
+    )
+    args = parser.parse_args()
+
+    input_source = None
+    if args.replay:
+        input_source = ReplayInputSource(
+            args.replay, Input(), realtime=args.replay_realtime, fps=FPS
+        )
+    elif args.record:
+        input_source = InputRecorder(
+            ScriptedInputSource() if args.headless else PyxelInputSource(), Input()
+        )
+        atexit.register(input_source.save, args.record)
+
+    if args.startup_report:
+        startup_report.output = sys.stderr
+    game = Game(headless=args.headless, input_source=input_source, startup_report=startup_report)
+    setup_game(
+        game,
+        vectorized_motion=args.vectorized_motion,
+        stream_chunks=args.stream_chunks,
+        activity_radius=args.activity_radius or None,
+    )
+    if args.log_level or args.log_file or args.metrics_output:
+        game.telemetry.start(
+            log_path=args.log_file,
+            metrics_path=args.metrics_output,
+            level=LEVELS[args.log_level or "info"],
+        )
+        atexit.register(game.telemetry.stop)
+    if args.profile or args.profile_output:
+        profiler = game.enable_profiler()
+        game.add_screen_to_scenes(ScDebugProfiler, "playable", 5002)
+        if args.profile_output:
+            atexit.register(profiler.export, args.profile_output)
+    if args.headless:
+        game.run_headless(args.frames)
+    else:
+        game.run()
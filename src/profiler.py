@@ -0,0 +1,112 @@
+from array import array
+import csv
+import json
+
+# 60 FPS で1フレームに使える時間
+FRAME_BUDGET_MS = 1000 / 60
+# フレーム時間のヒストグラムの区切り (ミリ秒)
+HISTOGRAM_EDGES_MS = (2.0, 4.0, 8.0, FRAME_BUDGET_MS, 33.3)
+
+
+class FrameProfiler:
+    """システムとスクリーンごとの処理時間を固定長のリングバッファに記録するプロファイラ
+    capacity: 記録するフレーム数 (古いフレームから上書きする)
+    """
+
+    def __init__(self, capacity: int = 600) -> None:
+        self.capacity = capacity
+        self.frame = -1
+        self.index = -1
+        self.frames = array("q", [-1] * capacity)
+        self.entity_counts = array("l", [0] * capacity)
+        # 名前 -> フレームごとの処理時間 (ミリ秒) のリングバッファ
+        self.columns = {}
+        self.kinds = {}
+
+    def begin_frame(self, entity_count: int):
+        self.frame += 1
+        self.index = self.frame % self.capacity
+        self.frames[self.index] = self.frame
+        self.entity_counts[self.index] = entity_count
+        for column in self.columns.values():
+            column[self.index] = 0.0
+
+    def add(self, kind: str, name: str, seconds: float):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = array("d", [0.0] * self.capacity)
+            self.kinds[name] = kind
+        column[self.index] += seconds * 1000
+
+    def recorded_indices(self) -> list[int]:
+        """記録済みのフレームのリングバッファ上の位置を古い順に返す"""
+        count = min(self.frame + 1, self.capacity)
+        return [(self.frame - count + 1 + i) % self.capacity for i in range(count)]
+
+    def frame_ms(self, index: int) -> float:
+        return sum(column[index] for column in self.columns.values())
+
+    def average_ms(self, frames: int = 60) -> dict[str, float]:
+        """直近 frames フレームの名前ごとの平均処理時間を返す"""
+        indices = self.recorded_indices()[-frames:]
+        if not indices:
+            return {}
+        return {
+            name: sum(column[i] for i in indices) / len(indices)
+            for name, column in self.columns.items()
+        }
+
+    def histogram(self) -> list[int]:
+        """フレーム時間を HISTOGRAM_EDGES_MS で区切った度数を返す (最後の要素は上限を超えたもの)"""
+        counts = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+        for index in self.recorded_indices():
+            frame_ms = self.frame_ms(index)
+            bucket = 0
+            while bucket < len(HISTOGRAM_EDGES_MS) and frame_ms >= HISTOGRAM_EDGES_MS[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        return counts
+
+    def spikes(self, threshold_ms: float = FRAME_BUDGET_MS) -> list[tuple[int, float, str]]:
+        """threshold_ms を超えたフレームを (フレーム番号, フレーム時間, 最も遅かった名前) で返す"""
+        spikes = []
+        for index in self.recorded_indices():
+            frame_ms = self.frame_ms(index)
+            if frame_ms > threshold_ms:
+                worst = max(self.columns, key=lambda name: self.columns[name][index])
+                spikes.append((self.frames[index], frame_ms, worst))
+        return spikes
+
+    def export_csv(self, filepath: str):
+        """記録したフレームを1フレーム1行の CSV に書き出す"""
+        names = list(self.columns)
+        with open(filepath, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "entities", "frame_ms"] + names)
+            for index in self.recorded_indices():
+                writer.writerow(
+                    [self.frames[index], self.entity_counts[index], self.frame_ms(index)]
+                    + [self.columns[name][index] for name in names]
+                )
+
+    def export_json(self, filepath: str):
+        """記録したフレームを JSON のトレースとして書き出す"""
+        indices = self.recorded_indices()
+        trace = {
+            "frames": [self.frames[i] for i in indices],
+            "entities": [self.entity_counts[i] for i in indices],
+            "frame_ms": [self.frame_ms(i) for i in indices],
+            "kinds": self.kinds,
+            "columns": {
+                name: [column[i] for i in indices] for name, column in self.columns.items()
+            },
+        }
+        with open(filepath, "w") as f:
+            json.dump(trace, f)
+
+    def export(self, filepath: str):
+        """拡張子 (.csv / .json) に応じた形式で書き出す"""
+        if filepath.endswith(".json"):
+            self.export_json(filepath)
+        else:
+            self.export_csv(filepath)
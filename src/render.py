@@ -0,0 +1,223 @@
+# 描画命令の種類
+CMD_BLT = 0
+CMD_BLTM = 1
+CMD_TEXT = 2
+CMD_RECT = 3
+
+# pyxel の標準フォントの1文字の大きさ
+FONT_WIDTH = 4
+FONT_HEIGHT = 6
+
+# 画像バンクを持たない命令の並び順 (入れ替えてよい命令の間では図形、文字、画像の順に描く)
+_RECT_BANK = -2
+_TEXT_BANK = -1
+
+# 画像バンクの順に並べ替える、互いに重ならない命令の並びの長さの上限
+MAX_BATCH_RUN = 32
+# 隠れる命令の判定に使う不透明な命令の数の上限 (面積の大きいものを残す)
+MAX_COVERS = 8
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class RenderCommandBuffer:
+    """スクリーンが描画命令を積み、フレームの最後にまとめて描画するバッファ
+    命令はレイヤー (通常はスクリーンの priority)、サブレイヤー、積まれた順に並べ、描く範囲が重ならず
+    順番を入れ替えても結果が変わらない命令の並びの中だけを画像バンクの順に並べ替える。
+    画面外のもの、同じ命令の重複、後から描かれる不透明な命令に完全に隠れるものは描かない。
+    flush の描画先には pyxel モジュールのほか、同じ描画メソッドを持つ pyxel.Image も使えるため、
+    ウィンドウなしでも描画の結果と数を確認できる。
+    width, height: ビューポートの大きさ
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.commands = []
+        self.clear_color = None
+        self.stats = {}
+        # 直前の flush で実際に描いた命令とその統計
+        self.drawn = []
+        self.last_stats = {}
+        self.clear()
+
+    def clear(self):
+        self.commands = []
+        self.clear_color = None
+        self.stats = {"submitted": 0, "culled": 0, "duplicates": 0, "hidden": 0, "drawn": 0}
+
+    def cls(self, col: int):
+        """画面を塗りつぶす. それまでに積まれた命令は全て隠れるので捨てる"""
+        self.stats["hidden"] += len(self.commands)
+        self.commands = []
+        self.clear_color = col
+
+    def _submit(self, layer, sublayer, bank, kind, x, y, w, h, opaque, args):
+        self.stats["submitted"] += 1
+        # 幅や高さが負の場合は反転して描くだけで、描画される範囲は変わらない
+        left = x
+        top = y
+        right = x + abs(w)
+        bottom = y + abs(h)
+        if right <= 0 or bottom <= 0 or left >= self.width or top >= self.height:
+            self.stats["culled"] += 1
+            return
+        self.commands.append(
+            (
+                layer,
+                sublayer,
+                bank,
+                len(self.commands),
+                kind,
+                (left, top, right, bottom),
+                opaque,
+                args,
+            )
+        )
+
+    def blt(self, layer, x, y, img, u, v, w, h, colkey=None, sublayer: int = 0):
+        bank = img if isinstance(img, int) else id(img)
+        self._submit(
+            layer,
+            sublayer,
+            bank,
+            CMD_BLT,
+            x,
+            y,
+            w,
+            h,
+            colkey is None,
+            (x, y, img, u, v, w, h, colkey),
+        )
+
+    def bltm(self, layer, x, y, tm, u, v, w, h, colkey=None, sublayer: int = 0):
+        bank = tm if isinstance(tm, int) else id(tm)
+        self._submit(
+            layer,
+            sublayer,
+            bank,
+            CMD_BLTM,
+            x,
+            y,
+            w,
+            h,
+            colkey is None,
+            (x, y, tm, u, v, w, h, colkey),
+        )
+
+    def text(self, layer, x, y, s: str, col: int, sublayer: int = 0):
+        width = max(len(line) for line in s.split("\n")) * FONT_WIDTH
+        height = (s.count("\n") + 1) * FONT_HEIGHT
+        self._submit(
+            layer, sublayer, _TEXT_BANK, CMD_TEXT, x, y, width, height, False, (x, y, s, col)
+        )
+
+    def rect(self, layer, x, y, w, h, col: int, sublayer: int = 0):
+        if w <= 0 or h <= 0:
+            self.stats["submitted"] += 1
+            self.stats["culled"] += 1
+            return
+        self._submit(layer, sublayer, _RECT_BANK, CMD_RECT, x, y, w, h, True, (x, y, w, h, col))
+
+    def resolve(self) -> list:
+        """描画する命令を描画順に返す"""
+        # 同じサブレイヤーの中では積まれた順 (後に積まれたものが上)
+        commands = sorted(self.commands, key=lambda command: (command[0], command[1], command[3]))
+
+        # 画像バンクの異なる命令と重ならない間だけ並びを伸ばし、並びの中を画像バンクの順に並べ替える
+        batched = []
+        run = []
+        for command in commands:
+            if run and (
+                command[0] != run[0][0]
+                or command[1] != run[0][1]
+                or len(run) >= MAX_BATCH_RUN
+                or self._overlaps_other_bank(command, run)
+            ):
+                run.sort(key=lambda command: (command[2], command[3]))
+                batched += run
+                run = []
+            run.append(command)
+        run.sort(key=lambda command: (command[2], command[3]))
+        batched += run
+        commands = batched
+
+        # 同じレイヤーに積まれた全く同じ命令は1度だけ描く
+        unique = []
+        seen = set()
+        for command in commands:
+            args = command[7]
+            key = (command[0], command[1], command[4]) + tuple(
+                arg if isinstance(arg, (int, float, str, type(None))) else id(arg) for arg in args
+            )
+            if key in seen:
+                self.stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            unique.append(command)
+
+        # 後から描かれる不透明な命令に完全に覆われる命令は描かない.
+        # 判定する命令の数が増えても1つの命令あたりの比較が一定になるよう、覆う側は面積の大きい MAX_COVERS 個に限る
+        visible = []
+        covers = []
+        areas = []
+        for command in reversed(unique):
+            rect = command[5]
+            left, top, right, bottom = rect
+            hidden = False
+            for c_left, c_top, c_right, c_bottom in covers:
+                if c_left <= left and c_top <= top and right <= c_right and bottom <= c_bottom:
+                    hidden = True
+                    break
+            if hidden:
+                self.stats["hidden"] += 1
+                continue
+            if command[6]:
+                area = (right - left) * (bottom - top)
+                if len(covers) < MAX_COVERS:
+                    covers.append(rect)
+                    areas.append(area)
+                else:
+                    smallest = areas.index(min(areas))
+                    if area > areas[smallest]:
+                        covers[smallest] = rect
+                        areas[smallest] = area
+            visible.append(command)
+        visible.reverse()
+        return visible
+
+    @staticmethod
+    def _overlaps_other_bank(command: tuple, run: list) -> bool:
+        """command が run の中の画像バンクの異なる命令と重なるか (重なる場合は描く順番を入れ替えられない)"""
+        bank = command[2]
+        rect = command[5]
+        for other in run:
+            if other[2] != bank and _overlaps(rect, other[5]):
+                return True
+        return False
+
+    def flush(self, target):
+        """積まれた命令を描画先に描き、バッファを空にする
+
+        Args:
+            target: 描画先 (pyxel モジュール、または pyxel.Image)
+        """
+        self.drawn = self.resolve()
+        self.stats["drawn"] = len(self.drawn)
+        self.last_stats = self.stats
+        if self.clear_color is not None:
+            target.cls(self.clear_color)
+        for command in self.drawn:
+            kind = command[4]
+            args = command[7]
+            if kind == CMD_BLT:
+                target.blt(*args)
+            elif kind == CMD_BLTM:
+                target.bltm(*args)
+            elif kind == CMD_TEXT:
+                target.text(*args)
+            else:
+                target.rect(*args)
+        self.clear()
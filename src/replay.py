@@ -0,0 +1,214 @@
+from dataclasses import fields
+import struct
+import time
+import zlib
+import pyxel
+from component import *
+
+# 記録する軸の入力 (SysPlayerControl / SysPlayerAnimation が btnv で読み取るもの)
+REPLAY_AXES = (pyxel.GAMEPAD1_AXIS_LEFTX, pyxel.GAMEPAD1_AXIS_LEFTY)
+
+# ファイルの先頭: マジック, バージョン, フラグ, アクション名の長さ
+_HEADER = struct.Struct("<4sBBH")
+_MAGIC = b"PXRP"
+_VERSION = 1
+_FLAG_STATE_HASH = 1
+# 1フレーム分: アクションのビットマスク, 軸の値 (とフラグがあれば状態のハッシュ)
+_FRAME = struct.Struct("<H" + "h" * len(REPLAY_AXES))
+_FRAME_WITH_HASH = struct.Struct("<H" + "h" * len(REPLAY_AXES) + "I")
+
+
+class ReplayDesyncError(Exception):
+    """再生中のワールドの状態が記録時と一致しなかったことを表す例外"""
+
+    def __init__(self, frame: int, expected: int, actual: int) -> None:
+        super().__init__(
+            f"replay desynced at frame {frame}: expected state {expected:08x}, got {actual:08x}"
+        )
+        self.frame = frame
+        self.expected = expected
+        self.actual = actual
+
+
+def get_action_names(actions_map) -> list[str]:
+    """ActionMap (Input など) のアクション名を定義順に返す"""
+    return [f.name for f in fields(actions_map)]
+
+
+def hash_world_state(world) -> int:
+    """エンティティの位置・速度とステージの状態から、フレームごとの比較に使うハッシュを計算する
+
+    Args:
+        world (World): ワールド
+
+    Returns:
+        int: 32ビットのハッシュ値
+    """
+    values = []
+    for entity, position in sorted(world.get_component(Position2D), key=lambda item: item[0]):
+        values += (entity, position.x, position.y)
+    for entity, velocity in sorted(world.get_component(Velocity2D), key=lambda item: item[0]):
+        values += (entity, velocity.x, velocity.y)
+    for entity, stage_state in world.get_component(StageState):
+        values += (
+            stage_state.is_goal,
+            stage_state.game_over,
+            stage_state.time_remaining,
+            stage_state.coins,
+            stage_state.lives,
+        )
+    return zlib.crc32(struct.pack(f"<{len(values)}d", *values))
+
+
+class InputRecorder:
+    """別の入力ソースをラップし、フレームごとに解決済みのアクションと軸の値を記録する入力ソース
+    source: 実際に入力を読み取る入力ソース
+    actions_map: アクションの定義 (Input)
+    hash_state: フレームごとにワールドの状態のハッシュも記録する
+    """
+
+    def __init__(self, source, actions_map, hash_state: bool = True) -> None:
+        self.source = source
+        self.action_names = get_action_names(actions_map)
+        self.hash_state = hash_state
+        self.frames = bytearray()
+        self.frame_count = 0
+
+    def poll(self, keys):
+        self.source.poll(keys)
+
+    def update(self):
+        self.source.update()
+
+    def btn(self, key: int) -> bool:
+        return self.source.btn(key)
+
+    def btnp(self, key: int) -> bool:
+        return self.source.btnp(key)
+
+    def btnv(self, key: int) -> int:
+        return self.source.btnv(key)
+
+    def end_frame(self, world):
+        self.source.end_frame(world)
+        mask = 0
+        for i, name in enumerate(self.action_names):
+            if getattr(world.actions, name):
+                mask |= 1 << i
+        axes = [self.source.btnv(axis) for axis in REPLAY_AXES]
+        if self.hash_state:
+            self.frames += _FRAME_WITH_HASH.pack(mask, *axes, hash_world_state(world))
+        else:
+            self.frames += _FRAME.pack(mask, *axes)
+        self.frame_count += 1
+
+    def to_bytes(self) -> bytes:
+        names = ",".join(self.action_names).encode()
+        flags = _FLAG_STATE_HASH if self.hash_state else 0
+        return _HEADER.pack(_MAGIC, _VERSION, flags, len(names)) + names + bytes(self.frames)
+
+    def save(self, filepath: str):
+        with open(filepath, "wb") as f:
+            f.write(self.to_bytes())
+
+
+class ReplayInputSource:
+    """InputRecorder の記録を読み込み、実際の入力の代わりに返す入力ソース
+    記録されているのは解決済みのアクションなので、各アクションに割り当てられたキーにはアクションの値をそのまま返す。
+    data: 記録のファイルパス、またはバイト列
+    actions_map: アクションの定義 (Input)
+    realtime: True の場合は fps に合わせて待機し、False の場合は CPU が許す限りの速さで再生する
+    verify: 記録された状態のハッシュと毎フレーム比較する
+    strict: True の場合は不一致で ReplayDesyncError を送出し、False の場合は mismatches に記録する
+    quit_at_end: 記録の最後のフレームを再生したらワールドの quit を呼ぶ
+    """
+
+    def __init__(
+        self,
+        data,
+        actions_map,
+        realtime: bool = False,
+        fps: int = 60,
+        verify: bool = True,
+        strict: bool = True,
+        quit_at_end: bool = True,
+    ) -> None:
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        magic, version, flags, names_length = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("unsupported replay data")
+        offset = _HEADER.size
+        self.action_names = data[offset : offset + names_length].decode().split(",")
+        offset += names_length
+        self.has_hash = bool(flags & _FLAG_STATE_HASH)
+        frame_struct = _FRAME_WITH_HASH if self.has_hash else _FRAME
+        self.records = list(frame_struct.iter_unpack(memoryview(data)[offset:]))
+
+        # キー -> そのキーが割り当てられたアクションのビット
+        self.key_bits = {}
+        for name in get_action_names(actions_map):
+            if name not in self.action_names:
+                continue
+            bit = 1 << self.action_names.index(name)
+            for key in getattr(actions_map, name)[1:]:
+                self.key_bits[key] = bit
+
+        self.realtime = realtime
+        self.frame_time = 1 / fps
+        self.verify = verify and self.has_hash
+        self.strict = strict
+        self.quit_at_end = quit_at_end
+        self.mismatches = []
+        self.frame = -1
+        self.mask = 0
+        self.axes = {}
+        self.next_time = None
+
+    @property
+    def finished(self) -> bool:
+        return self.frame >= len(self.records) - 1
+
+    def poll(self, keys):
+        pass
+
+    def update(self):
+        if self.realtime:
+            now = time.perf_counter()
+            if self.next_time is None:
+                self.next_time = now
+            elif now < self.next_time:
+                time.sleep(self.next_time - now)
+            self.next_time += self.frame_time
+
+        self.frame += 1
+        if self.frame < len(self.records):
+            record = self.records[self.frame]
+            self.mask = record[0]
+            self.axes = dict(zip(REPLAY_AXES, record[1 : 1 + len(REPLAY_AXES)]))
+        else:
+            self.mask = 0
+            self.axes = {}
+
+    def btn(self, key: int) -> bool:
+        return self.mask & self.key_bits.get(key, 0) != 0
+
+    def btnp(self, key: int) -> bool:
+        return self.btn(key)
+
+    def btnv(self, key: int) -> int:
+        return self.axes.get(key, 0)
+
+    def end_frame(self, world):
+        if self.frame >= len(self.records):
+            return
+        if self.verify:
+            expected = self.records[self.frame][-1]
+            actual = hash_world_state(world)
+            if expected != actual:
+                if self.strict:
+                    raise ReplayDesyncError(self.frame, expected, actual)
+                self.mismatches.append(self.frame)
+        if self.quit_at_end and self.finished:
+            world.quit()
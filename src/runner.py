@@ -0,0 +1,223 @@
+"""ウィンドウなしのワールドを複数のプロセスで並列に実行するランナー
+
+main.py の setup_game で構築したワールドを、スクリプトまたは乱数の入力で決まったフレーム数だけ実行し、
+ゴールの到達数・死亡数・コイン数・コアあたりのフレームレートを集計する。レベルの自動検証やファジングに使う。
+
+Usage (リポジトリのルートから実行):
+    python src/runner.py --worlds 64 --frames 3600
+    python src/runner.py --worlds 1000 --frames 600 --processes 16 --seed 42 --output fuzz_results.json
+"""
+
+from dataclasses import asdict, dataclass
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+
+@dataclass
+class WorldRun:
+    """1つのワールドの実行設定
+    seed: 乱数の入力のシード (script を指定した場合は結果の識別にだけ使う)
+    frames: 実行するフレーム数
+    script: ScriptedInputSource のスクリプト (フレームごとの {キー: 値} のリスト). None の場合は乱数の入力を使う
+    vectorized_motion: 重力・移動・位置更新を NumPy の配列演算で処理する
+    stream_chunks: 敵とコインをプレイヤーの周囲のチャンクの分だけスポーンする
+    activity_radius: プレイヤーからこの距離 (ピクセル) より離れた敵をスリープさせる. None の場合はスリープさせない
+    """
+
+    seed: int = 0
+    frames: int = 3600
+    script: list = None
+    vectorized_motion: bool = False
+    stream_chunks: bool = False
+    activity_radius: int = None
+
+
+def make_fuzz_runs(count: int, frames: int, seed: int = 0, **kwargs) -> list[WorldRun]:
+    """シードだけが異なる乱数の入力の実行設定を count 個作る関数
+
+    Args:
+        count (int): ワールドの数
+        frames (int): 1つのワールドで実行するフレーム数
+        seed (int, optional): 最初のワールドのシード. Defaults to 0.
+        **kwargs: WorldRun のその他の設定
+
+    Returns:
+        list[WorldRun]: 実行設定のリスト
+    """
+    return [WorldRun(seed=seed + i, frames=frames, **kwargs) for i in range(count)]
+
+
+def run_world(run: WorldRun) -> dict:
+    """1つのワールドをウィンドウなしで実行し、結果を返す関数 (プールのワーカーで呼ばれる)
+
+    Args:
+        run (WorldRun): 実行設定
+
+    Returns:
+        dict: ゴールの到達数、死亡数、取得したコイン数、実行時間などの結果
+    """
+    # pyxel などの重いモジュールはワーカーのプロセスで初めて読み込む
+    from events import CoinCollected, GameOver, GoalReached, LifeLost
+    from input import RandomInputSource, ScriptedInputSource
+    from main import Game, setup_game
+
+    if run.script is None:
+        input_source = RandomInputSource(run.seed)
+    else:
+        input_source = ScriptedInputSource(run.script)
+    game = Game(headless=True, input_source=input_source)
+    setup_game(
+        game,
+        vectorized_motion=run.vectorized_motion,
+        stream_chunks=run.stream_chunks,
+        activity_radius=run.activity_radius,
+    )
+
+    result = {
+        "seed": run.seed,
+        "frames": 0,
+        "goals": 0,
+        "first_goal_frame": None,
+        "deaths": 0,
+        "game_overs": 0,
+        "coins": 0,
+    }
+
+    # ステージの状態をフレームごとに調べる代わりに、状態が変わったときのイベントを数える
+    def on_goal_reached(event):
+        result["goals"] += 1
+        if result["first_goal_frame"] is None:
+            # イベントはフレームの処理の中で配信されるため、frame_count はまだ進んでいない
+            result["first_goal_frame"] = game.frame_count + 1
+
+    def count(key):
+        def handler(event):
+            result[key] += 1
+
+        return handler
+
+    game.events.subscribe(GoalReached, on_goal_reached)
+    game.events.subscribe(LifeLost, count("deaths"))
+    game.events.subscribe(GameOver, count("game_overs"))
+    game.events.subscribe(CoinCollected, count("coins"))
+
+    start = time.perf_counter()
+    while game.running and game.frame_count < run.frames:
+        game.process()
+    elapsed = time.perf_counter() - start
+
+    result["frames"] = game.frame_count
+    result["elapsed_s"] = elapsed
+    result["fps"] = game.frame_count / elapsed if elapsed > 0 else 0.0
+    result["pid"] = os.getpid()
+    return result
+
+
+def summarize(results: list[dict], wall_s: float, processes: int) -> dict:
+    """ワールドごとの結果を集計する関数
+
+    Args:
+        results (list[dict]): run_world の結果のリスト
+        wall_s (float): 全体の実行にかかった時間 (秒)
+        processes (int): プロセスの数
+
+    Returns:
+        dict: 合計と、全体およびコアあたりのフレームレート
+    """
+    frames = sum(result["frames"] for result in results)
+    busy_s = sum(result["elapsed_s"] for result in results)
+    return {
+        "worlds": len(results),
+        "processes": processes,
+        "frames": frames,
+        "goals": sum(result["goals"] for result in results),
+        "worlds_reached_goal": sum(1 for result in results if result["goals"] > 0),
+        "deaths": sum(result["deaths"] for result in results),
+        "game_overs": sum(result["game_overs"] for result in results),
+        "coins": sum(result["coins"] for result in results),
+        "wall_s": wall_s,
+        "fps": frames / wall_s if wall_s > 0 else 0.0,
+        "fps_per_core": frames / busy_s if busy_s > 0 else 0.0,
+    }
+
+
+def run_worlds(runs: list[WorldRun], processes: int = None) -> dict:
+    """複数のワールドをプロセスプールで並列に実行し、集計した結果を返す関数
+
+    Args:
+        runs (list[WorldRun]): 実行設定のリスト
+        processes (int, optional): プロセスの数. Defaults to CPU のコア数.
+
+    Returns:
+        dict: "summary" に集計、"worlds" に実行設定の順に並べたワールドごとの結果
+    """
+    processes = processes or os.cpu_count() or 1
+    processes = max(min(processes, len(runs)), 1)
+    start = time.perf_counter()
+    if processes == 1:
+        results = [run_world(run) for run in runs]
+    else:
+        # 親プロセスで pyxel のウィンドウを作っていても安全なように、fork ではなく spawn でワーカーを起動する
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes) as pool:
+            results = pool.map(run_world, runs, chunksize=1)
+    wall_s = time.perf_counter() - start
+    for run, result in zip(runs, results):
+        result["run"] = asdict(run)
+        result["run"].pop("script")
+    return {"summary": summarize(results, wall_s, processes), "worlds": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--worlds", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--frames", type=int, default=3600)
+    parser.add_argument("--processes", type=int, default=None, help="defaults to the cpu count")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first world")
+    parser.add_argument(
+        "--vectorized-motion", action="store_true", help="use the numpy motion systems"
+    )
+    parser.add_argument(
+        "--stream-chunks", action="store_true", help="spawn enemies and coins per level chunk"
+    )
+    parser.add_argument(
+        "--activity-radius",
+        type=int,
+        default=None,
+        help="put enemies farther than this from the player to sleep (default: off)",
+    )
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    args = parser.parse_args()
+
+    runs = make_fuzz_runs(
+        args.worlds,
+        args.frames,
+        args.seed,
+        vectorized_motion=args.vectorized_motion,
+        stream_chunks=args.stream_chunks,
+        activity_radius=args.activity_radius,
+    )
+    report = run_worlds(runs, args.processes)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    summary = report["summary"]
+    print(
+        f"worlds={summary['worlds']} processes={summary['processes']} "
+        f"frames={summary['frames']} wall={summary['wall_s']:.2f}s"
+    )
+    print(
+        f"goals={summary['goals']} (worlds {summary['worlds_reached_goal']}) "
+        f"deaths={summary['deaths']} game_overs={summary['game_overs']} coins={summary['coins']}"
+    )
+    print(f"fps={summary['fps']:.0f} fps_per_core={summary['fps_per_core']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
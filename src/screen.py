@@ -1,21 +1,119 @@
 from pigframe import Screen
 import pyxel
 from component import *
+from utils import get_camera_offset, interpolate_position, query_visible_entities
+from animation import sample_animation
+from profiler import FRAME_BUDGET_MS, HISTOGRAM_EDGES_MS
 
 
 class ScTileMaps(Screen):
-    """タイルマップを描画するスクリーン"""
+    """タイルマップを描画するスクリーン
+    変化しないレイヤーは、描画順で連続するものごとに chunk_width 幅のチャンク単位でオフスクリーンの画像へ合成しておき、
+    毎フレームは画面に映るチャンクを転送する。合成済みの画像は画面の周囲のチャンクの分だけを保持するため、
+    レベルの長さによらずメモリ使用量は変わらない。ゴールマーカーと DynamicTileMap のレイヤーは毎フレーム描画する。
+    chunk_width: 合成するチャンクの幅 (ピクセル)
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
+        self.chunk_width = kwargs.get("chunk_width", 8 * 16)
+        self.tilemaps = None
+        # (合成するか, タイルマップIDのリスト) を描画順に並べたもの
+        self.layers = []
+        # (レイヤーの番号, チャンク番号) -> 合成済みの画像
+        self.chunk_images = {}
+        self.first_chunk = None
+        # 合成済みの画像を作ったときのワールドの tile_revision
+        self.tile_revision = 0
+
+    def is_dynamic(self, entity: int) -> bool:
+        return self.world.has_component(entity, GoalMarkerTileMap) or self.world.has_component(
+            entity, DynamicTileMap
+        )
+
+    def build_layers(self, tilemaps):
+        self.tilemaps = tilemaps
+        self.layers = []
+        self.chunk_images = {}
+        static_ids = []
+        for entity, tilemap in tilemaps:
+            if self.is_dynamic(entity):
+                if static_ids:
+                    self.layers.append((True, static_ids))
+                    static_ids = []
+                self.layers.append((False, [tilemap.id]))
+            else:
+                static_ids.append(tilemap.id)
+        if static_ids:
+            self.layers.append((True, static_ids))
+
+    def composite(self, tilemap_ids: list[int], chunk: int):
+        """チャンクの範囲のタイルマップを描画順に重ねた画像を作る"""
+        height = max(self.world.tilemaps[i].height * 8 for i in tilemap_ids)
+        image = pyxel.Image(self.chunk_width, height)
+        for tilemap_id in tilemap_ids:
+            image.bltm(0, 0, tilemap_id, chunk * self.chunk_width, 0, self.chunk_width, height, 0)
+        return image
+
+    def evict(self, first_chunk: int, last_chunk: int):
+        """画面の前後1チャンクより離れたチャンクの画像を捨てる"""
+        self.chunk_images = {
+            key: image
+            for key, image in self.chunk_images.items()
+            if first_chunk - 1 <= key[1] <= last_chunk + 1
+        }
 
     def draw(self):
-        player_ent, (_, player_pos) = self.world.get_components(Player, Position2D)[0]
-        camera_x = player_pos.x - pyxel.width // 2
-        camera_y = 0
-
-        for entity, tilemap in self.world.get_component(TileMap):
-            pyxel.bltm(0, 0, tilemap.id, camera_x, camera_y, pyxel.width, pyxel.height, 0)
+        camera_x, camera_y = get_camera_offset(self.world)
+        buffer = self.world.render_buffer
+
+        tilemaps = self.world.get_component(TileMap)
+        if tilemaps is not self.tilemaps:
+            self.build_layers(tilemaps)
+        if self.world.tile_revision != self.tile_revision:
+            # タイルが書き換えられたら合成済みの画像を作り直す
+            self.tile_revision = self.world.tile_revision
+            self.chunk_images = {}
+
+        first_chunk = int(camera_x // self.chunk_width)
+        last_chunk = int((camera_x + buffer.width - 1) // self.chunk_width)
+        if first_chunk != self.first_chunk:
+            self.first_chunk = first_chunk
+            self.evict(first_chunk, last_chunk)
+
+        for layer, (cached, tilemap_ids) in enumerate(self.layers):
+            if not cached:
+                for tilemap_id in tilemap_ids:
+                    buffer.bltm(
+                        self.priority,
+                        0,
+                        0,
+                        tilemap_id,
+                        camera_x,
+                        camera_y,
+                        buffer.width,
+                        buffer.height,
+                        0,
+                        sublayer=layer,
+                    )
+                continue
+            for chunk in range(first_chunk, last_chunk + 1):
+                image = self.chunk_images.get((layer, chunk))
+                if image is None:
+                    image = self.chunk_images[(layer, chunk)] = self.composite(tilemap_ids, chunk)
+                x = chunk * self.chunk_width - camera_x
+                buffer.blt(
+                    self.priority,
+                    x,
+                    0,
+                    image,
+                    0,
+                    camera_y,
+                    self.chunk_width,
+                    buffer.height,
+                    0,
+                    sublayer=layer,
+                )
 
 
 class ScPlayer(Screen):
@@ -28,28 +126,67 @@ class ScPlayer(Screen):
         for entity, (_, position, body, animation) in self.world.get_components(
             Player, Position2D, RectRigidBody, Animation
         ):
+            x, y = interpolate_position(self.world, position)
+            sprite_x, sprite_y = sample_animation(self.world, animation)
             # Draw player with animation
-            pyxel.blt(
-                pyxel.width // 2,
-                position.y,
+            self.world.render_buffer.blt(
+                self.priority,
+                self.world.render_buffer.width // 2,
+                y,
                 0,  # image bank
-                animation.sprite_x,  # sprite x in tileset
-                animation.sprite_y,  # sprite y in tileset
+                sprite_x,  # sprite x in tileset
+                sprite_y,  # sprite y in tileset
                 -body.width if body.flip_x else body.width,  # width (negative for left flip)
                 body.height,  # height
                 0,  # colorkey
             )
 
 
-class ScStageClock(Screen):
-    """ステージの残り時間を描画するスクリーン"""
+class ScHud(Screen):
+    """残り時間、残りライフ、コインの数を表示するスクリーン
+    HUD はオフスクリーンの画像に描いておき、毎フレームはその画像を1回転送するだけにする。
+    画像を描き直すのは、画面に表示する値 (0.1秒単位の残り時間、ライフ、コインの数) が変わったときだけ。
+    height: HUD の画像の高さ (ピクセル)
+    """
 
-    def __init__(self, world, priority: int = 0) -> None:
-        super().__init__(world, priority)
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+        self.height = kwargs.get("height", 8 * 2)
+        self.image = None
+        # 画像に描いてある値 (残り時間の文字列, ライフ, コインの数)
+        self.shown = None
+        self.redraws = 0
 
     def draw(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        pyxel.text(2, 2, f"TIME: {stage_state.time_remaining:.1f}", 1)
+        stage_state_entity, stage_state = self.world.get_singleton(StageState)
+        values = (f"{stage_state.time_remaining:.1f}", stage_state.lives, int(stage_state.coins))
+        buffer = self.world.render_buffer
+        if self.image is None:
+            self.image = pyxel.Image(buffer.width, self.height)
+        if values != self.shown:
+            self.redraw(*values)
+            self.shown = values
+        buffer.blt(self.priority, 0, 0, self.image, 0, 0, buffer.width, self.height, 0)
+
+    def redraw(self, time_text: str, lives: int, coins: int):
+        """HUD の画像を描き直す (色 0 は透明として転送する)"""
+        image = self.image
+        image.cls(0)
+        # 残り時間
+        image.text(2, 2, f"TIME: {time_text}", 1)
+        # 残りライフ
+        life_sprite_x = 8 * 3
+        life_sprite_y = 8 * 0
+        for i in range(lives):
+            image.blt(2 + i * 10, 8, 0, life_sprite_x, life_sprite_y, 8, 8, 0)
+        # コインの数
+        sprite_x = 8 * 4
+        sprite_y = 8 * 0
+        base_x = 38
+        image.blt(base_x, 8, 0, sprite_x, sprite_y, 8, 8, 0)
+        image.text(base_x + 11, 9, "x", 1)
+        image.text(base_x + 16, 9, f"{coins}", 1)
+        self.redraws += 1
 
 
 class ScGameOver(Screen):
@@ -59,11 +196,12 @@ class ScGameOver(Screen):
         super().__init__(world, priority)
 
     def draw(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
+        stage_state_entity, stage_state = self.world.get_singleton(StageState)
         if stage_state.game_over:
             message = "GAME OVER"
-            pos_x = pyxel.width // 2 - len(message)
-            pyxel.text(pos_x, pyxel.height // 2, message, 1)
+            buffer = self.world.render_buffer
+            pos_x = buffer.width // 2 - len(message)
+            buffer.text(self.priority, pos_x, buffer.height // 2, message, 1)
 
 
 class ScGoal(Screen):
@@ -73,35 +211,41 @@ class ScGoal(Screen):
         super().__init__(world, priority)
 
     def draw(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
+        stage_state_entity, stage_state = self.world.get_singleton(StageState)
         if stage_state.is_goal:
             message = "GOAL!"
-            pos_x = pyxel.width // 2 - len(message)
-            pyxel.text(pos_x, pyxel.height // 2, message, 1)
+            buffer = self.world.render_buffer
+            pos_x = buffer.width // 2 - len(message)
+            buffer.text(self.priority, pos_x, buffer.height // 2, message, 1)
 
 
 class ScEnemy(Screen):
-    """敵を描画するスクリーン"""
+    """敵を描画するスクリーン (画面外の敵は空間ハッシュで除外する)"""
 
     def __init__(self, world, priority: int = 0) -> None:
         super().__init__(world, priority)
 
     def draw(self):
-        player_ent, (_, player_pos) = self.world.get_components(Player, Position2D)[0]
-        for entity, (_, position, body, animation) in self.world.get_components(
-            Enemy, Position2D, RectRigidBody, EnemyAnimation
-        ):
-            diff_from_center_x = position.x - player_pos.x
-            diff_from_center_y = position.y
+        camera_x, camera_y = get_camera_offset(self.world)
+        for entity in query_visible_entities(self.world):
+            components = self.world.get_entity_object(entity)
+            if components is None or Enemy not in components or EnemyAnimation not in components:
+                continue
+            position = components[Position2D]
+            body = components[RectRigidBody]
+            animation = components[EnemyAnimation]
+            x, y = interpolate_position(self.world, position)
+            sprite_x, sprite_y = sample_animation(self.world, animation)
             # player の位置を基準に描画
-            local_x = pyxel.width // 2 + diff_from_center_x
-            local_y = diff_from_center_y
-            pyxel.blt(
+            local_x = x - camera_x
+            local_y = y - camera_y
+            self.world.render_buffer.blt(
+                self.priority,
                 local_x,
                 local_y,
                 0,  # image bank
-                animation.sprite_x,  # sprite x in tileset
-                animation.sprite_y,  # sprite y in tileset
+                sprite_x,  # sprite x in tileset
+                sprite_y,  # sprite y in tileset
                 -body.width if body.flip_x else body.width,  # width (negative for left flip)
                 body.height,  # height
                 0,  # colorkey
@@ -120,7 +264,9 @@ class ScDebugColorPalette(Screen):
         for x in range(8):
             for y in range(3):
                 color_id = x + y * 8
-                pyxel.rect(base_x + x * 8, base_y + y * 8, 8, 8, color_id)
+                self.world.render_buffer.rect(
+                    self.priority, base_x + x * 8, base_y + y * 8, 8, 8, color_id
+                )
 
 
 class ScDebugPlayer(Screen):
@@ -131,54 +277,74 @@ class ScDebugPlayer(Screen):
 
     def draw(self):
         for entity, (_, position) in self.world.get_components(Player, Position2D):
-            pyxel.text(50, 2, f"x: {position.x:.1f}, y: {position.y:.1f}", 1)
-
-
-class ScCoin(Screen):
-    """コインを描画するスクリーン"""
-
-    def __init__(self, world, priority: int = 0) -> None:
-        super().__init__(world, priority)
-
-    def draw(self):
-        player_ent, (_, player_pos) = self.world.get_components(Player, Position2D)[0]
-        for entity, (_, state, position, body) in self.world.get_components(
-            Coin, CoinState, Position2D, CircleRigidBody
-        ):
-            if state.is_collected:
-                continue
-            diff_from_center_x = position.x - player_pos.x
-            diff_from_center_y = position.y
-            local_x = pyxel.width // 2 + diff_from_center_x
-            local_y = diff_from_center_y
-            pyxel.blt(local_x, local_y, 0, 16, 8 + 16 * 4, body.radius * 2, body.radius * 2, 0)
+            self.world.render_buffer.text(
+                self.priority, 50, 2, f"x: {position.x:.1f}, y: {position.y:.1f}", 1
+            )
 
 
-class ScLives(Screen):
-    """プレイヤーの残りライフを表示するスクリーン"""
+class ScDebugProfiler(Screen):
+    """プロファイラの計測結果 (処理の重いシステム・スクリーン、フレーム時間のヒストグラム、エンティティ数) を表示するスクリーン
+    rows: 表示するシステム・スクリーンの数
+    frames: 平均を取るフレーム数
+    """
 
-    def __init__(self, world, priority: int = 0) -> None:
-        super().__init__(world, priority)
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+        self.rows = kwargs.get("rows", 6)
+        self.frames = kwargs.get("frames", 60)
 
     def draw(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        life_sprite_x = 8 * 3
-        life_sprite_y = 8 * 0
-        for i in range(stage_state.lives):
-            pyxel.blt(2 + i * 10, 8, 0, life_sprite_x, life_sprite_y, 8, 8, 0)
+        profiler = self.world.profiler
+        buffer = self.world.render_buffer
+        if profiler is None or profiler.frame < 0:
+            return
+        averages = profiler.average_ms(self.frames)
+        frame_ms = sum(averages.values())
+        color = 8 if frame_ms > FRAME_BUDGET_MS else 1
+        index = profiler.index
+        buffer.text(
+            self.priority, 2, 10, f"{frame_ms:.2f}ms ent:{profiler.entity_counts[index]}", color
+        )
+
+        ranking = sorted(averages.items(), key=lambda item: item[1], reverse=True)
+        for row, (name, ms) in enumerate(ranking[: self.rows]):
+            buffer.text(self.priority, 2, 18 + row * 6, f"{ms:5.2f} {name}", 1)
+
+        # フレーム時間のヒストグラム (右端のバーはフレームの予算を超えたもの)
+        histogram = profiler.histogram()
+        total = max(sum(histogram), 1)
+        base_y = 18 + self.rows * 6 + 20
+        for i, count in enumerate(histogram):
+            height = round(16 * count / total)
+            bar_color = 8 if i > 0 and HISTOGRAM_EDGES_MS[i - 1] >= FRAME_BUDGET_MS else 1
+            buffer.rect(self.priority, 2 + i * 5, base_y - height, 4, height, bar_color)
 
 
-class ScCoinCount(Screen):
-    """コインの数を表示するスクリーン"""
+class ScCoin(Screen):
+    """コインを描画するスクリーン (画面外のコインと取得済みのコインは収集アイテムの索引で除外する)"""
 
     def __init__(self, world, priority: int = 0) -> None:
         super().__init__(world, priority)
 
     def draw(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        sprite_x = 8 * 4
-        sprite_y = 8 * 0
-        base_x = 38
-        pyxel.blt(base_x, 8, 0, sprite_x, sprite_y, 8, 8, 0)
-        pyxel.text(base_x + 11, 9, "x", 1)
-        pyxel.text(base_x + 16, 9, f"{int(stage_state.coins)}", 1)
+        camera_x, camera_y = get_camera_offset(self.world)
+        buffer = self.world.render_buffer
+        for entity in query_visible_entities(self.world, CollectibleIndex):
+            components = self.world.get_entity_object(entity)
+            if components is None or Coin not in components:
+                continue
+            position = components[Position2D]
+            body = components[CircleRigidBody]
+            local_x = position.x - camera_x
+            local_y = position.y - camera_y
+            buffer.blt(
+                self.priority,
+                local_x,
+                local_y,
+                0,
+                16,
+                8 + 16 * 4,
+                body.radius * 2,
+                body.radius * 2,
+                0,
+            )
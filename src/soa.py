@@ -0,0 +1,218 @@
+from pigframe import System
+from component import *
+
+try:
+    import numpy as np
+except ImportError:  # numpy はオプション (Web 版など numpy がない環境では従来のシステムを使う)
+    np = None
+
+
+class _ArrayField:
+    """ストアの配列の1要素をコンポーネントの属性として読み書きするディスクリプタ"""
+
+    def __init__(self, array_name: str, cast=float) -> None:
+        self.array_name = array_name
+        self.cast = cast
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return self.cast(getattr(view._store, self.array_name)[view._slot])
+
+    def __set__(self, view, value):
+        getattr(view._store, self.array_name)[view._slot] = value
+
+
+class Position2DView(Position2D):
+    """MotionStore の配列を参照する Position2D"""
+
+    x = _ArrayField("x")
+    y = _ArrayField("y")
+    next_x = _ArrayField("next_x")
+    next_y = _ArrayField("next_y")
+    prev_x = _ArrayField("prev_x")
+    prev_y = _ArrayField("prev_y")
+
+    def __init__(self, store, slot: int) -> None:
+        self._store = store
+        self._slot = slot
+
+
+class Velocity2DView(Velocity2D):
+    """MotionStore の配列を参照する Velocity2D (next_x などの未使用の値は通常の属性として持つ)"""
+
+    x = _ArrayField("vx")
+    y = _ArrayField("vy")
+
+    def __init__(self, store, slot: int, next_x=0, next_y=0, prev_x=0, prev_y=0) -> None:
+        self._store = store
+        self._slot = slot
+        self.next_x = next_x
+        self.next_y = next_y
+        self.prev_x = prev_x
+        self.prev_y = prev_y
+
+
+class CollisionInfoView(CollisionInfo):
+    """MotionStore の配列を参照する CollisionInfo"""
+
+    left = _ArrayField("left", bool)
+    right = _ArrayField("right", bool)
+    top = _ArrayField("top", bool)
+    bottom = _ArrayField("bottom", bool)
+
+    def __init__(self, store, slot: int) -> None:
+        self._store = store
+        self._slot = slot
+
+
+class _DetachedStore:
+    """ストアから取り除かれたエンティティのビューが参照する、1要素だけの値の置き場"""
+
+    def __init__(self, store, slot: int) -> None:
+        for name in store.FLOAT_FIELDS + store.BOOL_FIELDS:
+            setattr(self, name, [getattr(store, name)[slot].item()])
+
+
+class MotionStore:
+    """Position2D と Velocity2D を持つエンティティの値を NumPy の連続した配列で保持するストア
+    ワールド内のコンポーネントは配列を参照するビューに置き換えるため、他のシステムはそのまま動く。
+    """
+
+    FLOAT_FIELDS = ("x", "y", "next_x", "next_y", "prev_x", "prev_y", "vx", "vy")
+    BOOL_FIELDS = ("left", "right", "top", "bottom", "collidable", "movable", "has_collision")
+
+    def __init__(self, capacity: int = 64) -> None:
+        if np is None:
+            raise ImportError("MotionStore requires numpy")
+        self.size = 0
+        self.capacity = capacity
+        self.entities = []
+        self.slots = {}
+        self.views = []
+        self.synced = None
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        for name in self.BOOL_FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=bool))
+
+    def _grow(self):
+        self.capacity *= 2
+        for name in self.FLOAT_FIELDS + self.BOOL_FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def add(self, world, entity: int):
+        """エンティティの値を配列にコピーし、コンポーネントをビューに置き換える"""
+        if self.size == self.capacity:
+            self._grow()
+        slot = self.size
+        self.size += 1
+        self.entities.append(entity)
+        self.slots[entity] = slot
+
+        components = world.get_entity_object(entity)
+        position = components[Position2D]
+        velocity = components[Velocity2D]
+        for name in ("x", "y", "next_x", "next_y", "prev_x", "prev_y"):
+            getattr(self, name)[slot] = getattr(position, name)
+        self.vx[slot] = velocity.x
+        self.vy[slot] = velocity.y
+        self.collidable[slot] = BaseCollidable in components
+        self.movable[slot] = Movable in components
+        self.has_collision[slot] = CollisionInfo in components
+
+        views = [
+            Position2DView(self, slot),
+            Velocity2DView(
+                self, slot, velocity.next_x, velocity.next_y, velocity.prev_x, velocity.prev_y
+            ),
+        ]
+        components[Position2D] = views[0]
+        components[Velocity2D] = views[1]
+        if CollisionInfo in components:
+            collision_info = components[CollisionInfo]
+            views.append(CollisionInfoView(self, slot))
+            for name in ("left", "right", "top", "bottom"):
+                getattr(self, name)[slot] = getattr(collision_info, name)
+            components[CollisionInfo] = views[2]
+        self.views.append(views)
+
+    def remove(self, entity: int):
+        """エンティティを取り除き、末尾の要素を空いたスロットに移す"""
+        slot = self.slots.pop(entity)
+        last = self.size - 1
+        # 無効化されたエンティティは後で再び有効になることがあるため、ビューは最後の値を保持させておく
+        detached = _DetachedStore(self, slot)
+        for view in self.views[slot]:
+            view._store = detached
+            view._slot = 0
+        if slot != last:
+            for name in self.FLOAT_FIELDS + self.BOOL_FIELDS:
+                array = getattr(self, name)
+                array[slot] = array[last]
+            moved = self.entities[last]
+            self.entities[slot] = moved
+            self.slots[moved] = slot
+            self.views[slot] = self.views[last]
+            for view in self.views[slot]:
+                view._slot = slot
+        self.entities.pop()
+        self.views.pop()
+        self.size = last
+
+    def sync(self, world):
+        """ワールドで追加・削除されたエンティティをストアに反映する
+        pigframe はエンティティが変わるまで同じ検索結果のリストを返すので、変化がなければ何もしない。
+        """
+        movers = world.get_components(Position2D, Velocity2D)
+        if movers is self.synced:
+            return
+        alive = {entity for entity, _ in movers}
+        for entity in [entity for entity in self.entities if entity not in alive]:
+            self.remove(entity)
+        for entity, _ in movers:
+            if entity not in self.slots:
+                self.add(world, entity)
+        # ビューへの置き換え後の検索結果を保持する
+        world.clear_component_cache()
+        self.synced = world.get_components(Position2D, Velocity2D)
+
+
+class SysSimulateGravityVectorized(System):
+    """SysSimulateGravity を MotionStore の配列演算で処理するシステム
+    gravity: 重力の強さ
+    max_fall_speed: 最大落下速度
+    """
+
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+        self.gravity = kwargs.get("gravity", 0.2)
+        self.max_fall_speed = kwargs.get("max_fall_speed", 4.0)
+
+    def process(self):
+        store_entity, store = self.world.get_singleton(MotionStore)
+        store.sync(self.world)
+        n = store.size
+        collidable = store.collidable[:n]
+        vy = store.vy[:n]
+        vy[collidable] = np.minimum(vy[collidable] + self.gravity, self.max_fall_speed)
+
+
+class SysUpdatePositionVectorized(System):
+    """SysUpdatePosition を MotionStore の配列演算で処理するシステム"""
+
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+
+    def process(self):
+        store_entity, store = self.world.get_singleton(MotionStore)
+        store.sync(self.world)
+        n = store.size
+        movable = store.movable[:n]
+        store.prev_x[:n] = np.where(movable, store.x[:n], store.prev_x[:n])
+        store.prev_y[:n] = np.where(movable, store.y[:n], store.prev_y[:n])
+        store.x[:n] = np.where(movable, store.next_x[:n], store.x[:n])
+        store.y[:n] = np.where(movable, store.next_y[:n], store.y[:n])
@@ -1,5 +1,13 @@
 from pigframe import World
 from component import *
+from animation import ENEMY_SPECIES_CLIPS, AnimationTable, get_animation_clock
+from utils import (
+    add_to_collectible_index,
+    build_tile_collision_grid,
+    get_chunk_index,
+    get_min_activity_radius,
+    get_tile_collision_layers,
+)
 
 
 def spawn_player(
@@ -48,6 +56,119 @@ def spawn_collidable_tilemap(world: World, tilemap_id: int, surface_height: int)
     return entity
 
 
+def spawn_tile_collision_grid(world: World):
+    """衝突可能なタイルマップを統合した衝突判定用グリッドをスポーンする関数
+
+    衝突可能なタイルマップをすべてスポーンした後に呼び出すこと。
+
+    Args:
+        world (World): ゲームのワールド
+    """
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, TileCollisionGrid)
+    grid = world.get_entity_object(entity)[TileCollisionGrid]
+    build_tile_collision_grid(
+        grid, get_tile_collision_layers(world), world.tilemaps, world.tile_revision
+    )
+    return entity
+
+
+def spawn_spatial_hash_grid(world: World, cell_size: int = 16):
+    """エンティティ同士の衝突判定に使う空間ハッシュをスポーンする関数
+
+    Args:
+        world (World): ゲームのワールド
+        cell_size (int, optional): セルの大きさ (ピクセル). Defaults to 16.
+    """
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, SpatialHashGrid, cell_size=cell_size)
+    return entity
+
+
+def spawn_collectible_index(world: World, cell_size: int = 8):
+    """収集アイテムの索引をスポーンする関数
+
+    この後にスポーンしたコインは自動的に索引に登録されるため、コインより先に呼び出すこと。
+
+    Args:
+        world (World): ゲームのワールド
+        cell_size (int, optional): セルの大きさ (ピクセル). Defaults to 8.
+    """
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, CollectibleIndex, cell_size=cell_size)
+    return entity
+
+
+def spawn_level_chunks(
+    world: World,
+    enemy_positions: list[tuple[int, int]],
+    coin_positions: list[tuple[int, int]],
+    chunk_width: int = 8 * 16,
+    radius: int = 2,
+):
+    """敵とコインをチャンクごとに分けて保持する LevelChunks をスポーンする関数
+
+    敵とコインはここではスポーンせず、SysStreamChunks がプレイヤーの周囲のチャンクの分だけスポーンする。
+
+    Args:
+        world (World): ゲームのワールド
+        enemy_positions (list[tuple[int, int]]): 敵の初期位置
+        coin_positions (list[tuple[int, int]]): コインの位置
+        chunk_width (int, optional): チャンクの幅 (ピクセル). Defaults to 8 * 16.
+        radius (int, optional): プレイヤーのいるチャンクから左右いくつ先までを有効にするか. Defaults to 2.
+    """
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, LevelChunks, chunk_width=chunk_width, radius=radius)
+    chunks = world.get_entity_object(entity)[LevelChunks]
+    for kind, positions in (("enemy", enemy_positions), ("coin", coin_positions)):
+        for x, y in positions:
+            chunk = get_chunk_index(x, chunk_width)
+            chunks.spawns.setdefault(chunk, []).append((kind, x, y))
+    return entity
+
+
+def spawn_activity_region(world: World, radius: int = 8 * 32, margin: int = 16):
+    """プレイヤーから離れたエンティティをスリープさせる範囲をスポーンする関数
+
+    画面に映るエンティティがスリープしないよう、radius は get_min_activity_radius の値以上に切り上げる。
+
+    Args:
+        world (World): ゲームのワールド
+        radius (int, optional): シミュレーションする範囲 (ピクセル). Defaults to 8 * 32.
+        margin (int, optional): スリープさせるまでの余裕 (ピクセル). Defaults to 16.
+    """
+    radius = max(radius, get_min_activity_radius(world))
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, ActivityRegion, radius=radius, margin=margin)
+    return entity
+
+
+def spawn_animation_table(world: World):
+    """アニメーションのクリップの参照用の配列と時計を持つ AnimationTable をスポーンする関数
+
+    Args:
+        world (World): ゲームのワールド
+    """
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, AnimationTable)
+    return entity
+
+
+def spawn_motion_store(world: World):
+    """Position2D と Velocity2D を NumPy の配列で保持する MotionStore をスポーンする関数 (numpy が必要)
+
+    Args:
+        world (World): ゲームのワールド
+    """
+    # numpy の import は重いため、使うときだけ読み込む
+    from soa import MotionStore
+
+    entity = world.create_entity()
+    world.add_component_to_entity(entity, MotionStore)
+    world.get_entity_object(entity)[MotionStore].sync(world)
+    return entity
+
+
 def spawn_background(world: World, tilemap_id: int):
     """背景をスポーンする関数
 
@@ -75,7 +196,11 @@ def spawn_goal_marker_tilemap(world: World, tilemap_id: int):
 
 
 def spawn_stage(
-    world: World, id: int, time_remaining: float, init_enemy_positions: list[tuple[int, int]]
+    world: World,
+    id: int,
+    time_remaining: float,
+    init_enemy_positions: list[tuple[int, int]],
+    spawn_enemies: bool = True,
 ):
     """ステージをスポーンする関数
 
@@ -84,6 +209,7 @@ def spawn_stage(
         id (int): ステージのID
         time_remaining (float): 残り時間
         init_enemy_positions (list[tuple[int, int]]): 敵の初期位置
+        spawn_enemies (bool, optional): 敵もスポーンする (チャンク単位で読み込む場合は False). Defaults to True.
     """
     entity = world.create_entity()
     world.add_component_to_entity(
@@ -93,10 +219,15 @@ def spawn_stage(
         time_remaining=time_remaining,
         init_enemy_positions=init_enemy_positions,
     )
+    world.add_component_to_entity(entity, EntityPool)
 
-    enemy_entities = []
+    enemy_entities = world.get_entity_object(entity)[EntityPool].enemies
+    if not spawn_enemies:
+        return entity, enemy_entities
     for pos in init_enemy_positions:
-        enemy_entities.append(spawn_enemy(world, 0, pos[0], pos[1]))
+        enemy = spawn_enemy(world, 0, pos[0], pos[1])
+        world.add_component_to_entity(enemy, Pooled)
+        enemy_entities.append(enemy)
     return entity, enemy_entities
 
 
@@ -114,10 +245,18 @@ def spawn_enemy(world: World, species_id: int, x: int, y: int):
     world.add_component_to_entity(entity, Movable)
     world.add_component_to_entity(entity, RectRigidBody, width=16, height=16)
     world.add_component_to_entity(entity, Position2D, x=x, y=y, prev_x=x, prev_y=y)
-    world.add_component_to_entity(entity, Velocity2D, x=0, y=0)
     world.add_component_to_entity(entity, MoveMethodWalk)
+    # 止まっている敵は壁との接触が起きず向きを変えられないため、右向きに歩き始める
+    walk = world.get_entity_object(entity)[MoveMethodWalk]
+    world.add_component_to_entity(entity, Velocity2D, x=walk.speed, y=0)
     world.add_component_to_entity(entity, EnemyState, is_dead=False)
-    world.add_component_to_entity(entity, EnemyAnimation, frame=0, timer=0, is_running=True)
+    world.add_component_to_entity(
+        entity,
+        EnemyAnimation,
+        clip=ENEMY_SPECIES_CLIPS[species_id],
+        start=get_animation_clock(world),
+        is_running=True,
+    )
     world.add_component_to_entity(entity, BaseCollidable)
     world.add_component_to_entity(entity, CollisionInfo)
     return entity
@@ -134,7 +273,8 @@ def spawn_coin(world: World, x: int, y: int):
     entity = world.create_entity()
     world.add_component_to_entity(entity, Collectible)
     world.add_component_to_entity(entity, Coin)
-    world.add_component_to_entity(entity, Position2D, x=x, y=y)
+    world.add_component_to_entity(entity, Position2D, x=x, y=y, prev_x=x, prev_y=y)
     world.add_component_to_entity(entity, CoinState, is_collected=False)
     world.add_component_to_entity(entity, CircleRigidBody, radius=8)
+    add_to_collectible_index(world, entity)
     return entity
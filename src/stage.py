@@ -1,9 +1,272 @@
+from functools import partial
 from spawn import *
+from animation import ENEMY_SPECIES_CLIPS, get_animation_clock
+from events import CoinCollected, GameOver, GoalReached, LifeLost, StageReset
+from level import copy_layers_to_tilemaps
+from utils import (
+    add_to_collectible_index,
+    get_chunk_index,
+    mark_tiles_changed,
+    remove_from_spatial_hash,
+)
 
 
 def reset_stage(world: World, enemy_positions: list[tuple[int, int]]):
-    for pos in enemy_positions:
-        spawn_enemy(world, 0, pos[0], pos[1])
+    chunks = world.get_component(LevelChunks)
+    if chunks:
+        # チャンク単位で読み込んでいる場合は、有効なチャンクを初期状態から読み込み直す
+        chunks_entity, chunks = chunks[0]
+        player_entity, (_, position) = world.get_singleton(Player, Position2D)
+        reset_level_chunks(world, chunks)
+        update_level_chunks(world, chunks, position.x)
+        return
 
-    for coin_ent, (_, coin_state) in world.get_components(Coin, CoinState):
-        coin_state.is_collected = False
+    # 敵はプールのエンティティを初期状態に戻して再利用し、足りない分だけスポーンする
+    pool_entity, pool = world.get_singleton(EntityPool)
+    for i, (x, y) in enumerate(enemy_positions):
+        if i < len(pool.enemies):
+            reset_enemy(world, pool.enemies[i], x, y)
+        else:
+            enemy = spawn_enemy(world, 0, x, y)
+            world.add_component_to_entity(enemy, Pooled)
+            pool.enemies.append(enemy)
+
+    # 取得済みのコインは無効化されているので、有効に戻して索引に登録し直す
+    for entity, components in list(world.inactive_entities.items()):
+        if Coin in components:
+            world.activate_entity(entity)
+            components[CoinState].is_collected = False
+            add_to_collectible_index(world, entity)
+
+
+def respawn_player(world: World):
+    """プレイヤーを開始位置に戻し、速度を 0 にする関数"""
+    player_entity, (_, position, velocity) = world.get_singleton(Player, Position2D, Velocity2D)
+    position.x = position.prev_x = 8 * 10
+    position.y = position.prev_y = 8 * 10
+    velocity.x = 0
+    velocity.y = 0
+
+
+def subscribe_stage_events(world: World):
+    """ステージの状態 (StageState) を変えるイベントのハンドラを登録する関数
+
+    StageState はイベントが配信されたときだけ書き換えるため、毎フレーム状態を調べるシステムは要らない。
+
+    Args:
+        world (World): イベントバス (world.events) を持つゲームのワールド
+    """
+    events = world.events
+    events.subscribe(GoalReached, partial(on_goal_reached, world))
+    events.subscribe(LifeLost, partial(on_life_lost, world))
+    events.subscribe(GameOver, partial(on_game_over, world))
+    events.subscribe(StageReset, partial(on_stage_reset, world))
+    events.subscribe(CoinCollected, partial(on_coin_collected, world))
+
+
+def on_goal_reached(world: World, event: GoalReached):
+    stage_state_entity, stage_state = world.get_singleton(StageState)
+    stage_state.is_goal = True
+
+
+def on_life_lost(world: World, event: LifeLost):
+    """ライフを1つ減らし、ライフがなくなったらゲームオーバーにする.
+    落下の場合はライフが残っていなくてもゴールの状態を解除し、ライフが残っていればゲームオーバーの状態も解除してステージをリセットする
+    """
+    stage_state_entity, stage_state = world.get_singleton(StageState)
+    if event.cause == "fall":
+        stage_state.is_goal = False
+    # 同じフレームで複数の原因が重なった場合は、残っているライフの分だけ減らす
+    if stage_state.lives > 0:
+        stage_state.lives -= 1
+        if event.cause == "fall":
+            # 時間切れでゲームオーバーになっていても、落下したらステージをやり直す
+            stage_state.game_over = False
+            world.events.publish(StageReset())
+    if stage_state.lives <= 0 and not stage_state.game_over:
+        # 同じ配信の中で続く LifeLost が GameOver を重ねて発行しないよう、ここで状態を変えておく
+        stage_state.game_over = True
+        world.events.publish(GameOver("lives"))
+
+
+def on_game_over(world: World, event: GameOver):
+    stage_state_entity, stage_state = world.get_singleton(StageState)
+    stage_state.game_over = True
+
+
+def on_stage_reset(world: World, event: StageReset):
+    """ステージの敵とコインを初期状態に戻す. リスタートの場合はステージの状態とプレイヤーの位置も戻す"""
+    stage_state_entity, stage_state = world.get_singleton(StageState)
+    if event.restart:
+        stage_state.time_remaining = 60.0
+        stage_state.game_over = False
+        stage_state.is_goal = False
+        stage_state.lives = 3
+        stage_state.coins = 0
+        respawn_player(world)
+    reset_stage(world, stage_state.init_enemy_positions)
+
+
+def on_coin_collected(world: World, event: CoinCollected):
+    stage_state_entity, stage_state = world.get_singleton(StageState)
+    stage_state.coins += 1
+
+
+def wake_event_target(world: World, event):
+    """イベントが対象のエンティティ (entity 属性) を持ち、それがスリープ中なら起こす関数
+
+    EventBus.subscribe_all で登録する。起こしたエンティティは、プレイヤーから離れていても
+    ActivityRegion.wake_frames の間はスリープさせない。
+
+    Args:
+        world (World): ゲームのワールド
+        event: 配信されたイベント
+    """
+    entity = getattr(event, "entity", None)
+    if entity is None or not world.wake_entity(entity):
+        return
+    region_entity, region = world.get_singleton(ActivityRegion)
+    region.woken[entity] = world.frame_count + region.wake_frames
+
+
+def reset_enemy(world: World, entity: int, x: int, y: int):
+    """倒された敵も含め、プールの敵をスポーン直後と同じ状態に戻す関数
+
+    コンポーネントは作り直さずに値だけを書き換える。
+
+    Args:
+        world (World): ゲームのワールド
+        entity (int): 敵のエンティティID
+        x (int): 初期X座標
+        y (int): 初期Y座標
+    """
+    world.activate_entity(entity)
+    components = world.get_entity_object(entity)
+    position = components[Position2D]
+    position.x = position.next_x = position.prev_x = x
+    position.y = position.next_y = position.prev_y = y
+    # スポーン直後と同じく右向きに歩き始める
+    components[Velocity2D].set(components[MoveMethodWalk].speed, 0)
+    components[RectRigidBody].flip_x = False
+    components[EnemyState].is_dead = False
+    animation = components[EnemyAnimation]
+    animation.clip = ENEMY_SPECIES_CLIPS[components[Enemy].species_id]
+    animation.start = get_animation_clock(world)
+    animation.is_running = True
+    collision_info = components[CollisionInfo]
+    collision_info.left = collision_info.right = False
+    collision_info.top = collision_info.bottom = False
+
+
+def reload_level_tiles(world: World, layers: list):
+    """レベルのタイルをワールドのタイルマップに読み込み直す関数
+
+    衝突判定のグリッドと合成済みのタイルの画像は、次に使われるときに作り直される。
+
+    Args:
+        world (World): ゲームのワールド
+        layers (list[TileLayer]): load_level で読み込んだレイヤーのリスト
+    """
+    if world.headless:
+        world.tilemaps = list(layers)
+    else:
+        copy_layers_to_tilemaps(layers, world.tilemaps)
+    mark_tiles_changed(world)
+
+
+def load_chunk(world: World, chunks: LevelChunks, chunk: int):
+    """チャンクの敵とコインのうち、倒されたり取得されたりしていないものをスポーンする関数
+
+    Args:
+        world (World): ゲームのワールド
+        chunks (LevelChunks): レベルのチャンク
+        chunk (int): チャンク番号
+    """
+    # 他のチャンクから歩いてきた敵が既に振り分けられていれば、その後ろに加える
+    entities = chunks.active.setdefault(chunk, [])
+    for spawn in chunks.spawns.get(chunk, ()):
+        if spawn in chunks.consumed:
+            continue
+        kind, x, y = spawn
+        if kind == "enemy":
+            entities.append((spawn, spawn_enemy(world, 0, x, y)))
+        else:
+            entities.append((spawn, spawn_coin(world, x, y)))
+
+
+def unload_chunk(world: World, chunks: LevelChunks, chunk: int, keep_state: bool = True):
+    """チャンクの敵とコインをワールドから取り除く関数
+
+    Args:
+        world (World): ゲームのワールド
+        chunks (LevelChunks): レベルのチャンク
+        chunk (int): チャンク番号
+        keep_state (bool, optional): 倒された敵と取得済みのコインを consumed に記録する. Defaults to True.
+    """
+    grids = world.get_component(SpatialHashGrid) + world.get_component(CollectibleIndex)
+    for spawn, entity in chunks.active.pop(chunk, ()):
+        # 取り除かれた敵と、取得されて無効化されたコインは消費済みとして扱う (スリープ中のものは除く)
+        if keep_state and not world.is_active(entity) and not world.is_sleeping(entity):
+            chunks.consumed.add(spawn)
+        world.remove_entity(entity)
+        for grid_entity, grid in grids:
+            remove_from_spatial_hash(grid, entity)
+
+
+def rebin_chunk_entities(world: World, chunks: LevelChunks):
+    """有効なチャンクの敵とコインを、スポーンしたチャンクではなく今いるチャンクに振り分け直す関数
+
+    敵は歩いてチャンクをまたぐため、スポーンしたチャンクごとに取り除くと、プレイヤーの近くに来た敵が消えてしまう。
+
+    Args:
+        world (World): ゲームのワールド
+        chunks (LevelChunks): レベルのチャンク
+    """
+    active = {chunk: [] for chunk in chunks.active}
+    for chunk, entities in chunks.active.items():
+        for spawn, entity in entities:
+            # 倒された敵や取得済みのコイン、スリープ中の敵は無効化されたエンティティとして残っている
+            components = world.get_entity_object(entity) or world.inactive_entities.get(entity)
+            if components is not None:
+                chunk = get_chunk_index(components[Position2D].x, chunks.chunk_width)
+            active.setdefault(chunk, []).append((spawn, entity))
+    chunks.active = active
+
+
+def update_level_chunks(world: World, chunks: LevelChunks, x) -> bool:
+    """X座標の周囲 radius チャンクを有効にし、範囲外になったチャンクを無効にする関数
+
+    Args:
+        world (World): ゲームのワールド
+        chunks (LevelChunks): レベルのチャンク
+        x (int): プレイヤーのX座標
+
+    Returns:
+        bool: 有効なチャンクが変わった場合は True
+    """
+    center = get_chunk_index(x, chunks.chunk_width)
+    if center == chunks.center:
+        return False
+    chunks.center = center
+    window = range(center - chunks.radius, center + chunks.radius + 1)
+    loaded = set(chunks.active)
+    rebin_chunk_entities(world, chunks)
+    for chunk in [chunk for chunk in chunks.active if chunk not in window]:
+        unload_chunk(world, chunks, chunk)
+    for chunk in window:
+        if chunk not in loaded:
+            load_chunk(world, chunks, chunk)
+    return True
+
+
+def reset_level_chunks(world: World, chunks: LevelChunks):
+    """全てのチャンクを無効にし、倒された敵と取得済みのコインの記録を消す関数
+
+    Args:
+        world (World): ゲームのワールド
+        chunks (LevelChunks): レベルのチャンク
+    """
+    for chunk in list(chunks.active):
+        unload_chunk(world, chunks, chunk, keep_state=False)
+    chunks.consumed.clear()
+    chunks.center = None
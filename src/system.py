@@ -1,7 +1,9 @@
 from pigframe import System
 from component import *
 from utils import *
-from stage import reset_stage
+from stage import respawn_player, update_level_chunks
+from events import CoinCollected, GameOver, GoalReached, LifeLost, StageReset
+from animation import PLAYER_IDLE_CLIP, PLAYER_STATE_CLIPS, AnimationTable, play_clip
 
 
 class SysSimulateGravity(System):
@@ -22,44 +24,6 @@ class SysSimulateGravity(System):
             velocity.y = min(velocity.y, self.max_fall_speed)
 
 
-class SysTilemapCollision(System):
-    """タイルマップとの衝突を処理するシステム"""
-
-    def __init__(self, world, priority: int = 0, **kwargs) -> None:
-        super().__init__(world, priority, **kwargs)
-
-    def process(self):
-        # Assumes there is only one floor entity
-
-        for entity, (_, _, body, position, collision_info) in self.world.get_components(
-            BaseCollidable, Movable, RectRigidBody, Position2D, CollisionInfo
-        ):
-            bottom = False
-            top = False
-            left = False
-            right = False
-            for entity, (tile_collidable, tilemap) in self.world.get_components(
-                TileCollidable, TileMap
-            ):
-                # Update collision info of RigidBody objects (RectRigidBody)
-                collisions = check_collision_tilemap(
-                    position, body, tilemap.id, tile_collidable.surface_height
-                )
-                if collisions["bottom"]:
-                    bottom = True
-                if collisions["top"]:
-                    top = True
-                if collisions["left"]:
-                    left = True
-                if collisions["right"]:
-                    right = True
-
-            collision_info.bottom = bottom
-            collision_info.top = top
-            collision_info.left = left
-            collision_info.right = right
-
-
 class SysCharacterCollision(System):
     """キャラクター同士の衝突を処理するシステム"""
 
@@ -67,63 +31,61 @@ class SysCharacterCollision(System):
         super().__init__(world, priority, **kwargs)
 
     def process(self):
+        grid_entity, grid = self.world.get_singleton(SpatialHashGrid)
         for entity, (_, position, body, collision_info) in self.world.get_components(
             BaseCollidable, Position2D, RectRigidBody, CollisionInfo
         ):
-            bottom = False
-            top = False
-            left = False
-            right = False
-            for entity2, (_, position2, body2, collision_info2) in self.world.get_components(
-                BaseCollidable, Position2D, RectRigidBody, CollisionInfo
+            collisions = COLLISION_NONE
+            # 空間ハッシュで近くにいるキャラクターだけを判定する
+            for entity2 in query_spatial_hash(
+                grid, position.x, position.y, body.width, body.height
             ):
                 if entity == entity2:
                     continue
-                collisions = check_collision_rect_rect(position, body, position2, body2)
-                if collisions["left"]:
-                    left = True
-                if collisions["right"]:
-                    right = True
-                if collisions["bottom"]:
-                    bottom = True
-                if collisions["top"]:
-                    top = True
-
-            collision_info.bottom = bottom
-            collision_info.top = top
-            collision_info.left = left
-            collision_info.right = right
+                components2 = self.world.get_entity_object(entity2)
+                if (
+                    components2 is None
+                    or BaseCollidable not in components2
+                    or CollisionInfo not in components2
+                    or RectRigidBody not in components2
+                ):
+                    continue
+                collisions |= check_collision_rect_rect(
+                    position, body, components2[Position2D], components2[RectRigidBody]
+                )
+
+            collision_info.bottom = bool(collisions & COLLISION_BOTTOM)
+            collision_info.top = bool(collisions & COLLISION_TOP)
+            collision_info.left = bool(collisions & COLLISION_LEFT)
+            collision_info.right = bool(collisions & COLLISION_RIGHT)
 
 
 class SysCharacterMovement(System):
-    """キャラクターの移動を処理するシステム"""
+    """キャラクターの移動とタイルマップとの衝突を処理するシステム
+    ボディを速度に沿って Y 軸、X 軸の順に掃引し、タイルに接触した位置で止めて CollisionInfo を更新する。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
 
     def process(self):
-        for entity, (_, position, velocity, collision_info) in self.world.get_components(
-            BaseCollidable, Position2D, Velocity2D, CollisionInfo
+        grid_entity, grid = self.world.get_singleton(TileCollisionGrid)
+        # タイルマップの構成か内容が変わった場合だけグリッドを作り直す
+        update_tile_collision_grid(
+            grid,
+            get_tile_collision_layers(self.world),
+            self.world.tilemaps,
+            self.world.tile_revision,
+        )
+
+        for entity, (_, _, body, position, velocity, collision_info) in self.world.get_components(
+            BaseCollidable, Movable, RectRigidBody, Position2D, Velocity2D, CollisionInfo
         ):
-            # Handle vertical movement
-            if collision_info.bottom and velocity.y > 0:
-                velocity.y = 0
-                position.next_y = position.y
-            elif collision_info.top and velocity.y < 0:
-                velocity.y = 0
-                position.next_y = position.y
-            else:
-                position.next_y = position.y + velocity.y
-
-            # Handle horizontal movement
-            if collision_info.left and velocity.x < 0:
-                velocity.x = 0
-                position.next_x = position.x
-            elif collision_info.right and velocity.x > 0:
-                velocity.x = 0
-                position.next_x = position.x
-            else:
-                position.next_x = position.x + velocity.x
+            collisions = move_and_collide(position, body, velocity, grid)
+            collision_info.bottom = bool(collisions & COLLISION_BOTTOM)
+            collision_info.top = bool(collisions & COLLISION_TOP)
+            collision_info.left = bool(collisions & COLLISION_LEFT)
+            collision_info.right = bool(collisions & COLLISION_RIGHT)
 
 
 class SysUpdatePosition(System):
@@ -134,10 +96,140 @@ class SysUpdatePosition(System):
 
     def process(self):
         for entity, (movable, position) in self.world.get_components(Movable, Position2D):
+            # 描画時の補間に使うため、更新前の位置を残しておく
+            position.prev_x = position.x
+            position.prev_y = position.y
             position.x = position.next_x
             position.y = position.next_y
 
 
+class SysStreamChunks(System):
+    """プレイヤーの周囲のチャンクの敵とコインをスポーンし、離れたチャンクのものを取り除くシステム"""
+
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+
+    def process(self):
+        chunks_entity, chunks = self.world.get_singleton(LevelChunks)
+        player_entity, (_, position) = self.world.get_singleton(Player, Position2D)
+        update_level_chunks(self.world, chunks, position.x)
+
+
+class SysUpdateActivityRegion(System):
+    """プレイヤーから離れたエンティティをスリープさせ、範囲に戻ったエンティティを起こすシステム
+    スリープ中のエンティティは全てのコンポーネントの検索から外れるため、どのシステムにも処理されない。
+    起こす判定はプレイヤーの周囲のセルに分類されたエンティティだけを調べるため、
+    処理の量はレベル全体ではなく周囲のエンティティの数で決まる。
+    イベントで起こされたエンティティ (stage.wake_event_target) は、ActivityRegion.wake_frames の間はスリープさせない。
+    """
+
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+
+    def process(self):
+        region_entity, region = self.world.get_singleton(ActivityRegion)
+        player_entity, (_, player_position) = self.world.get_singleton(Player, Position2D)
+        player_x = player_position.x
+        player_y = player_position.y
+        radius = region.radius
+        size = region.cell_size
+
+        # 他の処理で起こされたり取り除かれたりしたエンティティが残っていれば分類から外す
+        if len(region.entity_cells) != len(self.world.sleeping_entities):
+            for entity in region.entity_cells.keys() - self.world.sleeping_entities:
+                region.cells[region.entity_cells.pop(entity)].discard(entity)
+
+        for cell in range(int((player_x - radius) // size), int((player_x + radius) // size) + 1):
+            entities = region.cells.get(cell)
+            if not entities:
+                continue
+            for entity in list(entities):
+                position = self.world.inactive_entities[entity][Position2D]
+                if abs(position.x - player_x) <= radius and abs(position.y - player_y) <= radius:
+                    entities.discard(entity)
+                    del region.entity_cells[entity]
+                    self.world.wake_entity(entity)
+
+        woken = region.woken
+        if woken:
+            frame = self.world.frame_count
+            for entity in [entity for entity, until in woken.items() if until < frame]:
+                del woken[entity]
+
+        limit = radius + region.margin
+        far = [
+            (entity, position)
+            for entity, (_, position) in self.world.get_components(Velocity2D, Position2D)
+            if entity != player_entity
+            and entity not in woken
+            and (abs(position.x - player_x) > limit or abs(position.y - player_y) > limit)
+        ]
+        if not far:
+            return
+        grid_entity, grid = self.world.get_singleton(SpatialHashGrid)
+        for entity, position in far:
+            self.world.sleep_entity(entity)
+            remove_from_spatial_hash(grid, entity)
+            previous = region.entity_cells.get(entity)
+            if previous is not None:
+                region.cells[previous].discard(entity)
+            cell = int(position.x // size)
+            region.cells.setdefault(cell, set()).add(entity)
+            region.entity_cells[entity] = cell
+
+
+class SysUpdateSpatialHash(System):
+    """エンティティの位置の変化に合わせて空間ハッシュを更新するシステム
+    重なるセルが変わったエンティティだけを登録し直し、削除されたエンティティは取り除く。
+    """
+
+    def __init__(self, world, priority: int = 0, **kwargs) -> None:
+        super().__init__(world, priority, **kwargs)
+
+    def process(self):
+        grid_entity, grid = self.world.get_singleton(SpatialHashGrid)
+        size = grid.cell_size
+        entity_cells = grid.entity_cells
+        rect_entities = self.world.get_components(Position2D, RectRigidBody)
+        # 動かない円 (収集アイテム) は CollectibleIndex に登録されるため、ここでは扱わない
+        circle_entities = self.world.get_components(Position2D, CircleRigidBody, Velocity2D)
+
+        # 重なるセルが変わっていなければ何もしない (毎フレームのタプルの生成を避けるため要素ごとに比較する)
+        for entity, (position, body) in rect_entities:
+            x = position.x
+            y = position.y
+            cells = entity_cells.get(entity)
+            if (
+                cells is None
+                or cells[0] != x // size
+                or cells[1] != y // size
+                or cells[2] != (x + body.width) // size
+                or cells[3] != (y + body.height) // size
+            ):
+                update_spatial_hash(grid, entity, x, y, body.width, body.height)
+        for entity, (position, body, _) in circle_entities:
+            reach = body.radius * CIRCLE_INTERSECTION_MARGIN
+            x = position.x + body.radius - reach
+            y = position.y + body.radius - reach
+            cells = entity_cells.get(entity)
+            if (
+                cells is None
+                or cells[0] != x // size
+                or cells[1] != y // size
+                or cells[2] != (x + reach * 2) // size
+                or cells[3] != (y + reach * 2) // size
+            ):
+                update_spatial_hash(grid, entity, x, y, reach * 2, reach * 2)
+
+        # 登録数が一致しない場合は削除されたエンティティが残っている
+        if len(entity_cells) != len(rect_entities) + len(circle_entities):
+            alive = {entity for entity, _ in rect_entities} | {
+                entity for entity, _ in circle_entities
+            }
+            for entity in entity_cells.keys() - alive:
+                remove_from_spatial_hash(grid, entity)
+
+
 class SysPlayerControl(System):
     """プレイヤーの操作を処理するシステム
     acceleration: 加速度
@@ -157,9 +249,13 @@ class SysPlayerControl(System):
             # Only allow jumping when on the ground
             # 地面についているときだけジャンプできる
             ignore_value = 10000
-            gamepad_input_x = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTX)
-            gamepad_input_y = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
-            print("gamepad input:", gamepad_input_x, gamepad_input_y)
+            gamepad_input_x = self.world.input_source.btnv(pyxel.GAMEPAD1_AXIS_LEFTX)
+            telemetry = self.world.telemetry
+            if telemetry.enabled:
+                telemetry.gauge("gamepad_x", gamepad_input_x)
+                telemetry.gauge(
+                    "gamepad_y", self.world.input_source.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
+                )
 
             # もし地面についていたらジャンプカウントを0リセット
             if collision_info.bottom:
@@ -197,15 +293,15 @@ class SysPlayerControl(System):
 
 
 class SysPlayerAnimation(System):
-    """プレイヤーのアニメーションを処理するシステム
-    animation_speed: アニメーションの速度
+    """プレイヤーの状態から再生するアニメーションのクリップを選ぶシステム
+    状態とクリップの対応は animation.PLAYER_STATE_CLIPS に定義する。
     """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
-        self.animation_speed = kwargs.get("animation_speed", 6)
 
     def process(self):
+        table_entity, table = self.world.get_singleton(AnimationTable)
         for entity, (_, velocity, body, animation) in self.world.get_components(
             Player, Velocity2D, RectRigidBody, Animation
         ):
@@ -213,86 +309,70 @@ class SysPlayerAnimation(System):
             animation.is_running = abs(velocity.x) > 0.1
             animation.is_jumping = velocity.y < -0.5
             gamepad_ignore_value = 10000
-            gamepad_input_y = pyxel.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
+            gamepad_input_y = self.world.input_source.btnv(pyxel.GAMEPAD1_AXIS_LEFTY)
             animation.is_crouching = (
                 self.world.actions.crouch or gamepad_input_y > gamepad_ignore_value
             )
             # animation.is_falling = velocity.y > 0.5
 
-            sprite_x = 0
-            sprite_y = 8 * 11
-            if animation.is_running:
-                animation.timer += 1
-                if animation.timer > self.animation_speed:
-                    animation.timer = 0
-                    animation.frame = (animation.frame + 1) % 2
-                sprite_x = 16 if animation.frame == 1 else 0
-                sprite_y = 8 * 13
-
-            if animation.is_jumping:
-                sprite_x = 16
-                sprite_y = 8 * 11
-
-            if animation.is_crouching:
-                sprite_x = 48
-                sprite_y = 8 * 11
-
-            # if animation.is_falling:
-            #     sprite_x = 32
-            #     sprite_y = 8*11
-
-            animation.sprite_x = sprite_x
-            animation.sprite_y = sprite_y
+            clip = next(
+                (clip for state, clip in PLAYER_STATE_CLIPS if getattr(animation, state)),
+                PLAYER_IDLE_CLIP,
+            )
+            play_clip(table, animation, clip)
 
 
 class SysRestartStage(System):
-    """ステージをリスタートするシステム"""
+    """リスタートの入力を受けて StageReset イベントを発行するシステム
+    ステージの状態とプレイヤーの位置は、イベントのハンドラ (stage.on_stage_reset) で戻す。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
 
     def process(self):
         if self.world.actions.restart:
-            player_entity, (_, position, velocity) = self.world.get_components(
-                Player, Position2D, Velocity2D
-            )[0]
-            stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-            stage_state.time_remaining = 60.0
-            stage_state.game_over = False
-            stage_state.is_goal = False
-            stage_state.lives = 3
-            stage_state.coins = 0
-            position.x = 8 * 10
-            position.y = 8 * 10
-            velocity.x = 0
-            velocity.y = 0
-            reset_stage(self.world, stage_state.init_enemy_positions)
+            self.world.events.publish(StageReset(restart=True))
 
 
 class SysPlayerGoal(System):
-    """プレイヤーがゴールに到達したかを判定するシステム"""
+    """プレイヤーがゴールに到達したかを判定し、到達したときに GoalReached イベントを発行するシステム
+    ゴールマーカーは横からぶつかると止まるタイルなので、プレイヤーは重ならずに接した位置で止まる。
+    そのため、プレイヤーの判定範囲を左右に1ピクセル広げ、接しているだけの場合も到達とみなす。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
+        self.goal_grid = TileCollisionGrid()
+        # 毎フレーム作らないように、広げた判定範囲の位置とボディを使い回す
+        self.probe_position = Position2D(0, 0)
+        self.probe_body = RectRigidBody(0, 0)
 
     def process(self):
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        # stage_state.game_over が True の場合は処理しない
-        if stage_state.game_over is True:
-            pass
-        goal_marker_entity, goal_marker_tilemap = self.world.get_component(GoalMarkerTileMap)[0]
-        player_entity, (_, position, body) = self.world.get_components(
+        goal_marker_entity, goal_marker_tilemap = self.world.get_singleton(GoalMarkerTileMap)
+        player_entity, (_, position, body) = self.world.get_singleton(
             Player, Position2D, RectRigidBody
-        )[0]
-        collisions = check_collision_tilemap(
-            position, body, goal_marker_tilemap.id, goal_marker_tilemap.pixel_size
         )
-        if collisions["bottom"] or collisions["left"]:
-            stage_state.is_goal = True
+        update_tile_collision_grid(
+            self.goal_grid,
+            ((goal_marker_tilemap.id, goal_marker_tilemap.pixel_size),),
+            self.world.tilemaps,
+            self.world.tile_revision,
+        )
+        probe_position = self.probe_position
+        probe_position.x = position.x - 1
+        probe_position.y = position.y
+        self.probe_body.width = body.width + 2
+        self.probe_body.height = body.height
+        collisions = check_collision_grid(probe_position, self.probe_body, self.goal_grid)
+        if collisions & (COLLISION_BOTTOM | COLLISION_LEFT):
+            stage_state_entity, stage_state = self.world.get_singleton(StageState)
+            if not stage_state.is_goal:
+                self.world.events.publish(GoalReached())
 
 
 class SysUpdateStageState(System):
-    """ステージの状態を更新するシステム"""
+    """ステージの残り時間を減らし、なくなったときに GameOver イベントを発行するシステム"""
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
@@ -300,9 +380,9 @@ class SysUpdateStageState(System):
     def process(self):
         for entity, stage_state in self.world.get_component(StageState):
             if not stage_state.game_over and not stage_state.is_goal:
-                stage_state.time_remaining -= 1 / 60
+                stage_state.time_remaining -= self.world.dt
                 if stage_state.time_remaining <= 0:
-                    stage_state.game_over = True
+                    self.world.events.publish(GameOver("time"))
 
 
 class SysEnemyWalk(System):
@@ -312,14 +392,14 @@ class SysEnemyWalk(System):
         super().__init__(world, priority, **kwargs)
 
     def process(self):
-        for entity, (_, _, body, velocity, collision_info) in self.world.get_components(
+        for entity, (_, walk, body, velocity, collision_info) in self.world.get_components(
             Enemy, MoveMethodWalk, RectRigidBody, Velocity2D, CollisionInfo
         ):
             if collision_info.left:
-                velocity.x = 1.0
+                velocity.x = walk.speed
                 body.flip_x = False
             elif collision_info.right:
-                velocity.x = -1.0
+                velocity.x = -walk.speed
                 body.flip_x = True
 
 
@@ -337,114 +417,85 @@ class SysEnemyMovement(System):
             position.next_y = position.y + velocity.y
 
 
-class SysEnemyAnimation(System):
-    """敵のアニメーションを処理するシステム
-    animation_speed: アニメーションの速度
+class SysAnimate(System):
+    """全てのエンティティのアニメーションを1ステップ進めるシステム
+    各エンティティは再生を始めた時計の値を持つだけなので、共有の時計を進めれば全エンティティの経過ステップ数が進む。
+    表示するスプライトは描画時に AnimationTable から引く。
     """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
-        self.animation_speed = kwargs.get("animation_speed", 6)
 
     def process(self):
-        for entity, (_, body, animation) in self.world.get_components(
-            Enemy, RectRigidBody, EnemyAnimation
-        ):
-            sprite_x = 32
-            sprite_y = 8 * 7
-            animation.timer += 1
-            if animation.timer > self.animation_speed:
-                animation.timer = 0
-                animation.frame = (animation.frame + 1) % 4
-
-            if animation.frame == 1:
-                sprite_x = 48
-                sprite_y = 8 * 7
-            elif animation.frame == 2:
-                sprite_x = 64
-                sprite_y = 8 * 7
-            elif animation.frame == 3:
-                sprite_x = 48
-                sprite_y = 8 * 7
-
-            animation.sprite_x = sprite_x
-            animation.sprite_y = sprite_y
+        table_entity, table = self.world.get_singleton(AnimationTable)
+        table.clock += 1
 
 
 class SysPlayerDieFromFall(System):
-    """プレイヤーが落下によって死亡する処理を行うシステム"""
+    """落下したプレイヤーを開始位置に戻し、LifeLost イベントを発行するシステム
+    ライフを減らす処理とステージのリセットは、イベントのハンドラ (stage.on_life_lost) で行う。
+    ライフが残っていない場合もゴールの状態を解除するため、イベントは毎回発行する。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
 
     def process(self):
-        player_entity, (_, position, body, velocity, collision_info) = self.world.get_components(
-            Player, Position2D, RectRigidBody, Velocity2D, CollisionInfo
-        )[0]
+        player_entity, (_, position) = self.world.get_singleton(Player, Position2D)
         if position.y > 8 * 15:
-            stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-            # stage_state.time_remaining = 60.0
-            stage_state.game_over = False
-            stage_state.is_goal = False
-            position.x = 8 * 10
-            position.y = 8 * 10
-            velocity.x = 0
-            velocity.y = 0
-            if stage_state.lives > 0:
-                stage_state.lives -= 1
-                reset_stage(self.world, stage_state.init_enemy_positions)
-
-
-class SysPlayerDieNoHP(System):
-    """プレイヤーがHPがなくなったときに死亡する処理を行うシステム"""
-
-    def __init__(self, world, priority: int = 0, **kwargs) -> None:
-        super().__init__(world, priority, **kwargs)
-
-    def process(self):
-        player_entity, (_, position, body, velocity, collision_info) = self.world.get_components(
-            Player, Position2D, RectRigidBody, Velocity2D, CollisionInfo
-        )[0]
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        if stage_state.lives <= 0:
-            stage_state.game_over = True
+            respawn_player(self.world)
+            self.world.events.publish(LifeLost("fall"))
 
 
 class SysCollectCoin(System):
-    """コインの収集を処理するシステム"""
+    """コインの収集を処理するシステム
+    プレイヤーに重なるセルのコインだけを判定し、取得したコインは索引から取り除いて無効化する。
+    取得したコインの数は CoinCollected イベントのハンドラ (stage.on_coin_collected) で数える。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
 
     def process(self):
-        player_entity, (_, position, body) = self.world.get_components(
+        player_entity, (_, position, body) = self.world.get_singleton(
             Player, Position2D, RectRigidBody
-        )[0]
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        for entity, (_, _, coin_state, coin_position, coin_body) in self.world.get_components(
-            Coin, Collectible, CoinState, Position2D, CircleRigidBody
-        ):
-            if coin_state.is_collected:
+        )
+        index_entity, index = self.world.get_singleton(CollectibleIndex)
+        for entity in query_spatial_hash(index, position.x, position.y, body.width, body.height):
+            components = self.world.get_entity_object(entity)
+            # 取り除かれたり無効化されたりしたエンティティが索引に残っている場合は飛ばす
+            if components is None or Coin not in components:
                 continue
-            if check_intersection_rect_circle(position, body, coin_position, coin_body):
-                coin_state.is_collected = True
-                stage_state.coins += 1
+            if check_intersection_rect_circle(
+                position, body, components[Position2D], components[CircleRigidBody]
+            ):
+                components[CoinState].is_collected = True
+                self.world.events.publish(CoinCollected(entity))
+                remove_from_spatial_hash(index, entity)
+                self.world.deactivate_entity(entity)
 
 
 class SysPlayerEnemyCollision(System):
-    """プレイヤーと敵の衝突を処理するシステム"""
+    """プレイヤーと敵の衝突を処理するシステム
+    横からぶつかった場合は LifeLost イベントを発行し、ライフはイベントのハンドラ (stage.on_life_lost) で減らす。
+    """
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
 
     def process(self):
-        player_entity, (_, position, body) = self.world.get_components(
+        player_entity, (_, position, body) = self.world.get_singleton(
             Player, Position2D, RectRigidBody
-        )[0]
-        stage_state_entity, stage_state = self.world.get_component(StageState)[0]
-        for entity, (_, velocity, enemy_position, enemy_body) in self.world.get_components(
-            Enemy, Velocity2D, Position2D, RectRigidBody
-        ):
+        )
+        grid_entity, grid = self.world.get_singleton(SpatialHashGrid)
+        for entity in query_spatial_hash(grid, position.x, position.y, body.width, body.height):
+            components = self.world.get_entity_object(entity)
+            # 取り除かれたり無効化されたりしたエンティティが索引に残っている場合は飛ばす
+            if components is None or Enemy not in components:
+                continue
+            velocity = components[Velocity2D]
+            enemy_position = components[Position2D]
+            enemy_body = components[RectRigidBody]
             collisions = check_collision_rect_rect(position, body, enemy_position, enemy_body)
             intersection_angle = check_intersection_angle(
                 position, body, enemy_position, enemy_body
@@ -452,18 +503,30 @@ class SysPlayerEnemyCollision(System):
 
             # if angle is less than 45 degrees, it is a hit from the side
             if abs(intersection_angle) < math.pi / 4 and (
-                collisions["left"] or collisions["right"]
+                collisions & (COLLISION_LEFT | COLLISION_RIGHT)
             ):
-                print("hit enemy")
+                telemetry = self.world.telemetry
+                if telemetry.enabled:
+                    telemetry.count("enemy_hits")
+                    telemetry.debug("hit_enemy", entity=entity)
+                stage_state_entity, stage_state = self.world.get_singleton(StageState)
                 if stage_state.lives > 0:
-                    stage_state.lives -= 1
+                    self.world.events.publish(LifeLost("enemy"))
                     velocity.x *= -1
                     enemy_body.flip_x = not enemy_body.flip_x
 
                     break
-            if abs(intersection_angle) > math.pi / 4 and collisions["bottom"]:
-                print("step on enemy")
-                self.world.remove_entity(entity)
+            if abs(intersection_angle) > math.pi / 4 and collisions & COLLISION_BOTTOM:
+                telemetry = self.world.telemetry
+                if telemetry.enabled:
+                    telemetry.count("enemy_stomps")
+                    telemetry.debug("step_on_enemy", entity=entity)
+                # プールの敵はステージのリセットで再利用するため、削除せずに無効化する
+                if Pooled in components:
+                    self.world.deactivate_entity(entity)
+                else:
+                    self.world.remove_entity(entity)
+                remove_from_spatial_hash(grid, entity)
 
 
 class SysExitGame(System):
@@ -474,7 +537,7 @@ class SysExitGame(System):
 
     def process(self):
         if self.world.actions.exit:
-            pyxel.quit()
+            self.world.quit()
 
 
 class SysPlayBGM(System):
@@ -482,6 +545,8 @@ class SysPlayBGM(System):
 
     def __init__(self, world, priority: int = 0, **kwargs) -> None:
         super().__init__(world, priority, **kwargs)
+        # サウンドのリソースは BGM を鳴らすときにだけ読み込む
+        self.world.assets.get("resource")
 
     def process(self):
         if pyxel.play_pos(0) is None:
@@ -0,0 +1,199 @@
+from dataclasses import asdict, is_dataclass
+import json
+import queue
+import sys
+import threading
+
+# ログのレベル
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# 書き込みスレッドに渡す記録の種類
+_LOG = 0
+_METRICS = 1
+_STOP = 2
+
+
+class Telemetry:
+    """レベル付きのログと、カウンタ・ゲージのメトリクスを記録するテレメトリ
+    記録は JSON Lines の形式で、キューを通して別スレッドで書き込むため、ゲームのループはファイルや端末の I/O を待たない。
+    書き込みが追いつかずキューが max_queue 件に達したら、メモリを増やし続けないよう新しい記録を捨てて dropped に数える。
+    ログはイベント名ごとに rate_window フレームあたり rate_limit 件までとし、捨てた件数は次のログに suppressed として付ける。
+    無効な間はどのメソッドも何もしないが、毎フレーム呼ぶ場所では引数を作る前に enabled を確かめる:
+
+        telemetry = self.world.telemetry
+        if telemetry.enabled:
+            telemetry.gauge("enemies", len(enemies))
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.level = INFO
+        self.rate_limit = 10
+        self.rate_window = 60
+        self.frame = 0
+        self.counters = {}
+        self.gauges = {}
+        # イベント名 -> (レート制限の窓の番号, 窓の中で書いた件数)
+        self.sent = {}
+        # イベント名 -> レート制限で捨てた件数
+        self.suppressed = {}
+        # キューがいっぱいで捨てた記録の件数
+        self.dropped = 0
+        self.log_file = None
+        self.metrics_file = None
+        self.queue = None
+        self.thread = None
+
+    def start(
+        self,
+        log_path: str = None,
+        metrics_path: str = None,
+        level: int = INFO,
+        rate_limit: int = 10,
+        rate_window: int = 60,
+        max_queue: int = 4096,
+    ):
+        """記録を開始し、書き込みスレッドを起動する
+
+        Args:
+            log_path (str, optional): ログを書くファイル. None の場合は標準エラー出力に書く.
+            metrics_path (str, optional): フレームごとのメトリクスを書くファイル. None の場合は書かない.
+            level (int, optional): このレベル以上のログだけを書く. Defaults to INFO.
+            rate_limit (int, optional): 1つのイベント名で rate_window フレームの間に書くログの上限. Defaults to 10.
+            rate_window (int, optional): レート制限の窓のフレーム数. Defaults to 60.
+            max_queue (int, optional): 書き込みを待つ記録の上限. Defaults to 4096.
+        """
+        if self.enabled:
+            self.stop()
+        self.level = level
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.log_file = open(log_path, "w") if log_path else sys.stderr
+        self.metrics_file = open(metrics_path, "w") if metrics_path else None
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._write, name="telemetry", daemon=True)
+        self.thread.start()
+        self.enabled = True
+
+    def stop(self):
+        """キューに残っている記録を全て書き込んでから記録を止める"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        # 停止の合図は捨てずに、キューが空くまで待って入れる
+        self.queue.put((_STOP, None))
+        self.thread.join()
+        for f in (self.log_file, self.metrics_file):
+            if f is not None and f is not sys.stderr:
+                f.close()
+        self.log_file = self.metrics_file = None
+        self.queue = self.thread = None
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self.enabled and level >= self.level
+
+    def log(self, level: int, event: str, **fields):
+        """ログを1件記録する
+
+        Args:
+            level (int): ログのレベル
+            event (str): イベント名 (レート制限の単位)
+            **fields: ログに付ける値 (JSON にできるもの)
+        """
+        if not self.enabled or level < self.level:
+            return
+        window = self.frame // self.rate_window
+        sent_window, sent = self.sent.get(event, (window, 0))
+        if sent_window != window:
+            sent = 0
+        if sent >= self.rate_limit:
+            self.suppressed[event] = self.suppressed.get(event, 0) + 1
+            return
+        self.sent[event] = (window, sent + 1)
+        record = {"frame": self.frame, "level": LEVEL_NAMES.get(level, level), "event": event}
+        record.update(fields)
+        suppressed = self.suppressed.pop(event, 0)
+        if suppressed:
+            record["suppressed"] = suppressed
+        self._put(_LOG, record)
+
+    def debug(self, event: str, **fields):
+        self.log(DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(ERROR, event, **fields)
+
+    def count(self, name: str, value: int = 1):
+        """カウンタを value だけ増やす (カウンタは記録の開始からの累計)"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value):
+        """ゲージに現在の値を設定する"""
+        if self.enabled:
+            self.gauges[name] = value
+
+    def record_event(self, event):
+        """EventBus のイベントを INFO のログとカウンタに記録するハンドラ"""
+        if not self.enabled:
+            return
+        name = type(event).__name__
+        self.count(name)
+        fields = asdict(event) if is_dataclass(event) else {}
+        self.log(INFO, name, **fields)
+
+    def end_frame(self, frame: int):
+        """フレームのカウンタとゲージをメトリクスのファイルに書き、次のフレームに進める
+
+        Args:
+            frame (int): 終わったフレームの番号
+        """
+        if not self.enabled:
+            return
+        if self.metrics_file is not None:
+            self._put(
+                _METRICS,
+                {
+                    "frame": frame,
+                    "counters": dict(self.counters),
+                    "gauges": dict(self.gauges),
+                    "dropped": self.dropped,
+                },
+            )
+        self.frame = frame + 1
+
+    def _put(self, kind: int, record: dict):
+        try:
+            self.queue.put_nowait((kind, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        """書き込みスレッドの処理. JSON への変換もこのスレッドで行う"""
+        records = self.queue
+        files = {_LOG: self.log_file, _METRICS: self.metrics_file}
+        while True:
+            kind, record = records.get()
+            if kind == _STOP:
+                break
+            files[kind].write(json.dumps(record, default=str) + "\n")
+            # キューが空になったときだけまとめて書き出す
+            if records.empty():
+                for f in files.values():
+                    if f is not None:
+                        f.flush()
+        for f in files.values():
+            if f is not None:
+                f.flush()
@@ -1,6 +1,64 @@
+import math
 import pyxel
+from array import array
 from component import *
 
+# 長方形と円の交差判定で円の半径に掛ける余裕
+CIRCLE_INTERSECTION_MARGIN = 1.2
+
+# 衝突判定の結果を表すビットマスク
+COLLISION_NONE = 0
+COLLISION_LEFT = 1
+COLLISION_RIGHT = 2
+COLLISION_TOP = 4
+COLLISION_BOTTOM = 8
+
+# 掃引による衝突判定で、接触しているとみなす距離の誤差
+SWEEP_EPSILON = 1e-6
+
+
+def _check_collision_tile(
+    pos: Position2D,
+    body: RectRigidBody,
+    xi: int,
+    yi: int,
+    surface_height: int,
+) -> int:
+    """1つのタイルとの衝突をチェックする関数
+
+    Args:
+        pos (Position2D): オブジェクトの位置
+        body (RectRigidBody): オブジェクトのボディ
+        xi (int): タイルのX座標
+        yi (int): タイルのY座標
+        surface_height (int): 表面の高さ
+
+    Returns:
+        int: COLLISION_* のビットマスク
+    """
+    # Get tile boundaries in pixel coordinates
+    tile_left = xi * 8
+    tile_right = tile_left + 8
+    tile_top = yi * 8 + (8 - surface_height)
+    tile_bottom = tile_top + surface_height
+
+    # プレイヤーの実際の判定範囲（surface heightを考慮）
+    player_bottom = pos.y + body.height
+    player_adjusted_bottom = player_bottom - surface_height  # surface_height pixels を無視
+
+    collisions = COLLISION_NONE
+    # 左右の衝突判定は、surface heightによるオーバーラップを除外
+    if not (player_bottom > tile_top and player_adjusted_bottom < tile_top):
+        if tile_left <= pos.x + body.width <= tile_right:
+            collisions |= COLLISION_RIGHT
+        if tile_left <= pos.x <= tile_right:
+            collisions |= COLLISION_LEFT
+    if tile_top <= pos.y + body.height <= tile_bottom:
+        collisions |= COLLISION_BOTTOM
+    if tile_top <= pos.y <= tile_bottom:
+        collisions |= COLLISION_TOP
+    return collisions
+
 
 def check_collision_tilemap(
     pos: Position2D, body: RectRigidBody, tilemap_id: int, surface_height: int = None
@@ -12,6 +70,9 @@ def check_collision_tilemap(
         body (RectRigidBody): オブジェクトのボディ
         tilemap_id (int): タイルマップのID
         surface_height (int, optional): 表面の高さ. Defaults to None.
+
+    Returns:
+        int: COLLISION_* のビットマスク
     """
     # Convert pixel coordinates to tile coordinates
     tile_x1 = pyxel.floor(pos.x) // 8
@@ -19,42 +80,321 @@ def check_collision_tilemap(
     tile_x2 = (pyxel.ceil(pos.x) + body.width - 1) // 8
     tile_y2 = (pyxel.ceil(pos.y) + body.height - 1) // 8
 
-    collisions = {"left": False, "right": False, "top": False, "bottom": False}
+    collisions = COLLISION_NONE
 
     for yi in range(tile_y1, tile_y2 + 1):
         for xi in range(tile_x1, tile_x2 + 1):
             col, colkey = pyxel.tilemaps[tilemap_id].pget(xi, yi)
             if col == 0:  # Assuming 0 means empty/no collision
                 continue
+            collisions |= _check_collision_tile(pos, body, xi, yi, surface_height)
+    return collisions
+
+
+def get_tile_collision_layers(world) -> tuple:
+    """ワールド内の衝突可能なタイルマップの (タイルマップID, 表面の高さ) の組を返す関数
+
+    毎フレーム呼ばれるため、結果は TileCollidable か TileMap のコンポーネントが追加・削除されるまでキャッシュする。
+
+    Args:
+        world (CachedWorld): ゲームのワールド
+    """
+    return world.get_derived(
+        "tile_collision_layers", (TileCollidable, TileMap), _collect_tile_collision_layers
+    )
+
+
+def _collect_tile_collision_layers(world) -> tuple:
+    return tuple(
+        sorted(
+            (tilemap.id, tile_collidable.surface_height)
+            for _, (tile_collidable, tilemap) in world.get_components(TileCollidable, TileMap)
+        )
+    )
+
+
+def mark_tiles_changed(world):
+    """タイルマップの内容を書き換えたことを記録する関数
+
+    タイルを書き換えた後 (pyxel.tilemaps[i].pset やレベルの読み込み直し) に呼ぶと、
+    タイルから作ったグリッドや画像が次に使われるときに作り直される。
+
+    Args:
+        world (World): ゲームのワールド
+    """
+    world.tile_revision += 1
+
+
+def build_tile_collision_grid(
+    grid: TileCollisionGrid, layers: tuple, tilemaps=None, revision: int = 0
+):
+    """衝突可能なタイルマップを1つのグリッドに統合する関数
+
+    Args:
+        grid (TileCollisionGrid): 書き込み先のグリッド
+        layers (tuple): (タイルマップID, 表面の高さ) の組
+        tilemaps (optional): タイルマップのリスト. Defaults to pyxel.tilemaps.
+        revision (int, optional): 作った時点のワールドの tile_revision. Defaults to 0.
+    """
+    if tilemaps is None:
+        tilemaps = pyxel.tilemaps
+    tilemaps = [(tilemaps[tilemap_id], surface_height) for tilemap_id, surface_height in layers]
+    width = max((tilemap.width for tilemap, _ in tilemaps), default=0)
+    height = max((tilemap.height for tilemap, _ in tilemaps), default=0)
+    cells = array("H", bytes(2 * width * height))
+
+    for tilemap, surface_height in tilemaps:
+        bit = 1 << surface_height
+        for yi in range(tilemap.height):
+            row = yi * width
+            for xi in range(tilemap.width):
+                col, colkey = tilemap.pget(xi, yi)
+                if col == 0:  # Assuming 0 means empty/no collision
+                    continue
+                cells[row + xi] |= bit
+
+    grid.width = width
+    grid.height = height
+    grid.cells = cells
+    grid.layers = layers
+    grid.revision = revision
+
+
+def update_tile_collision_grid(
+    grid: TileCollisionGrid, layers: tuple, tilemaps=None, revision: int = 0
+) -> bool:
+    """レイヤー構成かタイルの内容が変わった場合だけグリッドを再構築する関数
+
+    タイルの内容の変更は、書き換えた側が mark_tiles_changed で増やしたワールドの tile_revision で検出する。
+
+    Args:
+        grid (TileCollisionGrid): 対象のグリッド
+        layers (tuple): (タイルマップID, 表面の高さ) の組
+        tilemaps (optional): タイルマップのリスト. Defaults to pyxel.tilemaps.
+        revision (int, optional): ワールドの現在の tile_revision. Defaults to 0.
+
+    Returns:
+        bool: 再構築した場合は True
+    """
+    if grid.layers == layers and grid.revision == revision:
+        return False
+    build_tile_collision_grid(grid, layers, tilemaps, revision)
+    return True
+
+
+def check_collision_grid(pos: Position2D, body: RectRigidBody, grid: TileCollisionGrid):
+    """統合済みのグリッドとの衝突をチェックする関数
+
+    check_collision_tilemap をグリッドの全レイヤーに対して呼び出した結果の論理和と同じ結果を返す。
+
+    Args:
+        pos (Position2D): オブジェクトの位置
+        body (RectRigidBody): オブジェクトのボディ
+        grid (TileCollisionGrid): 衝突判定用のグリッド
+
+    Returns:
+        int: COLLISION_* のビットマスク
+    """
+    # Convert pixel coordinates to tile coordinates (clamped to the grid)
+    tile_x1 = max(pyxel.floor(pos.x) // 8, 0)
+    tile_y1 = max(pyxel.floor(pos.y) // 8, 0)
+    tile_x2 = min((pyxel.ceil(pos.x) + body.width - 1) // 8, grid.width - 1)
+    tile_y2 = min((pyxel.ceil(pos.y) + body.height - 1) // 8, grid.height - 1)
+
+    collisions = COLLISION_NONE
+    cells = grid.cells
+    width = grid.width
+
+    for yi in range(tile_y1, tile_y2 + 1):
+        row = yi * width
+        for xi in range(tile_x1, tile_x2 + 1):
+            mask = cells[row + xi]
+            surface_height = 0
+            while mask:
+                if mask & 1:
+                    collisions |= _check_collision_tile(pos, body, xi, yi, surface_height)
+                mask >>= 1
+                surface_height += 1
+    return collisions
+
+
+def _sweep_tile_grid_x(grid: TileCollisionGrid, x, y, width, height, dx):
+    """sweep_tile_grid の X 軸方向の移動の判定 (接触するタイルの面のX座標、接触しない場合は None を返す)"""
+    cells = grid.cells
+    # 移動中に縦方向で重なる行
+    yi1 = max(math.floor((y + SWEEP_EPSILON) / 8), 0)
+    yi2 = min(math.floor((y + height - SWEEP_EPSILON) / 8), grid.height - 1)
+    bottom = y + height - SWEEP_EPSILON
+    if dx > 0:
+        start = x + width
+        # 左端が [start, start + dx] にあるタイルを進行方向の順に調べる
+        columns = range(
+            max(math.ceil((start - SWEEP_EPSILON) / 8), 0),
+            min(math.floor((start + dx) / 8), grid.width - 1) + 1,
+        )
+        face = 0
+    else:
+        start = x
+        # 右端が [start + dx, start] にあるタイルを進行方向の順に調べる
+        columns = range(
+            min(math.floor((start + SWEEP_EPSILON) / 8) - 1, grid.width - 1),
+            max(math.ceil((start + dx) / 8) - 1, 0) - 1,
+            -1,
+        )
+        face = 8
+
+    for xi in columns:
+        for yi in range(yi1, yi2 + 1):
+            mask = cells[yi * grid.width + xi]
+            surface_height = 0
+            while mask:
+                # 表面の高さ h のタイルは、タイルの下端から高さ h の範囲だけが衝突する.
+                # 表面の高さ 0 のタイル (ゴールマーカー) は上下には衝突しないが、横からはタイル全体が衝突する
+                if mask & 1 and (not surface_height or yi * 8 + 8 - surface_height < bottom):
+                    return xi * 8 + face
+                mask >>= 1
+                surface_height += 1
+    return None
+
+
+def _sweep_tile_grid_y(grid: TileCollisionGrid, x, y, width, height, dy):
+    """sweep_tile_grid の Y 軸方向の移動の判定 (接触するタイルの面のY座標、接触しない場合は None を返す)"""
+    cells = grid.cells
+    # 移動中に横方向で重なる列
+    xi1 = max(math.floor((x + SWEEP_EPSILON) / 8), 0)
+    xi2 = min(math.floor((x + width - SWEEP_EPSILON) / 8), grid.width - 1)
+    if dy > 0:
+        start = y + height
+        end = start + dy
+        # 上端が [start, end] にあるタイルを上の行から順に調べ、最初に見つかった行で最も高いものに接触する
+        for yi in range(
+            max(math.floor((start - SWEEP_EPSILON) / 8), 0),
+            min(math.floor(end / 8), grid.height - 1) + 1,
+        ):
+            contact = None
+            for xi in range(xi1, xi2 + 1):
+                mask = cells[yi * grid.width + xi]
+                surface_height = 0
+                while mask:
+                    if mask & 1 and surface_height:
+                        top = yi * 8 + 8 - surface_height
+                        if start - SWEEP_EPSILON <= top <= end and (
+                            contact is None or top < contact
+                        ):
+                            contact = top
+                    mask >>= 1
+                    surface_height += 1
+            if contact is not None:
+                return contact
+    else:
+        start = y
+        # 下端が [start + dy, start] にあるタイルを下の行から順に調べる
+        for yi in range(
+            min(math.floor((start + SWEEP_EPSILON) / 8) - 1, grid.height - 1),
+            max(math.ceil((start + dy) / 8) - 1, 0) - 1,
+            -1,
+        ):
+            row = yi * grid.width
+            for xi in range(xi1, xi2 + 1):
+                if cells[row + xi] & ~1:
+                    return yi * 8 + 8
+    return None
+
+
+def sweep_tile_grid(
+    grid: TileCollisionGrid, x: float, y: float, width: int, height: int, dx: float, dy: float
+) -> float:
+    """長方形を1つの軸に沿って動かしたときに、最初にタイルに接触するまでの割合を返す関数
+
+    移動の経路上にあるタイルだけを進行方向の順に調べるため、1ステップの移動量がタイルより大きくてもすり抜けない。
+    移動を始めた時点で既に重なっているタイルは無視する (めり込んだ状態からは抜け出せる)。
+    接触面の法線と接触した位置は grid.hit に書き込む。毎フレーム呼ばれるため、結果のオブジェクトは作らない。
+
+    Args:
+        grid (TileCollisionGrid): 衝突判定用のグリッド
+        x (float): 長方形の左端
+        y (float): 長方形の上端
+        width (int): 長方形の幅
+        height (int): 長方形の高さ
+        dx (float): X 軸方向の移動量
+        dy (float): Y 軸方向の移動量 (dx と dy の少なくとも一方は 0 であること)
+
+    Returns:
+        float: 移動量に対する、接触するまでに進める割合 (0 から 1). 接触しない場合は 1
+    """
+    if dx and dy:
+        raise ValueError("sweep_tile_grid moves along one axis at a time")
+    hit = grid.hit
+    hit.normal_x = hit.normal_y = 0
+    hit.x = x + dx
+    hit.y = y + dy
+    hit.t = 1.0
+    if dx:
+        face = _sweep_tile_grid_x(grid, x, y, width, height, dx)
+        if face is not None:
+            # 接触した面まで進める (既に面を越えて重なっている場合は動かさない)
+            if dx > 0:
+                hit.x = max(face - width, x)
+                hit.normal_x = -1
+            else:
+                hit.x = min(face, x)
+                hit.normal_x = 1
+            hit.t = (hit.x - x) / dx
+    elif dy:
+        face = _sweep_tile_grid_y(grid, x, y, width, height, dy)
+        if face is not None:
+            if dy > 0:
+                hit.y = max(face - height, y)
+                hit.normal_y = -1
+            else:
+                hit.y = min(face, y)
+                hit.normal_y = 1
+            hit.t = (hit.y - y) / dy
+    return hit.t
+
 
-            # Get tile boundaries in pixel coordinates
-            tile_left = xi * 8
-            tile_right = tile_left + 8
-            tile_top = yi * 8 + (8 - surface_height)
-            tile_bottom = tile_top + surface_height
-
-            # プレイヤーの実際の判定範囲（surface heightを考慮）
-            player_bottom = pos.y + body.height
-            player_adjusted_bottom = player_bottom - surface_height  # surface_height pixels を無視
-
-            # 左右の衝突判定は、surface heightによるオーバーラップを除外
-            if not (player_bottom > tile_top and player_adjusted_bottom < tile_top):
-                if tile_left <= pos.x + body.width <= tile_right:
-                    collisions["right"] = True
-                if tile_left <= pos.x <= tile_right:
-                    collisions["left"] = True
-            if tile_top <= pos.y + body.height <= tile_bottom:
-                collisions["bottom"] = True
-            if tile_top <= pos.y <= tile_bottom:
-                collisions["top"] = True
+def move_and_collide(
+    pos: Position2D, body: RectRigidBody, velocity: Velocity2D, grid: TileCollisionGrid
+) -> int:
+    """ボディを速度に沿って Y 軸、X 軸の順に掃引し、タイルに接触した位置で止める関数
+
+    移動後の位置は pos.next_x / pos.next_y に直接書き込み、接触した軸の速度は 0 にする。
+
+    Args:
+        pos (Position2D): オブジェクトの位置
+        body (RectRigidBody): オブジェクトのボディ
+        velocity (Velocity2D): オブジェクトの速度
+        grid (TileCollisionGrid): 衝突判定用のグリッド
+
+    Returns:
+        int: 接触した面を表す COLLISION_* のビットマスク
+    """
+    collisions = COLLISION_NONE
+    hit = grid.hit
+    pos.next_y = pos.y
+    if velocity.y:
+        sweep_tile_grid(grid, pos.x, pos.y, body.width, body.height, 0, velocity.y)
+        pos.next_y = hit.y
+        if hit.normal_y:
+            # 上向きの面には下に動いて接触し、下向きの面には上に動いて接触する
+            collisions |= COLLISION_BOTTOM if hit.normal_y < 0 else COLLISION_TOP
+            velocity.y = 0
+    pos.next_x = pos.x
+    if velocity.x:
+        sweep_tile_grid(grid, pos.x, pos.next_y, body.width, body.height, velocity.x, 0)
+        pos.next_x = hit.x
+        if hit.normal_x:
+            collisions |= COLLISION_RIGHT if hit.normal_x < 0 else COLLISION_LEFT
+            velocity.x = 0
     return collisions
 
 
-def get_coin_positions_from_tilemap(tilemap_id: int = 7) -> list[tuple[int, int]]:
+def get_coin_positions_from_tilemap(tilemap_id: int = 7, tilemaps=None) -> list[tuple[int, int]]:
     """コインのタイルマップをコインの位置リストに変換する関数
 
     Args:
         tilemap_id (int): コインのタイルマップID (default: 7)
+        tilemaps (optional): タイルマップのリスト. Defaults to pyxel.tilemaps.
 
     Returns:
         list[tuple[int, int]]: ピクセル座標のコイン位置リスト [(x, y), ...]
@@ -64,10 +404,10 @@ def get_coin_positions_from_tilemap(tilemap_id: int = 7) -> list[tuple[int, int]
     coins_pixels_height = 2
 
     # Get tilemap dimensions
-    tilemap = pyxel.tilemaps[tilemap_id]
-    # width, height = tilemap.width, tilemap.height
-    height = 20
-    width = 120
+    if tilemaps is None:
+        tilemaps = pyxel.tilemaps
+    tilemap = tilemaps[tilemap_id]
+    width, height = tilemap.width, tilemap.height
 
     # Scan each tile
     for y in range(0, height, coins_pixels_height):
@@ -116,7 +456,7 @@ def check_intersection_rect_circle(
     center_y = pos1.y + body1.height // 2
     center_x2 = pos2.x + body2.radius
     center_y2 = pos2.y + body2.radius
-    margin = 1.2
+    margin = CIRCLE_INTERSECTION_MARGIN
     return (center_x - center_x2) ** 2 + (center_y - center_y2) ** 2 <= (body2.radius * margin) ** 2
 
 
@@ -130,20 +470,23 @@ def check_collision_rect_rect(
         body1 (RectRigidBody): オブジェクト1のボディ
         pos2 (Position2D): オブジェクト2の位置
         body2 (RectRigidBody): オブジェクト2のボディ
+
+    Returns:
+        int: COLLISION_* のビットマスク
     """
-    collisions = {"left": False, "right": False, "top": False, "bottom": False}
+    collisions = COLLISION_NONE
 
     if not check_intersection_rect(pos1, body1, pos2, body2):
         return collisions
 
     if pos2.x <= pos1.x + body1.width <= pos2.x + body2.width:
-        collisions["right"] = True
+        collisions |= COLLISION_RIGHT
     if pos2.x <= pos1.x <= pos2.x + body2.width:
-        collisions["left"] = True
+        collisions |= COLLISION_LEFT
     if pos2.y <= pos1.y + body1.height <= pos2.y + body2.height:
-        collisions["bottom"] = True
+        collisions |= COLLISION_BOTTOM
     if pos2.y <= pos1.y <= pos2.y + body2.height:
-        collisions["top"] = True
+        collisions |= COLLISION_TOP
     return collisions
 
 
@@ -163,3 +506,161 @@ def check_intersection_angle(
     center_x2 = pos2.x + body2.width // 2
     center_y2 = pos2.y + body2.height // 2
     return math.atan2(center_y2 - center_y1, center_x2 - center_x1)
+
+
+def get_circle_bounds(pos: Position2D, body: CircleRigidBody) -> tuple:
+    """円の交差判定が及ぶ範囲を (x, y, 幅, 高さ) で返す関数
+
+    Args:
+        pos (Position2D): 円の位置
+        body (CircleRigidBody): 円のボディ
+    """
+    reach = body.radius * CIRCLE_INTERSECTION_MARGIN
+    center_x = pos.x + body.radius
+    center_y = pos.y + body.radius
+    return center_x - reach, center_y - reach, reach * 2, reach * 2
+
+
+def _get_spatial_hash_cell_range(grid: SpatialHashGrid, x, y, width, height) -> tuple:
+    size = grid.cell_size
+    return (int(x // size), int(y // size), int((x + width) // size), int((y + height) // size))
+
+
+def update_spatial_hash(grid: SpatialHashGrid, entity: int, x, y, width, height):
+    """エンティティを空間ハッシュに登録する関数 (重なるセルが変わった場合だけ登録し直す)
+
+    Args:
+        grid (SpatialHashGrid): 空間ハッシュ
+        entity (int): エンティティID
+        x, y, width, height: エンティティの範囲 (ピクセル座標)
+    """
+    cell_range = _get_spatial_hash_cell_range(grid, x, y, width, height)
+    old_range = grid.entity_cells.get(entity)
+    if old_range == cell_range:
+        return
+    if old_range is not None:
+        remove_from_spatial_hash(grid, entity)
+
+    cx1, cy1, cx2, cy2 = cell_range
+    for cy in range(cy1, cy2 + 1):
+        for cx in range(cx1, cx2 + 1):
+            cell = grid.cells.get((cx, cy))
+            if cell is None:
+                cell = grid.cells[(cx, cy)] = set()
+            cell.add(entity)
+    grid.entity_cells[entity] = cell_range
+
+
+def remove_from_spatial_hash(grid: SpatialHashGrid, entity: int):
+    """エンティティを空間ハッシュから取り除く関数
+
+    Args:
+        grid (SpatialHashGrid): 空間ハッシュ
+        entity (int): エンティティID
+    """
+    cell_range = grid.entity_cells.pop(entity, None)
+    if cell_range is None:
+        return
+    cx1, cy1, cx2, cy2 = cell_range
+    for cy in range(cy1, cy2 + 1):
+        for cx in range(cx1, cx2 + 1):
+            cell = grid.cells[(cx, cy)]
+            cell.discard(entity)
+            if not cell:
+                del grid.cells[(cx, cy)]
+
+
+def query_spatial_hash(grid: SpatialHashGrid, x, y, width, height) -> list[int]:
+    """範囲に重なる可能性のあるエンティティをID順に返す関数
+
+    Args:
+        grid (SpatialHashGrid): 空間ハッシュ
+        x, y, width, height: 検索する範囲 (ピクセル座標)
+
+    Returns:
+        list[int]: 候補のエンティティIDのリスト
+    """
+    cx1, cy1, cx2, cy2 = _get_spatial_hash_cell_range(grid, x, y, width, height)
+    candidates = set()
+    for cy in range(cy1, cy2 + 1):
+        for cx in range(cx1, cx2 + 1):
+            cell = grid.cells.get((cx, cy))
+            if cell:
+                candidates |= cell
+    return sorted(candidates)
+
+
+def get_chunk_index(x, chunk_width: int) -> int:
+    """X座標が含まれるチャンクの番号を返す関数
+
+    Args:
+        x (int): X座標 (ピクセル)
+        chunk_width (int): チャンクの幅 (ピクセル)
+    """
+    return int(x // chunk_width)
+
+
+def interpolate_position(world, pos: Position2D) -> tuple:
+    """直前のシミュレーションステップの位置と現在の位置を world.alpha で補間した描画用の位置を返す関数
+
+    Args:
+        world (World): ゲームのワールド
+        pos (Position2D): オブジェクトの位置
+
+    Returns:
+        tuple: (x, y)
+    """
+    alpha = world.alpha
+    if alpha >= 1:
+        return pos.x, pos.y
+    return pos.prev_x + (pos.x - pos.prev_x) * alpha, pos.prev_y + (pos.y - pos.prev_y) * alpha
+
+
+def get_camera_offset(world) -> tuple:
+    """プレイヤーを画面の中央に置くカメラの位置 (画面左上のワールド座標) を返す関数
+
+    Args:
+        world (World): ゲームのワールド
+    """
+    player_entity, (_, player_pos) = world.get_singleton(Player, Position2D)
+    player_x, player_y = interpolate_position(world, player_pos)
+    return player_x - world.screen_size[0] // 2, 0
+
+
+def get_min_activity_radius(world, sprite_size: int = 16) -> int:
+    """画面に映るエンティティが必ず ActivityRegion の範囲に入る、範囲の半径の最小値を返す関数
+
+    カメラはプレイヤーを横方向の中央に置き、縦方向は画面の上端を Y=0 に固定するため、画面に映るエンティティは
+    プレイヤーから横に画面の幅の半分、縦に画面の高さまで離れうる (それぞれスプライトの大きさの分だけはみ出す)。
+
+    Args:
+        world (World): ゲームのワールド
+        sprite_size (int, optional): エンティティのスプライトの最大の大きさ (ピクセル). Defaults to 16.
+    """
+    width, height = world.screen_size
+    return max(width // 2, height) + sprite_size
+
+
+def add_to_collectible_index(world, entity: int):
+    """収集アイテムを索引に登録する関数 (索引がなければ何もしない)
+
+    Args:
+        world (World): ゲームのワールド
+        entity (int): 収集アイテムのエンティティID
+    """
+    components = world.get_entity_object(entity)
+    bounds = get_circle_bounds(components[Position2D], components[CircleRigidBody])
+    for index_entity, index in world.get_component(CollectibleIndex):
+        update_spatial_hash(index, entity, *bounds)
+
+
+def query_visible_entities(world, grid_type=SpatialHashGrid) -> list[int]:
+    """画面に映る可能性のあるエンティティを空間ハッシュから ID 順に返す関数
+
+    Args:
+        world (World): ゲームのワールド
+        grid_type (optional): 検索する空間ハッシュの型. Defaults to SpatialHashGrid.
+    """
+    camera_x, camera_y = get_camera_offset(world)
+    grid_entity, grid = world.get_singleton(grid_type)
+    return query_spatial_hash(grid, camera_x, camera_y, *world.screen_size)
@@ -0,0 +1,203 @@
+from pigframe import World
+
+_MISSING = object()
+
+
+class CachedWorld(World):
+    """コンポーネントの検索結果を型ごとに無効化するワールド
+    pigframe の World はコンポーネントが追加・削除されるたびに全ての検索結果を捨てるが、
+    ここでは変更されたコンポーネントの型を含む検索結果だけを捨てる。
+    """
+
+    def __init__(self):
+        super().__init__()
+        # コンポーネントの型 -> その型を含む get_components / get_singleton のキー
+        self._component_queries = {}
+        self._singleton_cache = {}
+        # get_derived のキー -> 値と、コンポーネントの型 -> その型から作った値のキー
+        self._derived_cache = {}
+        self._derived_queries = {}
+        # 無効化したエンティティ -> コンポーネントの辞書
+        self.inactive_entities = {}
+        # 無効化したエンティティのうち、スリープ中のもの (倒された敵などと区別するため)
+        self.sleeping_entities = set()
+
+    def _register_query(self, component_types: tuple):
+        for component_type in component_types:
+            queries = self._component_queries.get(component_type)
+            if queries is None:
+                queries = self._component_queries[component_type] = set()
+            queries.add(component_types)
+
+    def invalidate_component_cache(self, component_type):
+        """component_type を含む検索結果だけを捨てる"""
+        self._get_component_cache.pop(component_type, None)
+        for component_types in self._component_queries.pop(component_type, ()):
+            self._get_components_cache.pop(component_types, None)
+            self._singleton_cache.pop(component_types, None)
+        for key in self._derived_queries.pop(component_type, ()):
+            self._derived_cache.pop(key, None)
+
+    def clear_component_cache(self):
+        super().clear_component_cache()
+        self._component_queries.clear()
+        self._singleton_cache.clear()
+        self._derived_cache.clear()
+        self._derived_queries.clear()
+
+    def get_derived(self, key, component_types: tuple, build):
+        """コンポーネントから作った値を、元になる型のコンポーネントが追加・削除されるまでキャッシュして返す
+
+        Args:
+            key: 値のキー
+            component_types (tuple): 値の元になるコンポーネントの型
+            build: ワールドを受け取って値を作る関数
+
+        Returns:
+            build(self) の結果
+        """
+        result = self._derived_cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = self._derived_cache[key] = build(self)
+            for component_type in component_types:
+                queries = self._derived_queries.get(component_type)
+                if queries is None:
+                    queries = self._derived_queries[component_type] = set()
+                queries.add(key)
+        return result
+
+    def add_component_to_entity(self, entity: int, component_type, **kwargs) -> None:
+        component = component_type(**kwargs)
+        if component_type not in self.components:
+            self.components[component_type] = set()
+
+        if entity not in self.entities:
+            self.entities[entity] = {}
+
+        self.components[component_type].add(entity)
+        self.entities[entity].setdefault(component_type, component)
+        self.invalidate_component_cache(component_type)
+
+    def deactivate_entity(self, entity: int) -> bool:
+        """エンティティのコンポーネントを保持したまま、全てのコンポーネントの検索から外す
+
+        Returns:
+            bool: 無効化した場合は True (存在しないか、既に無効な場合は False)
+        """
+        components = self.entities.pop(entity, None)
+        if components is None:
+            return False
+        for component_type in components:
+            self.components[component_type].remove(entity)
+            self.invalidate_component_cache(component_type)
+        self.inactive_entities[entity] = components
+        return True
+
+    def activate_entity(self, entity: int) -> bool:
+        """deactivate_entity で外したエンティティを、同じコンポーネントのまま検索に戻す
+
+        Returns:
+            bool: 有効化した場合は True (無効化されていない場合は False)
+        """
+        components = self.inactive_entities.pop(entity, None)
+        if components is None:
+            return False
+        self.sleeping_entities.discard(entity)
+        self.entities[entity] = components
+        for component_type in components:
+            if component_type not in self.components:
+                self.components[component_type] = set()
+            self.components[component_type].add(entity)
+            self.invalidate_component_cache(component_type)
+        return True
+
+    def is_active(self, entity: int) -> bool:
+        return entity in self.entities
+
+    def sleep_entity(self, entity: int) -> bool:
+        """エンティティを無効化し、スリープ中として記録する (wake_entity か activate_entity で起きる)
+
+        Returns:
+            bool: スリープさせた場合は True
+        """
+        if not self.deactivate_entity(entity):
+            return False
+        self.sleeping_entities.add(entity)
+        return True
+
+    def wake_entity(self, entity: int) -> bool:
+        """スリープ中のエンティティを起こす (倒された敵など、スリープ以外で無効化されたものは起こさない)
+
+        Returns:
+            bool: 起こした場合は True
+        """
+        if entity not in self.sleeping_entities:
+            return False
+        return self.activate_entity(entity)
+
+    def is_sleeping(self, entity: int) -> bool:
+        return entity in self.sleeping_entities
+
+    def remove_entity(self, entity: int) -> bool | None:
+        self.sleeping_entities.discard(entity)
+        if self.inactive_entities.pop(entity, None) is not None:
+            return True
+        if entity not in self.entities:
+            return None
+
+        for component_type in self.entities[entity]:
+            self.components[component_type].remove(entity)
+            self.invalidate_component_cache(component_type)
+
+        del self.entities[entity]
+        return True
+
+    def remove_component_from_entity(self, entity: int, component_type):
+        if component_type not in self.entities[entity]:
+            return
+        self.components[component_type].remove(entity)
+        del self.entities[entity][component_type]
+        self.invalidate_component_cache(component_type)
+
+    def remove_components_from_entity(self, entity: int, *component_types):
+        for component_type in component_types:
+            self.remove_component_from_entity(entity, component_type)
+
+    def get_component(self, component_type):
+        result = self._get_component_cache.get(component_type)
+        if result is None:
+            if component_type not in self.components:
+                return []
+            result = self._get_component_cache[component_type] = list(
+                self._get_component(component_type)
+            )
+        return result
+
+    def get_components(self, *component_types):
+        result = self._get_components_cache.get(component_types)
+        if result is None:
+            if any(component_type not in self.components for component_type in component_types):
+                return []
+            result = self._get_components_cache[component_types] = list(
+                self._get_components(*component_types)
+            )
+            self._register_query(component_types)
+        return result
+
+    def get_singleton(self, *component_types):
+        """1つしか存在しないエンティティ (Player, StageState など) を取得する
+        1つの型を渡すと get_component(...)[0]、複数の型を渡すと get_components(...)[0] と同じ形で返す。
+        結果は関係するコンポーネントが変わるまでキャッシュされる。
+
+        Returns:
+            tuple: (エンティティID, コンポーネント) または (エンティティID, コンポーネントのリスト)
+        """
+        result = self._singleton_cache.get(component_types)
+        if result is None:
+            if len(component_types) == 1:
+                result = self.get_component(component_types[0])[0]
+            else:
+                result = self.get_components(*component_types)[0]
+            self._singleton_cache[component_types] = result
+            self._register_query(component_types)
+        return result
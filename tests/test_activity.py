@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+
+from component import ActivityRegion
+from main import Game, setup_game
+from spawn import spawn_enemy
+from utils import get_min_activity_radius, query_visible_entities
+
+
+@dataclass(frozen=True)
+class Poked:
+    """テスト用の、エンティティを対象にするイベント"""
+
+    entity: int
+
+
+def make_game(activity_radius=None) -> Game:
+    game = Game(headless=True)
+    setup_game(game, activity_radius=activity_radius)
+    return game
+
+
+def test_sleeping_is_off_by_default():
+    game = make_game()
+    assert game.get_component(ActivityRegion) == []
+
+
+def test_enemies_on_screen_stay_awake_with_a_small_radius():
+    game = make_game(activity_radius=32)
+    region_entity, region = game.get_singleton(ActivityRegion)
+    assert region.radius == get_min_activity_radius(game)
+    # プレイヤー (X=80) を中央に置いた画面の右端の近く
+    enemy = spawn_enemy(game, 0, 8 * 26, 8 * 10)
+    game.run_headless(10)
+    assert game.is_active(enemy)
+    assert enemy in query_visible_entities(game)
+
+
+def test_events_wake_the_entity_they_target():
+    game = make_game(activity_radius=8 * 32)
+    region_entity, region = game.get_singleton(ActivityRegion)
+    enemy = spawn_enemy(game, 0, 8 * 110, 8 * 10)
+    game.run_headless(1)
+    assert game.is_sleeping(enemy)
+
+    game.events.publish(Poked(enemy))
+    game.run_headless(1)
+    assert game.is_active(enemy)
+    # wake_frames の間は範囲外でもスリープさせない
+    game.run_headless(region.wake_frames - 1)
+    assert game.is_active(enemy)
+    game.run_headless(2)
+    assert game.is_sleeping(enemy)
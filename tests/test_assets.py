@@ -0,0 +1,45 @@
+import concurrent.futures
+import sys
+
+from assets import AssetLoader
+
+
+def make_loader():
+    calls = []
+    loader = AssetLoader()
+    loader.register("level", lambda: calls.append("level") or "level data", threadsafe=True)
+    return loader, calls
+
+
+def test_prefetch_falls_back_when_threads_cannot_start(monkeypatch):
+    def submit(self, fn, *args, **kwargs):
+        raise RuntimeError("can't start new thread")
+
+    monkeypatch.setattr(concurrent.futures.ThreadPoolExecutor, "submit", submit)
+    loader, calls = make_loader()
+    loader.prefetch("level")
+    assert not loader.threads_available
+    assert loader.futures == {}
+    assert loader.executor is None
+    assert calls == []
+
+    assert loader.get("level") == "level data"
+    assert calls == ["level"]
+
+
+def test_prefetch_is_skipped_on_emscripten(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "emscripten")
+    loader, calls = make_loader()
+    loader.prefetch("level")
+    assert loader.executor is None
+    assert loader.get("level") == "level data"
+    assert calls == ["level"]
+
+
+def test_prefetch_loads_in_a_thread():
+    loader, calls = make_loader()
+    loader.prefetch("level")
+    assert "level" in loader.futures
+    assert loader.get("level") == "level data"
+    assert calls == ["level"]
+    loader.shutdown()
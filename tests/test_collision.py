@@ -0,0 +1,122 @@
+from array import array
+
+import pyxel
+from component import Enemy, Player, Position2D, RectRigidBody, TileCollisionGrid, Velocity2D
+from events import GoalReached
+from input import ScriptedInputSource
+from level import TileLayer
+from main import Game, setup_game
+from stage import reload_level_tiles
+from utils import (
+    COLLISION_BOTTOM,
+    COLLISION_RIGHT,
+    build_tile_collision_grid,
+    mark_tiles_changed,
+    move_and_collide,
+    sweep_tile_grid,
+)
+
+
+def make_grid(width: int, height: int, tiles: dict, surface_height: int) -> TileCollisionGrid:
+    """tiles の (タイルX, タイルY) だけに衝突タイルがある1レイヤーのグリッドを作る"""
+    data = array("H", [0] * (width * height * 2))
+    for xi, yi in tiles:
+        data[(yi * width + xi) * 2] = 1
+    grid = TileCollisionGrid()
+    build_tile_collision_grid(grid, ((0, surface_height),), [TileLayer(width, height, data)])
+    return grid
+
+
+def test_sweep_returns_contact_time_and_normal():
+    grid = make_grid(8, 8, {(2, 5)}, 8)
+    hit = grid.hit
+    # 下端 36 から 8 下に動くと、移動量の半分で Y=40 のタイルの上面に接触する
+    assert sweep_tile_grid(grid, 16, 28, 8, 8, 0, 8) == 0.5
+    assert (hit.normal_x, hit.normal_y, hit.y) == (0, -1, 32)
+    # 右に動くとタイルの左面に接触する
+    assert sweep_tile_grid(grid, 0, 40, 8, 8, 12, 0) == 8 / 12
+    assert (hit.normal_x, hit.normal_y, hit.x) == (-1, 0, 8)
+    # 接触しない場合は 1 を返し、移動後の位置を書き込む
+    assert sweep_tile_grid(grid, 0, 0, 8, 8, 0, 8) == 1.0
+    assert (hit.normal_x, hit.normal_y, hit.y) == (0, 0, 8)
+
+
+def test_surface_height_zero_tiles_block_horizontally():
+    grid = make_grid(8, 4, {(4, 1)}, 0)
+    position = Position2D(14, 4)
+    velocity = Velocity2D(4, 0)
+    collisions = move_and_collide(position, RectRigidBody(16, 8), velocity, grid)
+    assert collisions & COLLISION_RIGHT
+    assert position.next_x == 4 * 8 - 16
+    assert velocity.x == 0
+
+
+def test_surface_height_zero_tiles_do_not_block_vertically():
+    grid = make_grid(8, 4, {(1, 2)}, 0)
+    position = Position2D(8, 0)
+    velocity = Velocity2D(0, 12)
+    collisions = move_and_collide(position, RectRigidBody(8, 8), velocity, grid)
+    assert not collisions & COLLISION_BOTTOM
+    assert position.next_y == 12
+
+
+def test_enemy_patrols_between_walls():
+    game = Game(headless=True)
+    setup_game(game, activity_radius=None)
+    # 2体目の敵 (8 * 62, 8 * 10) は左右の壁の間を往復する
+    enemy = next(
+        entity
+        for entity, (_, position) in game.get_components(Enemy, Position2D)
+        if position.x == 8 * 62
+    )
+    components = game.get_entity_object(enemy)
+    xs = []
+    directions = []
+    for _ in range(600):
+        game.process()
+        xs.append(components[Position2D].x)
+        velocity_x = components[Velocity2D].x
+        if velocity_x and (not directions or directions[-1] != (velocity_x > 0)):
+            directions.append(velocity_x > 0)
+    assert max(xs) - min(xs) > 8 * 8
+    # 右に歩き始め、壁に当たるたびに向きを変える
+    assert directions[:3] == [True, False, True]
+
+
+def test_goal_marker_blocks_and_counts_as_reached():
+    game = Game(headless=True, input_source=ScriptedInputSource(lambda f: {pyxel.KEY_RIGHT: 1}))
+    setup_game(game, activity_radius=None)
+    reached = []
+    game.events.subscribe(GoalReached, reached.append)
+    player_entity, (_, position) = game.get_singleton(Player, Position2D)
+    position.x = position.prev_x = 8 * 110
+    position.y = position.prev_y = 8 * 4
+    max_x = position.x
+    for _ in range(60):
+        game.process()
+        max_x = max(max_x, position.x)
+    assert len(reached) == 1
+    # ゴールマーカー (タイルX 114) の左の面で止まる
+    assert max_x <= 114 * 8 - 16
+
+
+def test_grid_is_rebuilt_when_tiles_change():
+    game = Game(headless=True)
+    setup_game(game)
+    grid_entity, grid = game.get_singleton(TileCollisionGrid)
+    # 空のセルにレイヤー 3 (表面の高さ 8) のタイルを置いたレベルを読み込み直す
+    layers = [
+        TileLayer(layer.width, layer.height, array("H", layer.data)) for layer in game.tilemaps
+    ]
+    cell = 2 * grid.width + 2
+    assert grid.cells[cell] == 0
+    layers[3].data[(2 * layers[3].width + 2) * 2] = 1
+    reload_level_tiles(game, layers)
+    game.run_headless(1)
+    assert grid.cells[cell] == 1 << 8
+
+    # タイルを直接書き換えた場合は mark_tiles_changed で知らせる
+    game.tilemaps[3].data[(2 * layers[3].width + 2) * 2] = 0
+    mark_tiles_changed(game)
+    game.run_headless(1)
+    assert grid.cells[cell] == 0
@@ -0,0 +1,36 @@
+import pyxel
+import main
+from input import PyxelInputSource
+from main import Game, setup_game
+
+
+def test_each_press_is_seen_once_by_the_fixed_steps(monkeypatch):
+    pressed = set()
+    now = [0.0]
+    monkeypatch.setattr(pyxel, "btnp", lambda key: key in pressed)
+    monkeypatch.setattr(pyxel, "btn", lambda key: False)
+    monkeypatch.setattr(pyxel, "btnv", lambda key: 0)
+    monkeypatch.setattr(main.time, "perf_counter", lambda: now[0])
+    game = Game(headless=True, input_source=PyxelInputSource())
+    setup_game(game)
+    # ステップごとに jump のアクションを記録する
+    jumps = []
+    game.process_systems = lambda: jumps.append(game.actions.jump)
+
+    def frame(elapsed_steps: float, press: bool = False):
+        pressed.clear()
+        if press:
+            pressed.add(pyxel.KEY_SPACE)
+        now[0] += game.dt * elapsed_steps
+        steps = len(jumps)
+        game.update()
+        return len(jumps) - steps
+
+    assert frame(1) == 1
+    # 押したフレームでステップが進まなくても、次のステップで1度だけ読まれる
+    assert frame(0.5, press=True) == 0
+    assert frame(1.5) == 2
+    # 押したフレームで2ステップ進んでも、読まれるのは最初のステップだけ
+    assert frame(2, press=True) == 2
+    assert frame(1) == 1
+    assert jumps == [False, True, False, True, False, False]
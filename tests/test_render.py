@@ -0,0 +1,32 @@
+from render import MAX_COVERS, RenderCommandBuffer
+
+
+def drawn_positions(buffer: RenderCommandBuffer) -> list:
+    return [command[7][:3] for command in buffer.resolve()]
+
+
+def test_overlapping_draws_keep_submission_order_across_banks():
+    buffer = RenderCommandBuffer(64, 64)
+    buffer.blt(0, 0, 0, 1, 0, 0, 16, 16, 0)
+    buffer.blt(0, 8, 8, 0, 0, 0, 16, 16, 0)
+    assert drawn_positions(buffer) == [(0, 0, 1), (8, 8, 0)]
+
+
+def test_draws_that_do_not_overlap_are_batched_by_bank():
+    buffer = RenderCommandBuffer(128, 64)
+    buffer.blt(0, 0, 0, 1, 0, 0, 16, 16, 0)
+    buffer.blt(0, 32, 0, 0, 0, 0, 16, 16, 0)
+    buffer.blt(0, 64, 0, 1, 0, 0, 16, 16, 0)
+    assert drawn_positions(buffer) == [(32, 0, 0), (0, 0, 1), (64, 0, 1)]
+
+
+def test_draws_hidden_by_a_later_opaque_draw_are_dropped():
+    buffer = RenderCommandBuffer(64, 64)
+    buffer.blt(0, 4, 4, 0, 0, 0, 8, 8, 0)
+    # 覆う側の候補が上限を超えても、面積の大きい命令は残る
+    buffer.rect(1, 0, 0, 64, 64, 1)
+    for i in range(MAX_COVERS + 4):
+        buffer.rect(2, i * 4, 56, 2, 2, 2)
+    commands = buffer.resolve()
+    assert buffer.stats["hidden"] == 1
+    assert [command[0] for command in commands].count(0) == 0
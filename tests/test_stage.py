@@ -0,0 +1,83 @@
+from component import Enemy, EnemyState, LevelChunks, Player, Position2D, StageState
+from events import GameOver, LifeLost
+from main import Game, setup_game
+from stage import update_level_chunks
+
+
+def make_game() -> tuple[Game, StageState, list]:
+    """ステージの状態と、発行された GameOver イベントを記録するリストを返す"""
+    game = Game(headless=True)
+    setup_game(game)
+    stage_state_entity, stage_state = game.get_singleton(StageState)
+    game_overs = []
+    game.events.subscribe(GameOver, game_overs.append)
+    return game, stage_state, game_overs
+
+
+def test_fall_with_last_life_resets_stage_and_ends_game():
+    game, stage_state, game_overs = make_game()
+    enemy_entity, (_, enemy_state) = game.get_components(Enemy, EnemyState)[0]
+    enemy_state.is_dead = True
+    stage_state.lives = 1
+    stage_state.is_goal = True
+    stage_state.game_over = False
+
+    game.events.publish(LifeLost("fall"))
+    game.events.dispatch()
+
+    assert stage_state.lives == 0
+    assert stage_state.is_goal is False
+    assert stage_state.game_over is True
+    assert game_overs == [GameOver("lives")]
+    # StageReset が配信されて敵が初期状態に戻っている
+    assert enemy_state.is_dead is False
+
+
+def test_fall_without_lives_clears_goal_and_keeps_game_over():
+    game, stage_state, game_overs = make_game()
+    stage_state.lives = 0
+    stage_state.is_goal = True
+    stage_state.game_over = True
+    player_entity, (_, position) = game.get_singleton(Player, Position2D)
+    position.y = 8 * 16
+
+    game.run_headless(1)
+
+    assert stage_state.lives == 0
+    assert stage_state.is_goal is False
+    assert stage_state.game_over is True
+    assert game_overs == []
+
+
+def test_losing_the_last_life_twice_in_a_frame_ends_the_game_once():
+    game, stage_state, game_overs = make_game()
+    stage_state.lives = 1
+
+    game.events.publish(LifeLost("enemy"))
+    game.events.publish(LifeLost("fall"))
+    game.events.dispatch()
+
+    assert stage_state.lives == 0
+    assert stage_state.game_over is True
+    assert game_overs == [GameOver("lives")]
+
+
+def test_enemy_that_walked_into_a_loaded_chunk_is_not_unloaded():
+    game = Game(headless=True)
+    setup_game(game, stream_chunks=True)
+    game.run_headless(1)
+    chunks_entity, chunks = game.get_singleton(LevelChunks)
+    [(spawn, enemy)] = chunks.active[1]
+    # チャンク 1 でスポーンした敵がチャンク 3 まで歩いた
+    game.get_entity_object(enemy)[Position2D].x = 8 * 50
+
+    # チャンク 1 は範囲外になるが、チャンク 3 は範囲内に残る
+    update_level_chunks(game, chunks, 8 * 70)
+    assert 1 not in chunks.active
+    assert game.is_active(enemy)
+    assert (spawn, enemy) in chunks.active[3]
+
+    # 敵のいるチャンクが範囲外になると取り除かれ、スポーン位置は消費されない
+    update_level_chunks(game, chunks, 8 * 120)
+    assert game.get_entity_object(enemy) is None
+    assert spawn not in chunks.consumed
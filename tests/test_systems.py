@@ -0,0 +1,24 @@
+from component import CollectibleIndex, Player, Position2D, SpatialHashGrid
+from main import Game, setup_game
+from system import SysCollectCoin, SysPlayerEnemyCollision
+from utils import update_spatial_hash
+
+
+def process_with_stale_entry(grid_type, system_type):
+    """プレイヤーの位置に、ワールドに存在しないエンティティを索引に登録してからシステムを実行する"""
+    game = Game(headless=True)
+    setup_game(game)
+    player_entity, (_, position) = game.get_singleton(Player, Position2D)
+    grid_entity, grid = game.get_singleton(grid_type)
+    update_spatial_hash(grid, 10**6, position.x, position.y, 16, 16)
+    for system in game.scene_systems["playable"]:
+        if type(system) is system_type:
+            system.process()
+
+
+def test_enemy_collision_skips_stale_spatial_hash_entries():
+    process_with_stale_entry(SpatialHashGrid, SysPlayerEnemyCollision)
+
+
+def test_coin_collection_skips_stale_index_entries():
+    process_with_stale_entry(CollectibleIndex, SysCollectCoin)
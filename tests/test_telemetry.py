@@ -0,0 +1,33 @@
+import threading
+
+import telemetry
+from telemetry import Telemetry
+
+
+class StalledSink:
+    """release されるまで書き込みを止める出力先"""
+
+    def __init__(self) -> None:
+        self.released = threading.Event()
+        self.lines = []
+
+    def write(self, line: str):
+        self.released.wait()
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+
+def test_records_are_dropped_when_the_sink_stalls(monkeypatch):
+    sink = StalledSink()
+    monkeypatch.setattr(telemetry.sys, "stderr", sink)
+    t = Telemetry()
+    t.start(rate_limit=100, max_queue=4)
+    for i in range(20):
+        t.info("tick", i=i)
+    # キューに入るのは書き込み中の1件と max_queue 件まで
+    assert t.dropped >= 20 - 1 - 4
+    sink.released.set()
+    t.stop()
+    assert len(sink.lines) == 20 - t.dropped
@@ -0,0 +1,18 @@
+from component import TileCollidable, TileMap
+from main import Game, setup_game
+from utils import get_tile_collision_layers
+
+
+def test_tile_collision_layers_are_cached_until_a_layer_is_added_or_removed():
+    game = Game(headless=True)
+    setup_game(game)
+    layers = get_tile_collision_layers(game)
+    assert get_tile_collision_layers(game) is layers
+
+    entity = game.create_entity()
+    game.add_component_to_entity(entity, TileMap, id=6)
+    game.add_component_to_entity(entity, TileCollidable, surface_height=4)
+    assert get_tile_collision_layers(game) == tuple(sorted(layers + ((6, 4),)))
+
+    game.remove_entity(entity)
+    assert get_tile_collision_layers(game) == layers